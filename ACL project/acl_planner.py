@@ -0,0 +1,114 @@
+"""
+Plans the configuration needed to make a device compliant with the SNMP ACL
+policy. Only the missing entries are sent, with sequence numbers that place
+them before the first deny of the ACL. When there is no room left between the
+existing sequence numbers, the ACL is resequenced first in the same session.
+When the device does not report the sequence numbers, the whole block of the
+configuration file is replayed for that ACL as it was done before.
+The "write mem" lines of the files are left out of the plan, the caller saves
+the configuration once after sending it.
+"""
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1] / "Common"))
+from acl_policy import AclPolicy
+
+class AclPlanner:
+    def __init__(self, *file_names):
+        """
+        Receives:
+            file_names : str
+                Location of the configuration files (ro.txt and rw.txt).
+        """
+        self.policy = AclPolicy.from_config_files(*file_names)
+        self.config_blocks = {}
+        for file_name in file_names:
+            with open(file_name, encoding="UTF-8") as config_file:
+                lines = [line.strip() for line in config_file if line.strip()]
+            #the configuration is saved once, after the whole plan has been sent
+            lines = [line for line in lines if line.split()[0].lower() not in ("write", "wr")]
+            for acl_name in self.policy.required_sources:
+                if any(line.split()[-1] == acl_name for line in lines):
+                    self.config_blocks[acl_name] = lines
+
+    def _acl_lines(self, acl_name, aces, missing):
+        """
+        This function returns the commands that add the missing hosts to one ACL.
+
+        Receives:
+            acl_name : str
+                Name of the ACL.
+            aces : list
+                Current entries of the ACL, without the header of the ACL.
+            missing : list
+                Hosts that are not permitted by the current entries.
+        Returns:
+            lines : list
+                Configuration commands for the ACL.
+        """
+        if not aces:
+            return ([f"ip access-list standard {acl_name}"] + [f"permit {host}" for host in missing] + ["deny any"])
+        try:
+            sequences = [(int(ace["line_num"]), ace.get("action")) for ace in aces]
+        except (KeyError, TypeError, ValueError):
+            return self.config_blocks[acl_name]
+        sequences.sort()
+        lines = [f"ip access-list standard {acl_name}"]
+        deny_positions = [position for position, (_, action) in enumerate(sequences) if action == "deny"]
+        if not deny_positions:
+            start, step = sequences[-1][0], 10
+        else:
+            first_deny = deny_positions[0]
+            start = sequences[first_deny - 1][0] if first_deny else 0
+            step = min(10, (sequences[first_deny][0] - start) // (len(missing) + 1))
+            if step < 1:
+                #the entries are renumbered (increment, 2 x increment...) with room for the hosts before the deny
+                increment = 10 * (len(missing) + 1)
+                lines.insert(0, f"ip access-list resequence {acl_name} {increment} {increment}")
+                start, step = first_deny * increment, 10
+        return lines + [f"{start + step * (position + 1)} permit {host}" for position, host in enumerate(missing)]
+
+    def plan(self, current_aces):
+        """
+        This function compares the current ACEs of a device with the policy
+        and returns the configuration that has to be sent.
+
+        Receives:
+            current_aces : list
+                List that contain the current ACEs.
+        Returns:
+            plan : dict
+                Dictionary in the format {"acl name": [commands]}, only the
+                ACLs that need changes are present.
+        """
+        current_aces = [ace for ace in current_aces or [] if isinstance(ace, dict)]
+        plan = {}
+        for acl_name, missing in self.policy.missing_sources(current_aces).items():
+            if missing:
+                #TextFSM also returns a row without an entry for the header of every ACL
+                aces = [ace for ace in current_aces if ace.get("acl_name") == acl_name and ace.get("action")]
+                plan[acl_name] = self._acl_lines(acl_name, aces, missing)
+        return plan
+
+
+def format_plan(ip, plan):
+    """
+    This function formats the plan of a device to be printed
+    during a dry run.
+
+    Receives:
+        ip : str
+            IP address of the device.
+        plan : dict
+            Plan returned by AclPlanner.plan.
+    Returns:
+        plan_text : str
+            Plan in a human readable format.
+    """
+    if not plan:
+        return f"{ip}: no changes needed"
+    lines = [f"{ip}:"]
+    for acl_name, commands in plan.items():
+        lines.append(f"  {acl_name}")
+        lines.extend(f"    {command}" for command in commands)
+    return "\n".join(lines)
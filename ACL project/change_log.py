@@ -0,0 +1,168 @@
+"""
+Change log used by the SNMP ACL rollout. The rows are buffered in memory
+and flushed in batches to a CSV journal that stays open for the whole run,
+and the Excel spreadsheet is generated once, at the end, with openpyxl's
+write-only mode. This keeps the cost of logging constant per device instead
+of reloading and saving the whole workbook after every row.
+"""
+import atexit
+import csv
+from os.path import exists, splitext
+from threading import Lock
+from time import monotonic
+from openpyxl import Workbook
+
+HEADER = ['Device', 'Status']
+
+def rollout_facts(status):
+    """
+    This function returns the verdict and facts of a device for the fact
+    store (see Common/fact_store.py) from the status of its row.
+
+    Receives:
+        status : str
+            Message of the row, e.g. "Configured". A dry run that planned
+            lines means the device does not have the ACLs yet.
+    Returns:
+        facts : dict
+    """
+    value = {"status": status}
+    if status.startswith("Failed"):
+        verdict = "error"
+    elif status.startswith("Dry run"):
+        value["planned_lines"] = int(status.split()[2])
+        verdict = "fail" if value["planned_lines"] else "pass"
+    else:
+        verdict = "pass"
+    return {"snmp_acl_rollout": {"verdict": verdict, "value": value}}
+
+
+class ChangeLog:
+    def __init__(self, file_name, batch_size=50, flush_interval=5, fact_run=None):
+        """
+        Receives:
+            file_name : str
+                Location of the Excel spreadsheet. The CSV journal is kept
+                next to it with the same name.
+            batch_size : int
+                Number of rows buffered before they are written to disk.
+            flush_interval : int
+                Maximum number of seconds a row stays in the buffer.
+            fact_run : FactRun
+                If given, the status of every device is also recorded in
+                the fact store.
+        """
+        self.file_name = file_name
+        self.fact_run = fact_run
+        self.csv_name = f"{splitext(file_name)[0]}.csv"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.lock = Lock()
+        self.last_flush = monotonic()
+        is_new = not exists(self.csv_name)
+        self.csv_file = open(self.csv_name, "a", newline="", encoding="UTF-8")
+        self.writer = csv.writer(self.csv_file)
+        if is_new:
+            self.writer.writerow(HEADER)
+            self.csv_file.flush()
+        #buffered rows are written even if the run ends with an unhandled exception
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, entry):
+        """
+        This function adds a row to the log.
+
+        Receives:
+            entry : list
+                Information to add in the format ["ip", "message"].
+        Returns:
+            None
+        """
+        with self.lock:
+            self.buffer.append(entry)
+            if len(self.buffer) >= self.batch_size or monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+        if self.fact_run:
+            self.fact_run.record(entry[0], rollout_facts(entry[1]))
+
+    def write_rows(self, entries):
+        """
+        This function adds several rows to the log, e.g. the rows returned
+        by the worker of a shard.
+        """
+        for entry in entries:
+            self.write(entry)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.writer.writerows(self.buffer)
+            self.buffer = []
+        self.csv_file.flush()
+        self.last_flush = monotonic()
+
+    def close(self):
+        """
+        This function writes the remaining rows, closes the journal and
+        exports it to the Excel spreadsheet.
+        """
+        with self.lock:
+            if self.csv_file.closed:
+                return
+            self._flush()
+            self.csv_file.close()
+        atexit.unregister(self.close)
+        self.export()
+
+    def export(self):
+        """
+        This function streams the CSV journal into the Excel spreadsheet.
+        """
+        wb = Workbook(write_only=True)
+        page = wb.create_sheet()
+        with open(self.csv_name, newline="", encoding="UTF-8") as csv_file:
+            for row in csv.reader(csv_file):
+                page.append(row)
+        wb.save(self.file_name)
+
+
+class ShardChangeLog:
+    """
+    Change log of a worker that configures a shard of the devices. The rows
+    are kept per device and returned to the coordinator, which writes them
+    to the ChangeLog of the run.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.lock = Lock()
+
+    def write(self, entry):
+        """
+        This function adds a row to the log.
+
+        Receives:
+            entry : list
+                Information to add in the format ["ip", "message"].
+        Returns:
+            None
+        """
+        with self.lock:
+            self.rows.setdefault(entry[0], []).append(entry)
+
+    def pop(self, ip):
+        """
+        This function returns and forgets the rows of a device.
+        """
+        with self.lock:
+            return self.rows.pop(ip, [])
@@ -0,0 +1,192 @@
+"""
+Breadth-first CDP crawler used by the SNMP ACL rollout. Each device is
+handled by a worker of a bounded thread pool, and the neighbors it reports
+are queued as soon as the device finishes, so the crawl never waits for a
+whole "layer" of the topology before moving on.
+
+With an AdaptiveScheduler the devices are dispatched by the scheduler instead
+of the pool, and every device belongs to the site of the seed it was reached
+from, so the devices behind one main router share that site's limit.
+
+With a ReachabilityProbe the seeds, and the new neighbors reported by every
+device, are probed on TCP/22 before they are queued, the ones that don't
+answer are reported to on_unreachable instead of costing an SSH timeout.
+
+crawl_sharded hands the frontier to worker processes or nodes in shards (see
+sharding.py): the neighbors discovered by every completed shard are the next
+shards, and the crawler keeps the bookkeeping of the crawl in one place.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+
+class CdpCrawler:
+    def __init__(self, visit, max_workers=16, journal=None, scheduler=None, probe=None, on_unreachable=None):
+        """
+        Receives:
+            visit : callable
+                Function that receives an IP address, does the work needed
+                on that device, and returns the management IPs of its
+                CDP neighbors.
+            max_workers : int
+                Maximum number of devices handled at the same time.
+            journal : RolloutJournal
+                Journal where the progress of the crawl is recorded (optional).
+            scheduler : AdaptiveScheduler
+                Scheduler that dispatches the devices instead of a pool
+                of max_workers (optional).
+            probe : ReachabilityProbe
+                Probe of the devices before they are queued (optional).
+            on_unreachable : callable
+                Function that receives the IP address of a device that
+                did not answer the probe.
+        """
+        self.visit = visit
+        self.max_workers = max_workers
+        self.journal = journal
+        self.scheduler = scheduler
+        self.probe = probe
+        self.on_unreachable = on_unreachable
+        self.seen = set()
+        #{ip: site of the seed the device was reached from}
+        self.sites = {}
+
+    def _submit(self, pool, pending, ip, site=None):
+        """
+        Queues a device unless it has already been queued in this crawl.
+        """
+        if ip and ip not in self.seen:
+            self.seen.add(ip)
+            if self.journal:
+                self.journal.queued(ip)
+            if self.scheduler:
+                self.sites[ip] = site or self.scheduler.site_of(ip)
+                pending[self.scheduler.submit(ip, self._visit, ip, site=self.sites[ip])] = ip
+            else:
+                pending[pool.submit(self._visit, ip)] = ip
+
+    def _visit(self, ip):
+        """
+        Visits a device and probes the neighbors it reported that were not
+        seen yet, in the same worker.
+
+        Returns:
+            neighbors : list
+                Neighbors to queue.
+            unreachable : list
+                Neighbors that did not answer the probe.
+        """
+        neighbors = self.visit(ip) or []
+        if not self.probe:
+            return neighbors, []
+        _, unreachable = self.probe.probe([neighbor for neighbor in neighbors if neighbor not in self.seen])
+        return [neighbor for neighbor in neighbors if neighbor not in unreachable], unreachable
+
+    def _skip(self, ip):
+        """
+        Records a device that did not answer the probe as done, like a
+        device whose connection timed out.
+        """
+        if ip and ip not in self.seen:
+            self.seen.add(ip)
+            if self.journal:
+                self.journal.queued(ip)
+                self.journal.finished(ip, [])
+            if self.on_unreachable:
+                self.on_unreachable(ip)
+
+    def crawl(self, seeds, done=()):
+        """
+        This function crawls the topology starting from the seed devices
+        until no new neighbors are discovered.
+
+        Receives:
+            seeds : list
+                IP addresses where the crawl starts (the main routers, or
+                the frontier of a resumed run).
+            done : set
+                IP addresses that were completed by a previous run, they
+                are not visited again.
+        Returns:
+            seen : set
+                Every IP address that was visited during the crawl.
+        """
+        self.seen.update(done)
+        with nullcontext() if self.scheduler else ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {}
+            if self.probe:
+                seeds, unreachable = self.probe.probe([ip for ip in seeds if ip not in self.seen])
+                for ip in unreachable:
+                    self._skip(ip)
+            for ip in seeds:
+                self._submit(pool, pending, ip)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ip = pending.pop(future)
+                    try:
+                        neighbors, unreachable = future.result()
+                    except Exception as e:
+                        print(f"Unexpected error while working on {ip}: {e}")
+                        continue
+                    if self.journal:
+                        self.journal.finished(ip, neighbors + unreachable)
+                    for neighbor in unreachable:
+                        self._skip(neighbor)
+                    for neighbor in neighbors:
+                        self._submit(pool, pending, neighbor, self.sites.get(ip))
+        return self.seen
+
+    def crawl_sharded(self, seeds, runner, record=None, done=()):
+        """
+        This function crawls the topology starting from the seed devices
+        with the devices handed to the workers of a ShardRunner.
+
+        Receives:
+            seeds : list
+                IP addresses where the crawl starts.
+            runner : ShardRunner
+                Runner whose task returns [ip, neighbors, rows] for every
+                device of a shard.
+            record : callable
+                Function that receives the rows returned for a device (optional).
+            done : set
+                IP addresses that were completed by a previous run.
+        Returns:
+            seen : set
+                Every IP address that was visited during the crawl.
+
+        The devices of a shard that failed stay queued in the journal, a
+        resumed run configures them again.
+        """
+        self.seen.update(done)
+        self._submit_shards(runner, seeds)
+        for shard, results, error in runner.as_completed():
+            if error:
+                print(f"A shard of {len(shard)} devices failed, they were not configured: {error}")
+                continue
+            frontier = []
+            for ip, neighbors, rows in results:
+                if record:
+                    record(rows)
+                if self.journal:
+                    self.journal.finished(ip, neighbors)
+                frontier.extend(neighbors)
+            self._submit_shards(runner, frontier)
+        return self.seen
+
+    def _submit_shards(self, runner, ips):
+        """
+        Probes the devices that were not queued yet and hands the ones
+        that answered to the workers.
+        """
+        ips = [ip for ip in dict.fromkeys(ips) if ip and ip not in self.seen]
+        if self.probe:
+            ips, unreachable = self.probe.probe(ips)
+            for ip in unreachable:
+                self._skip(ip)
+        for ip in ips:
+            self.seen.add(ip)
+            if self.journal:
+                self.journal.queued(ip)
+        if ips:
+            runner.submit(ips)
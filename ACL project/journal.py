@@ -0,0 +1,78 @@
+"""
+Append-only progress journal of the SNMP ACL rollout. Every device that is
+queued by the crawler and every device that is finished is recorded as a JSON
+line, so an interrupted run can be resumed without reconnecting to the devices
+that were already done, starting from the frontier that was discovered.
+"""
+import json
+from os.path import exists
+from threading import Lock
+from time import time
+
+class RolloutJournal:
+    def __init__(self, file_name, resume=False):
+        """
+        Receives:
+            file_name : str
+                Location of the journal.
+            resume : boolean
+                If True, the records of the previous run are kept and loaded,
+                otherwise the journal starts empty.
+        """
+        self.file_name = file_name
+        self.done = set()
+        self.frontier = []
+        if resume and exists(file_name):
+            self._load()
+        self.lock = Lock()
+        self.journal_file = open(file_name, "a" if resume else "w", encoding="UTF-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load(self):
+        """
+        This function reads the journal of the previous run and rebuilds
+        the set of finished devices and the frontier that was still pending.
+        """
+        queued = {}
+        with open(self.file_name, encoding="UTF-8") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    #the last line may be incomplete if the run was killed while writing it
+                    continue
+                if record["event"] == "queued":
+                    queued.setdefault(record["ip"], None)
+                elif record["event"] == "done":
+                    self.done.add(record["ip"])
+                    for neighbor in record.get("neighbors", []):
+                        queued.setdefault(neighbor, None)
+        self.frontier = [ip for ip in queued if ip not in self.done]
+
+    def _write(self, record):
+        record["time"] = round(time(), 3)
+        with self.lock:
+            self.journal_file.write(json.dumps(record) + "\n")
+            self.journal_file.flush()
+
+    def queued(self, ip):
+        """
+        This function records a device that was added to the crawl.
+        """
+        self._write({"event": "queued", "ip": ip})
+
+    def finished(self, ip, neighbors):
+        """
+        This function records a device that was completed, together with
+        the CDP neighbors it reported.
+        """
+        self._write({"event": "done", "ip": ip, "neighbors": list(neighbors)})
+
+    def close(self):
+        with self.lock:
+            self.journal_file.close()
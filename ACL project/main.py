@@ -8,12 +8,28 @@ routers.
 Note that for the correct execution of this script, the libraries found
 below must be installed in the environment where it is being executed.
 """
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from getpass import getpass
-from netmiko import ConnectHandler
-from openpyxl import load_workbook, Workbook
+from pathlib import Path
 from datetime import date
-from os.path import exists
 from netmiko.exceptions import NetMikoTimeoutException, NetMikoAuthenticationException
+from crawler import CdpCrawler
+from change_log import ChangeLog, ShardChangeLog
+from acl_planner import AclPlanner, format_plan
+from journal import RolloutJournal
+#modules shared by the different network projects
+sys.path.append(str(Path(__file__).resolve().parents[1] / "Common"))
+from topology_cache import DEFAULT_CACHE, TopologyCache
+from device_session import DeviceSession, TRANSPORTS, use_transport
+from fact_store import DEFAULT_STORE, FactRun
+from instrumentation import tracer
+from scheduler import AdaptiveScheduler
+from reachability import ReachabilityProbe
+from sharding import ShardRunner, serve_shards
 
 def get_main_routers():
     """
@@ -33,137 +49,216 @@ def get_main_routers():
     routers_list = [x.replace('\n', '') for x in router_ips.readlines()]
     return routers_list
 
-def log_creator(file_name):
-    """
-    This function verifies if an Excel spreadsheet is already present
-    to log the changes, and if it is not, it proceeds to create it.
-
-    Receives:
-        file_name : str
-            Path of the file to be created
-    Returns:
-        none
-        
-    """
-    if not exists(file_name):
-        wb = Workbook()
-        page = wb.active
-        page.append(['Device', 'Status'])
-        wb.save(file_name)
-
-def verify_acls(current_aces):
-    """
-    This function verifies if the required ACLs are already
-    configured on the device. It iterates over the current ACEs,
-    if the source ip address is present on the new ACLs, it is removed
-    from the corresponding list. 
-
-    At the end, an empty list will mean that the new ACLs are properly
-    configured, and the function will return True, otherwise, False will
-    be returned. 
-
-    Receives:
-        current_aces : list 
-            List that contain the current ACEs.
-    Returns:
-        is_ro_present : boolean
-            Indicates if the snmp_ro is configured in
-            the device.
-
-        is_rw_present : boolean 
-            Indicates if the snmp_rw is configured in
-            the device.
-    """
-    #new ACLs
-    snmp_ro = ["10.85.23.25", "10.93.1.56","10.95.1.3", "10.99.72.54", "10.101.72.53", 
-    "10.35.72.52", "10.92.72.51", "10.42.72.50", "10.84.75.49", "10.14.32.48", "10.98.72.46",
-    "10.91.56.23", "10.93.154.125", "10.31.132.80", "10.12.17.6", "10.95.72.2", "10.75.22.1"]
-    snmp_rw = ["10.85.23.25", "10.93.1.56","10.95.1.3", "10.99.72.54", "10.101.72.53", 
-    "10.35.72.52", "10.92.72.51", "10.42.72.50", "10.84.75.49", "10.14.32.48", "10.98.72.46",
-    "10.91.56.23", "10.93.154.125", "10.31.132.80", "10.12.17.6", "10.95.72.2", "10.75.22.1"]
-    for acl in current_aces:
-        if acl["acl_name"] == 'SNMP_RO' and acl['src_host'] in snmp_ro:
-            snmp_ro.remove(acl['src_host'])
-        elif acl["acl_name"] == 'SNMP_RW' and acl['src_host'] in snmp_rw:
-            snmp_rw.remove(acl['src_host'])
-    is_ro_present = True if len(snmp_ro) == 0 else False
-    is_rw_present = True if len(snmp_rw) == 0 else False
-    return is_ro_present , is_rw_present 
-
-def get_neighbors(neighbors):
+def get_neighbors(neighbors, ip):
     """
     This function discovers the CDP neighbors of the device being configured (if any),
-    and adds them to "neighbors_list".
+    and returns the management IPs of the ones that are switches or routers.
 
     Receives:
-        neighbors : dict 
+        neighbors : list
             List that contains the CDP neighbors information.
+        ip : str
+            IP address of the device being configured.
     Returns:
-        None
+        neighbor_ips : list
+            Management IPs of the switches and routers found.
     """
+    neighbor_ips = []
     try:
         for device in neighbors:
             capabilities = (device["capabilities"]).split()
             if "Switch" in capabilities or "Router" in capabilities:
-                if device["management_ip"] not in neighbors_list:
-                    neighbors_list.append(device["management_ip"])  
+                neighbor_ips.append(device["management_ip"])
     except TypeError:
         print(f"No CDP neighbors were found for {ip}")
     except KeyError as e:
         print(f"Script found the following error {e}. Please contact the network developer")
+    return neighbor_ips
 
-def log_writer(file_name, entry):
+def configure_device(ip, username, password, change_log, planner, dry_run=False,
+                     topology=None, cache_age=0):
     """
-    This function appends to the Excel spreadsheet
-    the IP of the device being configured and a message
-    that indicates the result of the operation.
+    This function connects to a device, sends only the SNMP ACL
+    entries that are missing in a single config session, logs the
+    result, and returns the CDP neighbors that have to be configured next.
 
     Receives:
-        file_name : str 
-            Location of the file spreadsheet.
+        ip : str
+            IP address of the device to configure.
+        username : str
+            Username used to log in to the device.
+        password : str
+            Password used to log in to the device.
+        change_log : ChangeLog
+            Log where the result of the operation is recorded.
+        planner : AclPlanner
+            Planner that compares the current ACEs with the policy.
+        dry_run : boolean
+            If True, the plan is printed and nothing is pushed.
+        topology : TopologyCache
+            Cache of the CDP topology. If the device was crawled less than
+            cache_age seconds ago, its cached neighbors are used instead of
+            running "show cdp neighbors detail".
+        cache_age : int
+            Maximum age, in seconds, of a cached entry.
+    Returns:
+        neighbor_ips : list
+            Management IPs of the CDP neighbors of the device.
+    """
+    network_device = {
+        "device_type": "cisco_ios",
+        "host": ip,
+        "username": username,
+        "password": password,
+    }
+    try:
+        with tracer.device(ip), DeviceSession(network_device) as net_connect:
+            #leverages textfsm to parse the information to a dictionary. 
+            current_acls = net_connect.send_command("show ip access-lists", use_textfsm=True)
+            with tracer.span("validate", "plan"):
+                plan = planner.plan(current_acls)
+            if dry_run:
+                print(format_plan(ip, plan))
+                change_log.write([ip, f"Dry run. {sum(len(lines) for lines in plan.values())} lines planned"])
+            elif plan:
+                net_connect.send_config_set([line for lines in plan.values() for line in lines])
+                net_connect.save_config()
+                change_log.write([ip, "Configured"])
+            else:
+                change_log.write([ip, "Already configured"])
+            if topology and topology.is_fresh(ip, cache_age):
+                return topology.neighbor_ips(ip)
+            cdp_neighbors = net_connect.send_command("show cdp neighbors detail", use_textfsm=True)
+            neighbor_ips = get_neighbors(cdp_neighbors, ip)
+            #the topology changed around this device, the cached neighbors of its neighbors are not trusted
+            if topology and topology.update(ip, cdp_neighbors):
+                topology.expire(neighbor_ips)
+            return neighbor_ips
+    #The device is unreachable
+    except NetMikoTimeoutException:
+        change_log.write([ip, "Failed. A connection could not be established"])
+    #The device is reachable but the credentials are incorrect.
+    except NetMikoAuthenticationException:
+        change_log.write([ip, "Failed. The device rejected the credentials"])
+    return []
 
-        entry : list
-            Information to add in the format ["ip", "message"].  
+def configure_shard(shard, context):
+    """
+    This function configures a shard of the crawl frontier in a worker
+    process, or on a worker node, and returns the results to the coordinator.
+
+    Receives:
+        shard : list
+            IP addresses of the devices to configure.
+        context : dict
+            Credentials and options of the run, see shard_context.
     Returns:
-        None
+        results : list
+            [ip, CDP neighbors, change log rows] of every device.
+    """
+    use_transport(context["transport"])
+    change_log = ShardChangeLog()
+    planner = AclPlanner(*context["acl_files"])
+    with TopologyCache(context["topology_file"]) as topology, ThreadPoolExecutor(max_workers=context["workers"]) as pool:
+        neighbors = list(pool.map(partial(configure_device, username=context["username"], password=context["password"],
+                                          change_log=change_log, planner=planner, dry_run=context["dry_run"],
+                                          topology=topology, cache_age=context["cache_age"]), shard))
+    return [[ip, ip_neighbors, change_log.pop(ip)] for ip, ip_neighbors in zip(shard, neighbors)]
+
+def shard_context(args, username, password):
     """
-    wb = load_workbook(file_name)
-    page = wb.active
-    page.append(entry)
-    wb.save(file_name)
+    This function returns the context of configure_shard from the command line arguments.
+    """
+    return {"username": username, "password": password, "workers": args.workers, "transport": args.transport,
+            "dry_run": args.dry_run, "cache_age": args.cache_age * 3600, "acl_files": ["ro.txt", "rw.txt"],
+            "topology_file": str(DEFAULT_CACHE)}
 
 if __name__ == "__main__":
-    main_routers_list = get_main_routers()
+    parser = ArgumentParser(description="Rolls out the SNMP ACLs to the main routers and their CDP neighbors")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="number of devices configured at the same time, "
+                             "the highest number with --adaptive (default: 16)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="tune the number of devices configured at the same time from the login "
+                             "latency, timeouts and authentication failures (not with sharded runs)")
+    parser.add_argument("--site-limit", type=int, default=4,
+                        help="devices configured at the same time behind each main router with --adaptive (default: 4)")
+    parser.add_argument("--aaa-limit", type=int, default=16,
+                        help="logins at the same time through the AAA server with --adaptive (default: 16)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the changes planned for every device without pushing them")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue today's interrupted rollout from its journal")
+    #the cache is opt-in, a trusted entry hides the neighbors added since it was crawled
+    parser.add_argument("--cache-age", type=float, default=0,
+                        help="hours a cached CDP entry is trusted before the device is crawled again, "
+                             "new neighbors of a trusted device are not discovered (default: 0, always crawl)")
+    parser.add_argument("--from-cache", action="store_true",
+                        help="also target every switch and router of the cached topology from the start")
+    parser.add_argument("--no-probe", action="store_true",
+                        help="connect to every device without probing TCP/22 first")
+    parser.add_argument("--probe-timeout", type=float, default=2,
+                        help="seconds the TCP/22 probe of a device waits (default: 2)")
+    parser.add_argument("--shards", type=int, metavar="PROCESSES",
+                        help="hand the crawl frontier in shards to this many processes, each one with --workers threads")
+    parser.add_argument("--spool", help="hand the shards to the worker nodes of this shared folder instead of local processes")
+    parser.add_argument("--worker", metavar="SPOOL",
+                        help="run as a worker node of the coordinator that uses this shared folder")
+    parser.add_argument("--shard-size", type=int, default=50, help="devices per shard (default: 50)")
+    parser.add_argument("--facts", nargs="?", const=DEFAULT_STORE, metavar="DATABASE",
+                        help="record the status of every device in a SQLite fact store "
+                             "(Common/facts.db by default), queried with Common/fact_store.py")
+    parser.add_argument("--trace", help="write the timing spans to this JSON Lines file, "
+                                        "and the Prometheus metrics next to it (.prom)")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="netmiko",
+                        help="SSH transport, asyncssh drives many more sessions per process (default: netmiko)")
+    args = parser.parse_args()
+    #the site and AAA limits are kept by one process, the shards are configured by several
+    if args.adaptive and (args.shards or args.spool or args.worker):
+        parser.error("--adaptive can't be used with --shards, --spool or --worker")
+    use_transport(args.transport)
+    if args.trace:
+        tracer.enable(args.trace, str(Path(args.trace).with_suffix(".prom")))
     username = input("Please enter your username: ")
     password = getpass()
+    if args.worker:
+        print(f"Waiting for shards in {args.worker}")
+        shards = serve_shards(args.worker, configure_shard, shard_context(args, username, password))
+        print(f"{shards} shards configured")
+        sys.exit()
+    main_routers_list = get_main_routers()
     filepath = f'.\\password change log {date.today()}.xlsx'
-    log_creator(filepath)
-    for router in main_routers_list:
-        neighbors_list = []
-        neighbors_list.append(router)
-        for ip in neighbors_list:
-            network_device = {
-                "device_type": "cisco_ios",
-                "host": ip,
-                "username": username,
-                "password": password,
-            }
-            try:
-                with ConnectHandler(**network_device) as net_connect:
-                    #leverages textfsm to parse the information to a dictionary. 
-                    current_acls = net_connect.send_command("show ip access-lists", use_textfsm=True)
-                    cdp_neighbors = net_connect.send_command("show cdp neighbors detail", use_textfsm=True)
-                    is_ro_config, is_rw_config = verify_acls(current_acls)
-                    if not is_ro_config:
-                        net_connect.send_config_from_file("ro.txt")
-                    if not is_rw_config:
-                        net_connect.send_config_from_file("rw.txt")
-                    log_writer(filepath, [ip, "Configured"])
-                    get_neighbors(cdp_neighbors)
-            #The device is unreachable
-            except NetMikoTimeoutException:
-                log_writer(filepath, [ip, "Failed. A connection could not be established"])
-            #The device is reachable but the credentials are incorrect.
-            except NetMikoAuthenticationException:
-                log_writer(filepath, [ip, "Failed. The device rejected the credentials"])
+    planner = AclPlanner("ro.txt", "rw.txt")
+    #dry runs are not journaled, they must not mark devices as done for the real rollout
+    journal_path = f'.\\rollout journal {date.today()}.jsonl'
+    journal_context = nullcontext() if args.dry_run else RolloutJournal(journal_path, resume=args.resume)
+    scheduler_context = (AdaptiveScheduler(max_workers=args.workers, initial_workers=min(args.workers, 8),
+                                           default_site_limit=args.site_limit, aaa_limit=args.aaa_limit)
+                         if args.adaptive else nullcontext())
+    #the workers of a spool ask for their own credentials, they are not written to the shared folder
+    runner_context = (ShardRunner(configure_shard, shard_context(args, username, password), processes=args.shards,
+                                  spool=args.spool, shard_size=args.shard_size)
+                      if args.shards or args.spool else nullcontext())
+    fact_context = FactRun("acl_rollout", args.facts) if args.facts else nullcontext()
+    with fact_context as fact_run, ChangeLog(filepath, fact_run=fact_run) as change_log, journal_context as journal, \
+            TopologyCache() as topology, scheduler_context as scheduler, runner_context as runner:
+        crawler = CdpCrawler(partial(configure_device, username=username, password=password,
+                                     change_log=change_log, planner=planner, dry_run=args.dry_run,
+                                     topology=topology, cache_age=args.cache_age * 3600),
+                             max_workers=args.workers, journal=journal, scheduler=scheduler,
+                             probe=None if args.no_probe else ReachabilityProbe(timeout=args.probe_timeout),
+                             on_unreachable=lambda ip: change_log.write([ip, "Failed. SSH (TCP/22) did not answer"]))
+        crawl = partial(crawler.crawl_sharded, runner=runner, record=change_log.write_rows) if runner else crawler.crawl
+        if journal and journal.done:
+            print(f"Resuming the rollout, {len(journal.done)} devices were already done")
+            crawl(journal.frontier, done=journal.done)
+        elif args.from_cache:
+            cached_devices = {device["ip"] for capability in ("Switch", "Router")
+                              for device in topology.devices(capability)}
+            crawl(main_routers_list + sorted(cached_devices - set(main_routers_list)))
+        else:
+            crawl(main_routers_list)
+    if args.trace:
+        tracer.close()
+        print(tracer.summary())
     print("The configuration has been completed, check the log for more info")
@@ -0,0 +1,254 @@
+"""
+End-to-end benchmark of the ACL rollout, the Router Checks audit and the
+internet checks, run against the simulated device farm (device_farm.py).
+No real device is contacted, the ConnectHandler used by the tools' sessions is
+replaced by the farm.
+
+For every tool and fleet size it reports the devices per minute and the
+p50/p99 latency per device:
+
+    python benchmark.py --sizes 10 100 1000 --latency 0.02 --workers 32
+
+The ACL rollout and the Router Checks audit can also be run sharded, by a
+local process pool (--shards) or by worker processes that serve a spool
+directory (--spool-workers), the way several worker nodes would. The workers
+are forked so they use the same farm (Linux only), and the latency per device
+is measured inside them, so the p50/p99 columns are empty for those runs.
+
+With --facts the tools also record their facts in a fact store
+(Common/fact_store.py), to measure the cost of the ingestion.
+"""
+import importlib.util
+import json
+import multiprocessing
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial, wraps
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+ROOT = Path(__file__).resolve().parents[1]
+for folder in ("Common", "ACL project", "Router Checks", "Internet Checks Script"):
+    sys.path.append(str(ROOT / folder))
+
+from device_farm import DeviceFarm
+from fact_store import FactRun
+from instrumentation import tracer
+from sharding import ShardRunner, serve_shards
+TOOLS = ("acl", "router_checks", "internet_checks")
+
+def load_module(name, file_name):
+    """
+    This function imports a script by path, the ACL project and Router Checks
+    both have a main.py so they can't be imported by name.
+    """
+    spec = importlib.util.spec_from_file_location(name, file_name)
+    module = importlib.util.module_from_spec(spec)
+    #registered so the shard tasks of the module can be sent to worker processes
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextmanager
+def shard_runner(task, context, folder, shards=None, spool_workers=0):
+    """
+    This function returns the ShardRunner of a sharded run, with
+    spool_workers forked processes serving a spool directory in folder, or
+    a local pool of shards processes.
+    """
+    if not spool_workers:
+        with ShardRunner(task, context, processes=shards, shard_size=25) as runner:
+            yield runner
+        return
+    spool = Path(folder) / "spool"
+    workers = [multiprocessing.Process(target=serve_shards, args=(spool, task, context, 0.05))
+               for _ in range(spool_workers)]
+    for worker in workers:
+        worker.start()
+    with ShardRunner(task, context, spool=spool, shard_size=25, poll_interval=0.05) as runner:
+        yield runner
+    for worker in workers:
+        worker.join()
+
+
+def timed(function, latencies):
+    """
+    This function wraps a per device function and records how long every call takes.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            latencies.append(perf_counter() - start)
+    return wrapper
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(tool, size, elapsed, latencies, completed=None):
+    #the sharded runs measure the latencies in the workers, they pass the number of devices completed
+    return {"tool": tool, "devices": size, "seconds": round(elapsed, 3),
+            "devices_per_minute": round((len(latencies) or completed or 0) / elapsed * 60, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1)}
+
+
+def fact_run(folder, tool, facts=False):
+    """
+    This function returns the FactRun of a tool on a store in folder, or a null context without --facts.
+    """
+    return FactRun(tool, Path(folder) / "facts.db") if facts else nullcontext()
+
+
+def bench_acl(size, workers, farm_options, shards=None, spool_workers=0, facts=False):
+    import device_session
+    acl_main = load_module("acl_main", ROOT / "ACL project" / "main.py")
+    from change_log import ChangeLog
+    from crawler import CdpCrawler
+    from topology_cache import TopologyCache
+    planner = acl_main.AclPlanner(ROOT / "ACL project" / "ro.txt", ROOT / "ACL project" / "rw.txt")
+    farm = DeviceFarm(size, acl_sources=planner.policy.required_sources, **farm_options)
+    device_session.ConnectHandler = farm.connect
+    latencies = []
+    with TemporaryDirectory() as folder:
+        with fact_run(folder, "acl_rollout", facts) as facts_run, \
+             ChangeLog(str(Path(folder) / "log.xlsx"), fact_run=facts_run) as change_log, \
+             TopologyCache(Path(folder) / "topology.db") as topology:
+            visit = timed(partial(acl_main.configure_device, username="bench", password="bench",
+                                  change_log=change_log, planner=planner, topology=topology), latencies)
+            crawler = CdpCrawler(visit, max_workers=workers)
+            start = perf_counter()
+            if shards or spool_workers:
+                context = {"username": "bench", "password": "bench", "workers": workers, "transport": "netmiko",
+                           "dry_run": False, "cache_age": 0, "topology_file": str(Path(folder) / "topology.db"),
+                           "acl_files": [str(ROOT / "ACL project" / "ro.txt"), str(ROOT / "ACL project" / "rw.txt")]}
+                with shard_runner(acl_main.configure_shard, context, folder, shards, spool_workers) as runner:
+                    crawler.crawl_sharded(farm.main_routers, runner, change_log.write_rows)
+            else:
+                crawler.crawl(farm.main_routers)
+            elapsed = perf_counter() - start
+    return summarize("acl", size, elapsed, latencies, len(crawler.seen))
+
+
+def bench_router_checks(size, workers, farm_options, shards=None, spool_workers=0, facts=False):
+    import device_session
+    checks_main = load_module("router_checks_main", ROOT / "Router Checks" / "main.py")
+    farm = DeviceFarm(size, main_routers=0, roles=("field", "cell"), **farm_options)
+    device_session.ConnectHandler = farm.connect
+    inventory = [(ip, checks_main.ROUTER_TYPES[device.role]) for ip, device in farm.devices.items()]
+    latencies = []
+    checks_main.audit_router = timed(checks_main.audit_router, latencies)
+    #{status: audits}, every result reaches the report, also the ones of the sharded runs
+    statuses = Counter()
+    errors = []
+    with TemporaryDirectory() as folder:
+        start = perf_counter()
+        with checks_main.ReportRenderer(folder, "report") as renderer, \
+             fact_run(folder, "router_checks", facts) as facts_run:
+            write = renderer.write
+
+            def counted_write(device, sections, text, status="ok"):
+                statuses[status] += 1
+                if status != "ok" and len(errors) < 3:
+                    errors.append(f"{device}: {text.strip().splitlines()[-1]}")
+                write(device, sections, text, status)
+
+            renderer.write = counted_write
+            if shards or spool_workers:
+                context = {"username": "bench", "password": "bench", "workers": workers, "transport": "netmiko",
+                           "config_snapshot": False, "cache_mode": "live", "cache_ttl": 0, "reuse_compliance": False}
+                with shard_runner(checks_main.audit_shard, context, folder, shards, spool_workers) as runner:
+                    checks_main.audit_sharded(inventory, renderer, runner, fact_run=facts_run)
+            else:
+                checks_main.audit_fleet(inventory, {"username": "bench", "password": "bench"}, renderer, workers,
+                                        fact_run=facts_run)
+        elapsed = perf_counter() - start
+    failed = sum(count for status, count in statuses.items() if status != "ok")
+    if failed:
+        #the failed audits are faster than the real ones, the numbers would be meaningless
+        print(f"WARNING: {failed} of {size} router_checks audits did not complete, e.g. {'; '.join(errors)}")
+    result = summarize("router_checks", size, elapsed, latencies, len(inventory))
+    result["failed"] = failed
+    return result
+
+
+def bench_internet_checks(size, workers, farm_options, shards=None, spool_workers=0, facts=False):
+    import device_session
+    internet_checks = load_module("internet_checks", ROOT / "Internet Checks Script" / "internet_checks.py")
+    farm = DeviceFarm(size, main_routers=0, roles=("edge",), **farm_options)
+    device_session.ConnectHandler = farm.connect
+    latencies = []
+
+    def check_device(ip, facts_run=None):
+        handler = {"device_type": "cisco_ios", "host": ip, "username": "bench", "password": "bench"}
+        with tracer.device(ip):
+            output = internet_checks.send_commands(ip, handler)
+            internet_checks.check_device(output)
+            if facts_run:
+                facts_run.record(ip, internet_checks.device_facts(output["hostname"], output))
+
+    check_device = timed(check_device, latencies)
+    with TemporaryDirectory() as folder, fact_run(folder, "internet_checks", facts) as facts_run:
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(partial(check_device, facts_run=facts_run), farm.devices))
+        elapsed = perf_counter() - start
+    return summarize("internet_checks", size, elapsed, latencies)
+
+
+BENCHMARKS = {"acl": bench_acl, "router_checks": bench_router_checks, "internet_checks": bench_internet_checks}
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmarks the tools against a simulated fleet of IOS devices")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="fleet sizes to benchmark")
+    parser.add_argument("--tools", nargs="+", choices=TOOLS, default=list(TOOLS), help="tools to benchmark")
+    parser.add_argument("--workers", type=int, default=32, help="workers used by the parallel tools")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean seconds per command")
+    parser.add_argument("--jitter", type=float, default=0.005, help="standard deviation of the latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of unreachable devices")
+    parser.add_argument("--auth-failure-rate", type=float, default=0.0, help="share of devices rejecting the login")
+    parser.add_argument("--shards", type=int, metavar="PROCESSES",
+                        help="run the ACL rollout and the Router Checks audit sharded across this many processes")
+    parser.add_argument("--spool-workers", type=int, default=0,
+                        help="run them sharded through a spool directory served by this many worker processes")
+    parser.add_argument("--facts", action="store_true", help="also record the facts of every device in a fact store")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    parser.add_argument("--trace", help="write the timing spans to this JSON Lines file, "
+                                        "and the Prometheus metrics next to it (.prom)")
+    args = parser.parse_args()
+    if args.shards or args.spool_workers:
+        #the workers inherit the farm that replaces ConnectHandler
+        multiprocessing.set_start_method("fork")
+    if args.trace:
+        tracer.enable(args.trace, str(Path(args.trace).with_suffix(".prom")))
+
+    farm_options = {"latency": args.latency, "jitter": args.jitter, "failure_rate": args.failure_rate,
+                    "auth_failure_rate": args.auth_failure_rate}
+    results = []
+    print(f"{'tool':<16} {'devices':>8} {'seconds':>9} {'dev/min':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for tool in args.tools:
+        for size in args.sizes:
+            result = BENCHMARKS[tool](size, args.workers, farm_options, args.shards, args.spool_workers, args.facts)
+            results.append(result)
+            print(f"{result['tool']:<16} {result['devices']:>8} {result['seconds']:>9} "
+                  f"{result['devices_per_minute']:>9} {result['p50_ms']:>8} {result['p99_ms']:>8}")
+    if args.json:
+        with open(args.json, "w", encoding="UTF-8") as json_file:
+            json.dump(results, json_file, indent=2)
+    if args.trace:
+        tracer.close()
+        print(tracer.summary())
+    if any(result.get("failed") for result in results):
+        sys.exit("Some audits did not complete, the results above do not measure real audits")
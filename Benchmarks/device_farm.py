@@ -0,0 +1,414 @@
+"""
+Simulated fleet of Cisco IOS devices used to benchmark and exercise the
+tools without touching production routers.
+
+The farm replaces netmiko's ConnectHandler: DeviceFarm.connect receives the
+same arguments and returns a connection that answers the commands the tools
+run (show ip access-lists, show cdp neighbors detail, show interface,
+show ip bgp summary, show flow exporter, show cellular 0/1/0 radio, the
+"show run" commands, etc.) with IOS formatted text. The text is parsed with
+netmiko's TextFSM and TTP helpers, so the parsing cost is the real one.
+Every device has configurable latency, jitter and failure rates, and the
+topology (a CDP tree under the main routers) is built for any size.
+
+    farm = DeviceFarm(size=100, latency=0.02)
+    main.ConnectHandler = farm.connect
+"""
+import random
+from re import search
+from threading import Lock
+from time import sleep
+from netmiko.exceptions import NetMikoAuthenticationException, NetMikoTimeoutException
+from netmiko.utilities import get_structured_data, get_structured_data_ttp
+
+EDGE_INTERFACES = ("TenGigabitEthernet0/1/0", "TenGigabitEthernet0/2/0", "Tunnel1",
+                   "Tunnel10", "Tunnel21", "Tunnel22")
+
+class SimulatedDevice:
+    def __init__(self, ip, hostname, role, rng, acl_sources=None, subinterfaces=0):
+        """
+        Parameters
+        ----------
+        ip : str
+            Management IP address.
+        hostname : str
+            Hostname of the device.
+        role : str
+            "main", "switch", "field", "cell" or "edge".
+        rng : random.Random
+            Generator used to build the state of the device.
+        acl_sources : dict
+            {"acl name": [hosts]}, a random part of the hosts is configured.
+        subinterfaces : int
+            Number of extra subinterfaces listed by "show interface".
+        """
+        self.ip = ip
+        self.hostname = hostname
+        self.role = role
+        self.neighbors = []
+        self.lock = Lock()
+        self.log_sequence = 0
+        self.log = []
+        #number of configuration changes, shown as the time of the last one in the running config
+        self.config_version = 0
+        self.acls = {}
+        for acl_name, hosts in (acl_sources or {}).items():
+            configured = [host for host in hosts if rng.random() < 0.8]
+            self.acls[acl_name] = [(10 * (position + 1), "permit", host) for position, host in enumerate(configured)]
+            self.acls[acl_name].append((10 * (len(configured) + 1) + 1000, "deny", "any"))
+        self.interfaces = self._build_interfaces(rng, subinterfaces)
+        self.counters = {name: [rng.randrange(10**9, 10**12), rng.randrange(10**9, 10**12)]
+                         for name in self.interfaces}
+        self.add_log("%SYS-5-CONFIG_I: Configured from console by admin on vty0")
+        self.add_log("%BGP-5-ADJCHANGE: neighbor 10.255.0.1 Up")
+
+    def _build_interfaces(self, rng, subinterfaces):
+        interfaces = {"Loopback0": f"10.250.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+                      "Vlan1": f"10.{rng.randrange(256)}.{rng.randrange(256)}.1"}
+        if self.role == "cell":
+            interfaces["Cellular0/1/0"] = f"100.{rng.randrange(64, 128)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        else:
+            interfaces["GigabitEthernet0/0/1"] = f"172.{rng.randrange(16, 32)}.{rng.randrange(256)}.2"
+        if self.role == "edge":
+            for position, name in enumerate(EDGE_INTERFACES):
+                interfaces[name] = f"192.0.2.{position * 4 + 1}"
+        for position in range(subinterfaces):
+            interfaces[f"GigabitEthernet0/0/0.{position + 100}"] = f"10.{position // 250}.{position % 250}.1"
+        return interfaces
+
+    def add_log(self, message):
+        with self.lock:
+            self.log_sequence += 1
+            self.log.append((self.log_sequence, f"*Oct 16 10:{self.log_sequence // 60 % 60:02}:"
+                                                f"{self.log_sequence % 60:02}.000: {message}"))
+            del self.log[:-500]
+
+
+    def running_config(self):
+        lines = [f"! Last configuration change at 10:{self.config_version // 60 % 60:02}:{self.config_version % 60:02} "
+                 f"UTC Fri Oct 16 2026 by admin", f"hostname {self.hostname}", "!"]
+        for name, address in self.interfaces.items():
+            lines.append(f"interface {name}")
+            lines.append(f" ip address {address} 255.255.255.0")
+            if name in ("GigabitEthernet0/0/1", "Vlan1"):
+                lines.extend([" speed 100", " duplex full"])
+            if name == "GigabitEthernet0/0/1":
+                lines.append(" ip flow monitor FIELD_SITES input")
+            lines.append("!")
+        lines.append("ip route 0.0.0.0 0.0.0.0 220")
+        for acl_name, entries in self.acls.items():
+            lines.append(f"ip access-list standard {acl_name}")
+            lines.extend(f" {sequence} {action} {host}" for sequence, action, host in entries)
+        lines.extend(["snmp-server community community1 RO SNMP_RO",
+                      "snmp-server community community2 RW SNMP_RW",
+                      "tacacs server ISE1", " address ipv4 10.81.89.123",
+                      "tacacs server ISE2", " address ipv4 10.72.31.189", "end"])
+        return "\n".join(lines)
+
+    def access_lists(self):
+        lines = []
+        for acl_name, entries in self.acls.items():
+            lines.append(f"Standard IP access list {acl_name}")
+            lines.extend(f"    {sequence} {action} {host}" for sequence, action, host in entries)
+        return "\n".join(lines)
+
+    def cdp_neighbors(self):
+        entries = []
+        for ip, hostname, capabilities, local_port, remote_port in self.neighbors:
+            entries.append("\n".join([
+                "-------------------------", f"Device ID: {hostname}", "Entry address(es): ",
+                f"  IP address: {ip}", f"Platform: cisco ISR4331/K9,  Capabilities: {capabilities}",
+                f"Interface: {local_port},  Port ID (outgoing port): {remote_port}", "Holdtime : 150 sec", "",
+                "Version :", "Cisco IOS Software [Fuji], Version 16.9.4, RELEASE SOFTWARE (fc2)", "",
+                "advertisement version: 2", "Management address(es): ", f"  IP address: {ip}", ""]))
+        return "\n".join(entries)
+
+    def show_interfaces(self, names=None):
+        blocks = []
+        for name, address in self.interfaces.items():
+            if names and name not in names:
+                continue
+            with self.lock:
+                counters = self.counters[name]
+                counters[0] += random.randrange(10**6, 10**8)
+                counters[1] += random.randrange(10**6, 10**8)
+                input_bytes, output_bytes = counters
+            blocks.append("\n".join([
+                f"{name} is up, line protocol is up ",
+                "  Hardware is ISR4331-3x1GE, address is 0000.0c07.ac01 (bia 0000.0c07.ac01)",
+                f"  Internet address is {address}/24",
+                "  MTU 1500 bytes, BW 1000000 Kbit/sec, DLY 10 usec, ",
+                "     reliability 255/255, txload 1/255, rxload 1/255",
+                "  Encapsulation ARPA, loopback not set",
+                "  Full Duplex, 1000Mbps, link type is auto, media type is RJ45",
+                "  Last input 00:00:00, output 00:00:00, output hang never",
+                "  Queueing strategy: fifo",
+                f"  5 minute input rate {input_bytes % 10**8} bits/sec, 5000 packets/sec",
+                f"  5 minute output rate {output_bytes % 10**8} bits/sec, 4000 packets/sec",
+                f"     {input_bytes // 700} packets input, {input_bytes} bytes, 0 no buffer",
+                "     0 input errors, 0 CRC, 0 frame, 0 overrun, 0 ignored",
+                f"     {output_bytes // 700} packets output, {output_bytes} bytes, 0 underruns",
+                "     0 output errors, 0 collisions, 0 interface resets"]))
+        return "\n".join(blocks)
+
+
+    def output(self, command):
+        """
+        This function returns the raw output of a command.
+        """
+        #the patterns of "| include" are case sensitive, as in IOS
+        original_command = " ".join(command.split())
+        command = original_command.lower()
+        if command.startswith("show run"):
+            config = self.running_config()
+            if "|" in command:
+                pattern = original_command.split("|", 1)[1].strip().split(" ", 1)[1]
+                return "\n".join(line for line in config.splitlines() if search(pattern, line))
+            if command in ("show running-config", "show run"):
+                return f"Building configuration...\n\nCurrent configuration : {len(config)} bytes\n!\n{config}"
+            header = command.split(" ", 2)[2]
+            section, in_section = [], False
+            for line in config.splitlines():
+                if line.lower() == header:
+                    in_section = True
+                elif in_section and not line.startswith(" "):
+                    break
+                if in_section:
+                    section.append(line)
+            return "\n".join(section)
+        if command.startswith("show ip access-list"):
+            return self.access_lists()
+        if command.startswith("show cdp neighbors detail"):
+            return self.cdp_neighbors()
+        if command.startswith("show interface"):
+            if "| section " in command:
+                pattern = command.split("| section ", 1)[1]
+                return self.show_interfaces([name for name in self.interfaces if search(pattern, f"{name.lower()} is")])
+            names = command.split()[2:]
+            return self.show_interfaces([name for name in self.interfaces if name.lower() in names] or None)
+        if command.startswith("show ip int brief"):
+            return "\n".join(["Interface              IP-Address      OK? Method Status                Protocol"] +
+                             [f"{name:<23}{address:<16}YES NVRAM  up                    up"
+                              for name, address in self.interfaces.items()])
+        if command.startswith("show ver"):
+            return "\n".join([
+                "Cisco IOS XE Software, Version 16.09.04",
+                "Cisco IOS Software [Fuji], ISR Software (X86_64_LINUX_IOSD-UNIVERSALK9-M), Version 16.9.4, RELEASE SOFTWARE (fc2)",
+                f"{self.hostname} uptime is 1 week, 2 days, 3 hours, 4 minutes",
+                "System image file is \"bootflash:isr4300-universalk9.16.09.04.SPA.bin\"",
+                "cisco ISR4331/K9 (1RU) processor with 1795999K/6147K bytes of memory.",
+                "Processor board ID FDO21520TGH", "Configuration register is 0x2102"])
+        if command.startswith("show ip bgp summary"):
+            return "\n".join([
+                f"BGP router identifier {self.interfaces['Loopback0']}, local AS number 65000",
+                "BGP table version is 10, main routing table version 10", "",
+                "Neighbor        V           AS MsgRcvd MsgSent   TblVer  InQ OutQ Up/Down  State/PfxRcd",
+                "10.255.0.1      4        65001    1000    1001       10    0    0 1w2d            5",
+                "10.255.0.5      4        65002     900     901       10    0    0 3d04h           2"])
+        if command.startswith("show standby"):
+            return "\n".join(["Vlan1 - Group 1", "  State is Active", "    2 state changes, last state change 1w2d",
+                              "  Virtual IP address is 10.0.0.254", "  Priority 110 (configured 110)",
+                              "  Group name is \"hsrp-Vl1-1\" (default)"])
+        if command.startswith("show vrrp brief"):
+            return "\n".join(["Interface          Grp Pri Time  Own Pre State   Master addr     Group addr",
+                              f"Vl1                1   100 3609       Y  Master  {self.interfaces['Vlan1']:<15} 10.0.0.254"])
+        if command.startswith("show flow exporter"):
+            return "\n".join(f"Flow Exporter {name}:\n  Description:              User defined\n"
+                             f"  Export protocol:          NetFlow Version 9\n  Transport Configuration:\n"
+                             f"    Destination IP address: {address}\n    Source IP address:      10.250.0.1\n"
+                             f"    Source Interface:       Loopback0\n    Transport Protocol:     UDP\n"
+                             f"    Destination Port:       2055"
+                             for name, address in (("EXPORTER1", "10.79.126.84"), ("EXPORTER2", "10.51.18.13")))
+        if command.startswith("show bfd neighbor"):
+            return "\n".join(["IPv4 Sessions", "NeighAddr                              LD/RD         RH/RS     State     Int",
+                              "10.255.0.1                          4097/4097        Up        Up        Gi0/0/1"])
+        if command.startswith("show policy-map interface brief"):
+            return "Service-policy output: WAN_QOS\n  GigabitEthernet0/0/1"
+        if command.startswith("show policy-map"):
+            return "  Policy Map WAN_QOS\n    Class class-default\n      shape average 100000000"
+        if command.startswith("show cellular 0/1/0 radio"):
+            return "\n".join(["Radio power mode = online", "LTE Rx Channel Number(PCC) =  5230",
+                              "LTE Tx Channel Number(PCC) =  23230", "LTE Band =  13", "LTE Bandwidth = 10 MHz",
+                              "Current RSSI = -65 dBm", "Current RSRP = -95 dBm", "Current RSRQ = -9 dB",
+                              "Current SNR = 12.4 dB", "Physical Cell Id = 310", "Number of nearby cells = 1",
+                              "Idx PCI (Physical Cell Id)", "Radio Access Technology(RAT) Preference = AUTO",
+                              "Radio Access Technology(RAT) Selected = LTE", "LTE Tx Channel Number = 23230"])
+        if command.startswith("show log"):
+            #the devices run with "service sequence-numbers"
+            with self.lock:
+                lines = [f"{sequence:06}: {line}" for sequence, line in self.log]
+            if "| begin " in command:
+                pattern = command.split("| begin ", 1)[1].strip()
+                start = next((position for position, line in enumerate(lines) if search(pattern, line.lower())), len(lines))
+                return "\n".join(lines[start:])
+            if "grep" in command:
+                return "\n".join([line for line in lines if search(r"(?i)BGP|%LINEPROTO-5-UPDOWN", line)][-10:])
+            return "\n".join(lines)
+        if command.startswith("show proc"):
+            return "CPU utilization for five seconds: 3%/0%; one minute: 2%; five minutes: 2%"
+        if command.startswith("show memory statistics"):
+            return "\n".join(["                Head    Total(b)     Used(b)     Free(b)   Lowest(b)  Largest(b)",
+                              "Processor  7F2C0B4010   1838376272   290185480  1548190792  1540343560  1546700256",
+                              "      I/O  7F2C0C4010      4194304     1043648     3150656     3150000     3149900"])
+        if command.startswith("terminal"):
+            return ""
+        return f"% Invalid input detected at '^' marker."
+
+
+    def configure(self, lines):
+        """
+        This function applies the SNMP ACL lines sent in config mode.
+        """
+        acl_name = None
+        with self.lock:
+            self.config_version += 1
+            for line in lines:
+                words = line.split()
+                if len(words) == 6 and [word.lower() for word in words[:3]] == ["ip", "access-list", "resequence"]:
+                    first, increment = int(words[4]), int(words[5])
+                    self.acls[words[3]] = [(first + increment * position, action, host)
+                                           for position, (_, action, host) in enumerate(self.acls.get(words[3], []))]
+                    acl_name = None
+                elif len(words) == 4 and words[0].lower() == "ip" and words[1].lower() == "access-list":
+                    acl_name = words[3]
+                    self.acls.setdefault(acl_name, [])
+                elif words[:1] == ["no"] and "access-list" in line.lower():
+                    self.acls.pop(words[-1], None)
+                elif acl_name and words:
+                    sequence = int(words[0]) if words[0].isdigit() else None
+                    action, host = words[-2], words[-1]
+                    entries = self.acls[acl_name]
+                    if sequence is None:
+                        sequence = (entries[-1][0] + 10) if entries else 10
+                    entries.append((sequence, action, host))
+                    entries.sort()
+        self.add_log("%SYS-5-CONFIG_I: Configured from console by admin on vty0")
+
+
+class SimulatedConnection:
+    """
+    Connection returned by DeviceFarm.connect, it has the methods of
+    netmiko's connections that the tools use.
+    """
+
+    def __init__(self, farm, device, device_type):
+        self.farm = farm
+        self.device = device
+        self.device_type = device_type
+        self.host = device.ip
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disconnect()
+
+    def disconnect(self):
+        self.farm.wait(self.farm.latency / 2)
+
+    def send_command(self, command, use_textfsm=False, use_ttp=False, ttp_template=None, **kwargs):
+        self.farm.wait(self.farm.latency)
+        output = self.device.output(command)
+        if use_ttp and ttp_template:
+            return get_structured_data_ttp(output, template=ttp_template)
+        if use_textfsm:
+            return get_structured_data(output, platform=self.device_type, command=command)
+        return output
+
+    def send_config_set(self, lines, **kwargs):
+        self.farm.wait(self.farm.latency * 2)
+        self.device.configure(lines)
+        return "\n".join(lines)
+
+    def send_config_from_file(self, file_name, **kwargs):
+        with open(file_name, encoding="UTF-8") as config_file:
+            return self.send_config_set([line.strip() for line in config_file if line.strip()])
+
+    def save_config(self, *args, **kwargs):
+        self.farm.wait(self.farm.latency * 5)
+        return "[OK]"
+
+
+class DeviceFarm:
+    def __init__(self, size=10, main_routers=3, latency=0.02, jitter=0.01, connect_latency=None,
+                 failure_rate=0.0, auth_failure_rate=0.0, acl_sources=None, roles=("switch",),
+                 subinterfaces=0, seed=1):
+        """
+        Parameters
+        ----------
+        size : int
+            Number of devices of the farm.
+        main_routers : int
+            Number of devices at the root of the CDP tree.
+        latency : float
+            Mean seconds each command takes.
+        jitter : float
+            Standard deviation of the latency, in seconds.
+        connect_latency : float
+            Mean seconds of the TCP connection and login, 5 x latency by default.
+        failure_rate : float
+            Share of the devices that are unreachable.
+        auth_failure_rate : float
+            Share of the devices that reject the credentials.
+        acl_sources : dict
+            {"acl name": [hosts]} that the devices are expected to permit, each
+            device has a random part of them.
+        roles : tuple
+            Roles given to the devices that are not main routers, in rotation
+            ("switch", "field", "cell" or "edge").
+        subinterfaces : int
+            Extra subinterfaces on every device.
+        seed : int
+            Seed of the random generator, the same seed builds the same farm.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.connect_latency = connect_latency if connect_latency is not None else latency * 5
+        self.rng = random.Random(seed)
+        self.devices = {}
+        ips = [f"10.200.{position // 250}.{position % 250 + 1}" for position in range(size)]
+        for position, ip in enumerate(ips):
+            if position < main_routers:
+                role, hostname = "main", f"main-rtr{position + 1}"
+            else:
+                role = roles[position % len(roles)]
+                hostname = f"Internetr{position % 2 + 1}" if role == "edge" else f"{role}-{position}"
+            self.devices[ip] = SimulatedDevice(ip, hostname, role, self.rng, acl_sources, subinterfaces)
+        #every device hangs from a random device that was created before it (a CDP tree)
+        for position in range(max(main_routers, 1), size):
+            parent = self.devices[ips[self.rng.randrange(position)]]
+            child = self.devices[ips[position]]
+            port = len(parent.neighbors) + 1
+            parent.neighbors.append((child.ip, child.hostname, self.capabilities(child), f"GigabitEthernet1/0/{port}", "GigabitEthernet1/0/1"))
+            child.neighbors.append((parent.ip, parent.hostname, self.capabilities(parent), "GigabitEthernet1/0/1", f"GigabitEthernet1/0/{port}"))
+            if self.rng.random() < 0.2:
+                child.neighbors.append((f"10.201.{position // 250}.{position % 250 + 1}", f"SEP{position:012}",
+                                        "Host Phone Two-port Mac Relay", "GigabitEthernet1/0/2", "Port 1"))
+        self.unreachable = {ip for ip in ips if self.rng.random() < failure_rate}
+        self.bad_credentials = {ip for ip in ips if ip not in self.unreachable and self.rng.random() < auth_failure_rate}
+        self.main_routers = ips[:main_routers]
+
+    @staticmethod
+    def capabilities(device):
+        return "Switch IGMP" if device.role == "switch" else "Router Switch IGMP"
+
+    def wait(self, mean):
+        """
+        This function simulates the time a device takes to answer.
+        """
+        sleep(max(0.0, random.gauss(mean, self.jitter)))
+
+    def connect(self, **handler):
+        """
+        This function has the signature of netmiko's ConnectHandler and
+        returns a connection to a simulated device.
+        """
+        host = handler["host"]
+        if host not in self.devices or host in self.unreachable:
+            #unreachable devices fail after a (scaled down) connection timeout
+            self.wait(self.connect_latency * 4)
+            raise NetMikoTimeoutException(f"TCP connection to device failed. Device: {host}")
+        self.wait(self.connect_latency)
+        if host in self.bad_credentials:
+            raise NetMikoAuthenticationException(f"Authentication to device failed. Device: {host}")
+        return SimulatedConnection(self, self.devices[host], handler.get("device_type", "cisco_ios"))
@@ -0,0 +1,112 @@
+"""
+Compiled SNMP ACL policy shared by the ACL rollout and the Router Checks scripts.
+
+The required sources of every ACL are indexed once in a hash set (exact host
+entries) and in a sorted array of integers (network and wildcard entries), so
+the ACEs of a device are evaluated in a single pass, no matter how many hosts
+the policy requires.
+"""
+from bisect import bisect_left, bisect_right
+from ipaddress import IPv4Address
+
+class AclPolicy:
+    def __init__(self, required_sources):
+        """
+        Parameters
+        ----------
+        required_sources : dict
+            Dictionary in the format {"acl name": [source IPs]} with the
+            hosts that must be permitted by every ACL.
+        """
+        self.required_sources = {name: list(dict.fromkeys(hosts)) for name, hosts in required_sources.items()}
+        self.host_index = {name: set(hosts) for name, hosts in self.required_sources.items()}
+        self.address_index = {}
+        self.sorted_addresses = {}
+        for name, hosts in self.required_sources.items():
+            self.address_index[name] = {int(IPv4Address(host)): host for host in hosts}
+            self.sorted_addresses[name] = sorted(self.address_index[name])
+
+
+    @classmethod
+    def from_config_files(cls, *file_names):
+        """
+        This function builds the policy from the configuration files
+        that are pushed to the devices (ro.txt and rw.txt).
+
+        Parameters
+        ----------
+        file_names : str
+            Location of the configuration files.
+
+        Returns
+        -------
+        policy : AclPolicy
+            Policy that requires every host permitted in the files.
+        """
+        required_sources = {}
+        for file_name in file_names:
+            acl_name = None
+            with open(file_name, encoding="UTF-8") as config_file:
+                for line in config_file:
+                    words = line.split()
+                    if len(words) == 4 and words[0].lower() == "ip" and words[1].lower() == "access-list":
+                        acl_name = words[3]
+                        required_sources.setdefault(acl_name, [])
+                    elif acl_name and len(words) == 2 and words[0] == "permit" and words[1] != "any":
+                        required_sources[acl_name].append(words[1])
+        return cls(required_sources)
+
+
+    def _covered_sources(self, acl_name, ace):
+        """
+        This function returns the required hosts that are permitted
+        by one access control entry.
+        """
+        if ace.get("src_any"):
+            return self.required_sources[acl_name]
+        src_host = ace.get("src_host")
+        if src_host:
+            return [src_host] if src_host in self.host_index[acl_name] else []
+        src_network = ace.get("src_network")
+        if not src_network:
+            return []
+        wildcard = int(IPv4Address(ace.get("src_wildcard") or "0.0.0.0"))
+        network = int(IPv4Address(src_network)) & ~wildcard
+        addresses = self.sorted_addresses[acl_name]
+        #contiguous wildcards are a prefix, the covered hosts are a slice of the sorted array
+        if wildcard & (wildcard + 1) == 0:
+            first, last = bisect_left(addresses, network), bisect_right(addresses, network | wildcard)
+            covered = addresses[first:last]
+        else:
+            covered = [address for address in addresses if address & ~wildcard == network]
+        return [self.address_index[acl_name][address] for address in covered]
+
+
+    def missing_sources(self, current_aces):
+        """
+        This function compares the ACEs configured on a device against
+        the policy.
+
+        Parameters
+        ----------
+        current_aces : List
+            List that contains the current access control entries, as
+            parsed by TextFSM from "show ip access-lists".
+
+        Returns
+        -------
+        missing : dict
+            Dictionary in the format {"acl name": [missing source IPs]}. The
+            IPs keep the order in which the policy defines them.
+        """
+        covered = {name: set() for name in self.required_sources}
+        for ace in current_aces or []:
+            if not isinstance(ace, dict):
+                continue
+            acl_name = ace.get("acl_name")
+            if acl_name not in covered or ace.get("action", "permit") != "permit":
+                continue
+            covered[acl_name].update(self._covered_sources(acl_name, ace))
+        return {name: [host for host in hosts if host not in covered[name]]
+                for name, hosts in self.required_sources.items()}
+
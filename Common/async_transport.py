@@ -0,0 +1,209 @@
+"""
+asyncio SSH transport built on asyncssh, an alternative to netmiko's sessions.
+
+Every netmiko session is a paramiko transport with its own thread, so a few
+dozen sessions are the practical limit of a process. Here all the sessions
+share one event loop that runs in a background thread, a session is a
+coroutine and a socket, and one process can keep 1,000+ devices connected.
+
+AsyncSshConnection has the methods of a netmiko connection that the tools use
+(send_command, send_config_set, save_config, disconnect), so DeviceSession uses
+it as a drop-in replacement when the asyncssh transport is selected
+(device_session.use_transport), and the scripts keep their thread pools. Code
+that runs in an event loop can use IosShell directly, or collect() to run the
+same commands on many devices at once.
+
+asyncssh is only needed when this transport is used.
+"""
+import asyncio
+from re import escape, search, sub
+from threading import Lock, Thread
+from netmiko.exceptions import NetMikoAuthenticationException, NetmikoTimeoutException
+
+#prompt of the exec and config modes, e.g. "router1>", "router1#", "router1(config-if)#"
+PROMPT_PATTERN = r"(?m)^(?P<prompt>[\w.\-@/:]+)(?:\([\w.\-]+\))?[>#]\s*$"
+event_loop = None
+event_loop_lock = Lock()
+
+def shared_event_loop():
+    """
+    This function returns the event loop of the transport, it is started
+    in a daemon thread the first time it is needed.
+    """
+    global event_loop
+    with event_loop_lock:
+        if event_loop is None:
+            event_loop = asyncio.new_event_loop()
+            Thread(target=event_loop.run_forever, name="asyncssh transport", daemon=True).start()
+    return event_loop
+
+
+def run(coroutine):
+    """
+    This function runs a coroutine in the event loop of the transport and
+    waits for its result, it is called from the worker threads of the scripts.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, shared_event_loop()).result()
+
+
+class IosShell:
+    """
+    Interactive shell on an IOS device. The output of a command is read
+    until the prompt comes back, and the echo of the command and the prompt
+    are removed, as netmiko does.
+    """
+
+    def __init__(self, handler):
+        """
+        Parameters
+        ----------
+        handler : dict
+            Netmiko connection parameters (host, username, password, and
+            optionally port, conn_timeout and read_timeout_override).
+        """
+        self.handler = handler
+        self.host = handler["host"]
+        self.connection = None
+        self.process = None
+        self.base_prompt = None
+        self.read_timeout = handler.get("read_timeout_override") or 10
+
+    async def connect(self):
+        #imported here, only the runs that select this transport depend on it
+        import asyncssh
+        try:
+            self.connection = await asyncssh.connect(
+                self.host, port=self.handler.get("port", 22), username=self.handler["username"],
+                password=self.handler["password"], known_hosts=None,
+                connect_timeout=self.handler.get("conn_timeout", 10))
+            self.process = await self.connection.create_process(term_type="vt100", term_size=(511, 24))
+        except asyncssh.PermissionDenied as e:
+            raise NetMikoAuthenticationException(f"Authentication to device failed: {self.host}") from e
+        except (OSError, asyncio.TimeoutError, asyncssh.Error) as e:
+            await self.close()
+            raise NetmikoTimeoutException(f"TCP connection to device failed: {self.host}: {e}") from e
+        #the session is closed if the device logs in but does not behave as an IOS shell
+        try:
+            prompt = search(PROMPT_PATTERN, await self._read_until_prompt())
+            if prompt is None:
+                raise NetmikoTimeoutException(f"No prompt was detected on {self.host}")
+            self.base_prompt = prompt["prompt"]
+            await self.send_command("terminal length 0")
+            await self.send_command("terminal width 511")
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def _read_until_prompt(self, read_timeout=None):
+        """
+        This function reads the output of the shell until a prompt is received.
+        """
+        pattern = PROMPT_PATTERN if self.base_prompt is None else rf"(?m)^{escape(self.base_prompt)}(?:\([\w.\-]+\))?[>#]\s*$"
+        output = ""
+        try:
+            while not search(pattern, output[-300:]):
+                received = await asyncio.wait_for(self.process.stdout.read(65536), read_timeout or self.read_timeout)
+                if not received:
+                    raise NetmikoTimeoutException(f"The session to {self.host} was closed by the device")
+                output += received
+        except asyncio.TimeoutError as e:
+            raise NetmikoTimeoutException(f"Pattern not detected: {pattern!r} in output of {self.host}") from e
+        return output
+
+
+    async def send_command(self, command, read_timeout=None, **kwargs):
+        """
+        This function runs a command and returns its raw output.
+        """
+        self.process.stdin.write(command + "\n")
+        #line endings are normalized as netmiko does, devices also send \r\r\n and \n\r
+        output = sub(r"\r\r\n|\r\n|\n\r", "\n", await self._read_until_prompt(read_timeout))
+        lines = output.split("\n")
+        #the first line is the echo of the command, the last one the prompt
+        if lines and command.strip() in lines[0]:
+            lines = lines[1:]
+        return sub(r"\n+$", "", "\n".join(lines[:-1]))
+
+    async def send_config_set(self, config_commands, **kwargs):
+        """
+        This function enters configuration mode, sends the commands and
+        returns to exec mode.
+        """
+        output = [await self.send_command("configure terminal")]
+        for command in config_commands:
+            output.append(await self.send_command(command))
+        output.append(await self.send_command("end"))
+        return "\n".join(output)
+
+    async def save_config(self, cmd="write mem", **kwargs):
+        return await self.send_command(cmd, read_timeout=60)
+
+    async def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            await self.connection.wait_closed()
+            self.connection = self.process = None
+
+
+class AsyncSshConnection:
+    """
+    Blocking facade of an IosShell with the methods of a netmiko connection,
+    every call runs in the shared event loop.
+    """
+
+    def __init__(self, handler):
+        self.shell = IosShell(handler)
+        try:
+            run(self.shell.connect())
+        except BaseException:
+            #connect closes the session it opened, this covers an interrupted wait
+            run(self.shell.close())
+            raise
+
+    def send_command(self, command, **kwargs):
+        return run(self.shell.send_command(command, **kwargs))
+
+    def send_config_set(self, config_commands, **kwargs):
+        return run(self.shell.send_config_set(config_commands, **kwargs))
+
+    def save_config(self, *args, **kwargs):
+        return run(self.shell.save_config(*args, **kwargs))
+
+    def disconnect(self):
+        run(self.shell.close())
+
+
+async def collect(handlers, commands, limit=1000):
+    """
+    This function runs the same commands on many devices at the same time.
+
+    Parameters
+    ----------
+    handlers : list
+        Netmiko connection parameters of every device.
+    commands : list
+        Commands sent to every device.
+    limit : int
+        Devices connected at the same time.
+
+    Returns
+    -------
+    results : dict
+        {host: {command: raw output}}, or {host: exception} if the device failed.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def collect_device(handler):
+        async with semaphore:
+            shell = IosShell(handler)
+            try:
+                await shell.connect()
+                return {command: await shell.send_command(command) for command in commands}
+            except Exception as e:
+                return e
+            finally:
+                await shell.close()
+
+    outputs = await asyncio.gather(*(collect_device(handler) for handler in handlers))
+    return {handler["host"]: output for handler, output in zip(handlers, outputs)}
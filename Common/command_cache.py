@@ -0,0 +1,146 @@
+"""
+Record/replay cache of raw command output.
+
+The raw output of every command is stored by (host, command) with the time it
+was captured, and it is parsed locally with the same TextFSM and TTP templates
+netmiko uses, so the validators can be rerun, tuned or benchmarked without
+connecting to the devices. The cache works in four modes:
+
+    live    the commands are sent to the device, nothing is stored
+    record  the commands are sent to the device and their output is stored
+    replay  the output is read from the cache, the device is never contacted
+    auto    the cached output is used if it is younger than the TTL, otherwise
+            the command is sent to the device and the output is stored
+"""
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from time import time
+from device_session import DeviceSession, napalm_environment, parse_output
+
+DEFAULT_CACHE = Path(__file__).resolve().parent / "command_cache.db"
+CACHE_MODES = ("live", "record", "replay", "auto")
+
+class CacheMiss(Exception):
+    """Raised in replay mode when a command was never captured for a device."""
+
+
+class CommandCache:
+    def __init__(self, file_name=DEFAULT_CACHE, mode="auto", ttl=900):
+        """
+        Parameters
+        ----------
+        file_name : str
+            Location of the SQLite database, it is created if needed.
+        mode : str
+            One of CACHE_MODES.
+        ttl : int
+            Seconds a capture is used by the auto mode.
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode}, use one of {', '.join(CACHE_MODES)}")
+        self.mode = mode
+        self.ttl = ttl
+        self.lock = Lock()
+        self.connection = sqlite3.connect(str(file_name), check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS captures (
+                host TEXT, command TEXT, output TEXT, captured_at REAL,
+                PRIMARY KEY (host, command))""")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def store(self, host, command, output):
+        """
+        This function stores the raw output of a command.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?)",
+                                    (host, command, output, time()))
+
+
+    def load(self, host, command, max_age=None):
+        """
+        This function returns the stored output of a command, or None if
+        it was not captured or it is older than max_age seconds.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT output, captured_at FROM captures WHERE host = ? AND command = ?",
+                                          (host, command)).fetchone()
+        if row is None or (max_age is not None and time() - row[1] > max_age):
+            return None
+        return row[0]
+
+
+    def session(self, handler):
+        """
+        This function returns a session to the device described by
+        handler that goes through the cache.
+        """
+        return CachedSession(self, handler)
+
+
+class CachedSession:
+    """
+    Session with the same send_command interface as DeviceSession. The SSH
+    session is only opened when a command has to be sent to the device, in
+    replay mode (or when every command is cached) it is never opened.
+    """
+
+    def __init__(self, cache, handler):
+        self.cache = cache
+        self.handler = handler
+        self.host = handler["host"]
+        self.device_session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.device_session is not None:
+            self.device_session.close()
+            self.device_session = None
+
+
+    def _raw_output(self, command):
+        """
+        This function returns the raw output of a command, from the cache
+        or from the device depending on the cache mode.
+        """
+        mode = self.cache.mode
+        if mode in ("replay", "auto"):
+            output = self.cache.load(self.host, command, None if mode == "replay" else self.cache.ttl)
+            if output is not None:
+                return output
+            if mode == "replay":
+                raise CacheMiss(f"No capture of '{command}' for {self.host}")
+        if self.device_session is None:
+            self.device_session = DeviceSession(self.handler).__enter__()
+        output = self.device_session.send_command(command)
+        if mode != "live":
+            self.cache.store(self.host, command, output)
+        return output
+
+
+    def send_command(self, command, use_textfsm=False, use_ttp=False, ttp_template=None, **kwargs):
+        """
+        This function returns the output of a command, parsed with TextFSM
+        or TTP like netmiko's send_command does.
+        """
+        output = self._raw_output(command)
+        return parse_output(output, self.handler["device_type"], command, use_textfsm, use_ttp, ttp_template)
+
+
+    def get_environment(self):
+        """
+        This function returns the NAPALM environment facts, the commands
+        NAPALM runs are cached like any other command.
+        """
+        return napalm_environment(self.handler, self)
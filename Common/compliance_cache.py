@@ -0,0 +1,102 @@
+"""
+Cache of the configuration compliance results of the audited routers.
+
+The results of the validators that only depend on the configuration (SNMP,
+ACLs, flow exporters, interfaces, routes, AAA servers...) are stored with a
+digest of the router's configuration and a fingerprint of the validators'
+code. A later audit fetches the cheap digest first, and if neither the
+configuration nor the validators changed, it reuses the stored results and
+only runs the operational checks (BGP, BFD, VRRP, environment...) live.
+"""
+import json
+import sqlite3
+from hashlib import sha1
+from pathlib import Path
+from threading import Lock
+from time import time
+
+DEFAULT_CACHE = Path(__file__).resolve().parent / "compliance_cache.db"
+
+def config_digest(config_text):
+    """
+    This function returns the digest of a configuration, or of the line
+    that identifies its last change.
+
+    Parameters
+    ----------
+    config_text : str
+        Running config, or output of "show running-config | include Last configuration change".
+
+    Returns
+    -------
+    digest : str
+        SHA-1 of the non empty lines, None if there are none and the
+        configuration can't be identified.
+    """
+    lines = [line.rstrip() for line in config_text.splitlines() if line.strip()] if isinstance(config_text, str) else []
+    if not lines:
+        return None
+    return sha1("\n".join(lines).encode()).hexdigest()
+
+
+class ComplianceCache:
+    def __init__(self, file_name=DEFAULT_CACHE):
+        """
+        Parameters
+        ----------
+        file_name : str
+            Location of the SQLite database, it is created if needed.
+        """
+        self.lock = Lock()
+        self.connection = sqlite3.connect(str(file_name), check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS compliance (
+                host TEXT PRIMARY KEY, digest TEXT, fingerprint TEXT, results TEXT, sections TEXT, facts TEXT,
+                audited_at REAL)""")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def load(self, host, digest, fingerprint):
+        """
+        This function returns the stored results of a router.
+
+        Parameters
+        ----------
+        host : str
+            IP address of the router.
+        digest : str
+            Digest of its current configuration.
+        fingerprint : str
+            Fingerprint of the current validators.
+
+        Returns
+        -------
+        compliance : dict
+            {"results": {section: result}, "sections": [every section of
+            the audit, in order], "facts": {section: verdict and facts}},
+            None if nothing was stored for this configuration and these validators.
+        """
+        if not digest:
+            return None
+        with self.lock:
+            row = self.connection.execute("SELECT results, sections, facts FROM compliance WHERE host = ? "
+                                          "AND digest = ? AND fingerprint = ?", (host, digest, fingerprint)).fetchone()
+        if row is None:
+            return None
+        return {"results": json.loads(row[0]), "sections": json.loads(row[1]), "facts": json.loads(row[2] or "{}")}
+
+
+    def store(self, host, digest, fingerprint, results, sections, facts=None):
+        """
+        This function stores the compliance results of a router, and the
+        facts of the validators, replacing the ones of its previous configuration.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO compliance (host, digest, fingerprint, results, sections, "
+                                    "facts, audited_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (host, digest, fingerprint, json.dumps(results), json.dumps(sections),
+                                     json.dumps(facts or {}), time()))
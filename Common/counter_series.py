@@ -0,0 +1,184 @@
+"""
+Interface utilization computed from the byte counters of "show interface".
+
+The input_rate and output_rate reported by the device are 5 minute moving
+averages that hide bursts. Here every poll records the raw byte counters of
+each interface, the exact rate between two polls is computed from the deltas,
+and the rates are kept in a fixed size ring buffer (one array of timestamps
+and one per direction), so the memory used per interface does not grow with
+the time the poller runs. Rollups (min/avg/max/p95) over the last minute,
+5 minutes and hour, and the peak since a given time, are computed from it.
+
+    rates = CounterSeries(capacity=720)
+    rates.update(interface_counters(raw_show_interface), time())
+    rates.get("TenGigabitEthernet0/2/0").rollup("5m")
+"""
+from array import array
+from re import search, split
+from time import time
+
+ROLLUP_WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+
+def interface_counters(show_interface):
+    """
+    This function returns the byte counters of every interface.
+
+    Parameters
+    ----------
+    show_interface : str
+        Raw output of the "show interface" command.
+
+    Returns
+    -------
+    counters : dict
+        {interface: (input_bytes, output_bytes)}
+    """
+    counters = {}
+    #every interface starts with a line that is not indented
+    for block in split(r"\n(?=\S)", show_interface):
+        input_bytes = search(r"packets input, (\d+) bytes", block)
+        output_bytes = search(r"packets output, (\d+) bytes", block)
+        if block.strip() and input_bytes and output_bytes:
+            counters[block.split()[0]] = (int(input_bytes.group(1)), int(output_bytes.group(1)))
+    return counters
+
+
+class RateSeries:
+    """
+    Ring buffer of the input and output rates (bits/sec) of one interface.
+    """
+
+    def __init__(self, capacity):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Number of rates kept, the oldest one is overwritten when it is full.
+        """
+        self.capacity = capacity
+        self.times = array("d", [0.0]) * capacity
+        self.input = array("d", [0.0]) * capacity
+        self.output = array("d", [0.0]) * capacity
+        self.count = 0
+        self.head = 0
+        self.last_sample = None
+
+    def add_sample(self, sample_time, input_bytes, output_bytes):
+        """
+        This function records the byte counters read at sample_time and stores
+        the rate since the previous sample. When the counters went backwards
+        (they were cleared or the device reloaded) no rate is stored.
+        """
+        if self.last_sample is not None:
+            last_time, last_input, last_output = self.last_sample
+            elapsed = sample_time - last_time
+            if elapsed > 0 and input_bytes >= last_input and output_bytes >= last_output:
+                self.times[self.head] = sample_time
+                self.input[self.head] = (input_bytes - last_input) * 8 / elapsed
+                self.output[self.head] = (output_bytes - last_output) * 8 / elapsed
+                self.head = (self.head + 1) % self.capacity
+                self.count = min(self.count + 1, self.capacity)
+        self.last_sample = (sample_time, input_bytes, output_bytes)
+
+
+    def latest(self):
+        """
+        This function returns the last (input, output) rate, None if there is
+        only one sample.
+        """
+        if not self.count:
+            return None
+        index = (self.head - 1) % self.capacity
+        return self.input[index], self.output[index]
+
+    def _since(self, since):
+        """
+        This function returns the indexes of the rates measured after since.
+        """
+        return [index % self.capacity for index in range(self.head - self.count, self.head)
+                if self.times[index % self.capacity] > since]
+
+
+    def peak(self, since):
+        """
+        This function returns the highest (input, output) rate measured after
+        since, None if there is none.
+        """
+        indexes = self._since(since)
+        if not indexes:
+            return None
+        return max(self.input[index] for index in indexes), max(self.output[index] for index in indexes)
+
+
+    def rollup(self, window, now=None):
+        """
+        This function summarizes the rates of the last window.
+
+        Parameters
+        ----------
+        window : str
+            One of ROLLUP_WINDOWS.
+        now : float
+            End of the window, the current time by default.
+
+        Returns
+        -------
+        rollup : dict
+            {"input": {"min", "avg", "max", "p95"}, "output": {...}}, None if
+            no rate was measured in the window.
+        """
+        indexes = self._since((now or time()) - ROLLUP_WINDOWS[window])
+        if not indexes:
+            return None
+        rollup = {}
+        for direction, rates in (("input", self.input), ("output", self.output)):
+            values = sorted(rates[index] for index in indexes)
+            rollup[direction] = {"min": values[0], "avg": sum(values) / len(values), "max": values[-1],
+                                 "p95": values[max(0, -(-95 * len(values) // 100) - 1)]}
+        return rollup
+
+
+class CounterSeries:
+    """
+    Rate series of every interface of one device.
+    """
+
+    def __init__(self, capacity=720):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Rates kept per interface, 720 covers an hour polled every 5 seconds.
+        """
+        self.capacity = capacity
+        self.interfaces = {}
+
+    def update(self, counters, sample_time=None):
+        """
+        This function records the counters of a poll.
+
+        Parameters
+        ----------
+        counters : dict
+            Output of interface_counters.
+        sample_time : float
+            Time the counters were read, the current time by default.
+        """
+        sample_time = sample_time or time()
+        for interface, (input_bytes, output_bytes) in counters.items():
+            if interface not in self.interfaces:
+                self.interfaces[interface] = RateSeries(self.capacity)
+            self.interfaces[interface].add_sample(sample_time, input_bytes, output_bytes)
+
+
+    def get(self, interface):
+        return self.interfaces.get(interface)
+
+    def rollups(self, now=None):
+        """
+        This function returns {interface: {window: rollup}} for every window
+        of ROLLUP_WINDOWS.
+        """
+        now = now or time()
+        return {interface: {window: series.rollup(window, now) for window in ROLLUP_WINDOWS}
+                for interface, series in self.interfaces.items()}
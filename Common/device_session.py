@@ -0,0 +1,181 @@
+"""
+Single SSH session per device, shared by every command set that runs against it.
+
+The NAPALM facts (environment) are fetched through the same netmiko connection
+instead of letting NAPALM log in again, so an audit pays for one SSH and AAA
+handshake per device. The session is closed when the with block ends, even if
+one of the commands fails.
+
+The connection, every command and the parsing of its output are timed
+separately by the tracer (see instrumentation.py).
+
+The sessions are netmiko connections by default, use_transport("asyncssh")
+switches every session of the process to the asyncio transport of
+async_transport.py.
+
+The functions in connect_observers are called after every login attempt with
+the host, the seconds it took and the exception if it failed, the adaptive
+scheduler (scheduler.py) tunes its limits with them.
+"""
+from time import perf_counter
+from netmiko import ConnectHandler
+from instrumentation import tracer
+from parser_registry import registry
+
+TRANSPORTS = ("netmiko", "asyncssh")
+#transport used by every DeviceSession of the process
+transport = "netmiko"
+#called with (host, seconds, exception or None) after every login attempt
+connect_observers = []
+
+def use_transport(name):
+    """
+    This function selects the transport of the sessions opened from now on.
+
+    Parameters
+    ----------
+    name : str
+        One of TRANSPORTS.
+    """
+    global transport
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {name}, use one of {', '.join(TRANSPORTS)}")
+    transport = name
+
+
+class DeviceSession:
+    def __init__(self, handler):
+        """
+        Parameters
+        ----------
+        handler : dict
+            Netmiko connection parameters (device_type, host, username, password).
+        """
+        self.handler = handler
+        self.connection = None
+
+    def __enter__(self):
+        started = perf_counter()
+        try:
+            with tracer.span("connect", device=self.handler["host"]):
+                if transport == "asyncssh":
+                    #imported here, asyncssh is only needed when it is selected
+                    from async_transport import AsyncSshConnection
+                    self.connection = AsyncSshConnection(self.handler)
+                else:
+                    self.connection = ConnectHandler(**self.handler)
+        except Exception as e:
+            self._notify(perf_counter() - started, e)
+            raise
+        self._notify(perf_counter() - started, None)
+        return self
+
+    def _notify(self, seconds, error):
+        for observer in list(connect_observers):
+            observer(self.handler["host"], seconds, error)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.disconnect()
+            self.connection = None
+
+
+    def send_command(self, command, use_textfsm=False, use_ttp=False, ttp_template=None, **kwargs):
+        """
+        This function runs a command on the open session, it receives the
+        same arguments as netmiko's send_command. The output is parsed after
+        it is received so the command and the parsing are timed separately.
+        """
+        with tracer.span("command", command, self.handler["host"]):
+            output = self.connection.send_command(command, **kwargs)
+        return parse_output(output, self.handler["device_type"], command, use_textfsm, use_ttp, ttp_template)
+
+
+    def send_config_set(self, config_commands, **kwargs):
+        """
+        This function sends configuration commands in a single config session.
+        """
+        with tracer.span("config", "send_config_set", self.handler["host"]):
+            return self.connection.send_config_set(config_commands, **kwargs)
+
+
+    def save_config(self, *args, **kwargs):
+        with tracer.span("config", "save_config", self.handler["host"]):
+            return self.connection.save_config(*args, **kwargs)
+
+
+    def get_environment(self):
+        """
+        This function returns the NAPALM environment facts of the device,
+        using the open netmiko session as NAPALM's transport.
+
+        Returns
+        -------
+        environment : dict
+            Output of NAPALM's get_environment.
+        """
+        with tracer.span("command", "napalm get_environment", self.handler["host"]):
+            return napalm_environment(self.handler, self.connection)
+
+
+def parse_output(output, device_type, command, use_textfsm=False, use_ttp=False, ttp_template=None):
+    """
+    This function parses the raw output of a command with TTP or TextFSM,
+    the same way netmiko's send_command does, with the parsers compiled once
+    per process by the parser registry. If the output can't be parsed, the
+    raw output is returned.
+
+    Parameters
+    ----------
+    output : str
+        Raw output of the command.
+    device_type : str
+        Netmiko device type, used to find the TextFSM template.
+    command : str
+        Command that produced the output.
+    use_textfsm : bool
+        Parse the output with the TextFSM template of the command.
+    use_ttp : bool
+        Parse the output with ttp_template.
+    ttp_template : str
+        TTP template.
+
+    Returns
+    -------
+    parsed_output : List, str
+        Parsed output.
+    """
+    if (use_ttp and ttp_template) or use_textfsm:
+        with tracer.span("parse", command):
+            return registry.parse(output, device_type, command, use_textfsm, use_ttp, ttp_template)
+    return output
+
+
+def napalm_environment(handler, transport):
+    """
+    This function returns the NAPALM environment facts of a device, sending
+    the commands through an object that has netmiko's send_command method.
+
+    Parameters
+    ----------
+    handler : dict
+        Netmiko connection parameters of the device.
+    transport : object
+        Open netmiko connection, or any object with the same send_command.
+
+    Returns
+    -------
+    environment : dict
+        Output of NAPALM's get_environment.
+    """
+    #imported here, only the scripts that need NAPALM facts depend on it
+    from napalm import get_network_driver
+    driver_ios = get_network_driver("ios")
+    device = driver_ios(hostname=handler["host"], username=handler["username"], password=handler["password"])
+    #NAPALM's IOS driver sends every command through its netmiko connection,
+    #reusing ours avoids a second login. The driver is not closed, the session owns it.
+    device.device = transport
+    return device.get_environment()
@@ -0,0 +1,396 @@
+"""
+Store of the facts and verdicts found by the checks, per device and run.
+
+The reports of the tools are written to be read (txt, xlsx...), so answering a
+question about the fleet ("which routers are missing an ISE server", "which
+sites have BFD down") meant running the checks again. The tools can also record
+what they found in this SQLite database, one row per device and check with the
+verdict of the check (pass, fail, info or error) and its facts as JSON:
+
+    device: 10.1.1.1   check: ise_results   verdict: fail   value: {"missing": ["10.81.89.123"]}
+
+Every run keeps its rows (facts), and the latest row of every device and check
+is also kept in its own table (latest), so the questions about the current
+state of the fleet don't scan the history. A device whose checks could not be
+completed only has its error in latest, the facts of its previous checks are
+not current anymore and they are removed from latest (not from the history).
+The rows are buffered and inserted in batches, one transaction per batch, to
+keep up with a fleet run.
+
+The questions are answered from the command line without contacting any device:
+
+    python fact_store.py latest --check bfd_results --verdict fail
+    python fact_store.py missing ise_results 10.81.89.123
+    python fact_store.py sites --check bfd_results --verdict fail
+    python fact_store.py history 10.1.1.1 --check bgp_results
+    python fact_store.py checks
+    python fact_store.py runs
+"""
+import json
+import sqlite3
+from argparse import ArgumentParser
+from datetime import datetime
+from ipaddress import ip_network
+from pathlib import Path
+from threading import Lock
+from time import monotonic, perf_counter, time
+
+DEFAULT_STORE = Path(__file__).resolve().parent / "facts.db"
+VERDICTS = ("pass", "fail", "info", "error")
+
+def device_site(device, prefix_length=24):
+    """
+    This function returns the site of a device, its /24 by default, or its
+    name if it is not an IP address. It is the same as scheduler.subnet_site,
+    the store does not import the SSH modules so it can be queried anywhere.
+    """
+    try:
+        return str(ip_network(f"{device}/{prefix_length}", strict=False))
+    except ValueError:
+        return device
+
+
+def error_facts(message):
+    """
+    This function returns the facts of a device whose checks could not be completed.
+    """
+    return {"error": {"verdict": "error", "value": {"message": message.strip()}}}
+
+
+class FactStore:
+    def __init__(self, file_name=DEFAULT_STORE, batch_size=500, flush_interval=2.0, site_of=device_site):
+        """
+        Parameters
+        ----------
+        file_name : str
+            Location of the SQLite database, it is created if needed.
+        batch_size : int
+            Rows buffered before they are inserted.
+        flush_interval : float
+            Maximum number of seconds a row stays in the buffer.
+        site_of : function
+            Returns the site of a device, its /24 by default.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.site_of = site_of
+        self.buffer = []
+        self.last_flush = monotonic()
+        self.lock = Lock()
+        self.connection = sqlite3.connect(str(file_name), check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT, tool TEXT, started_at REAL, finished_at REAL,
+                devices INTEGER)""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS facts (
+                run_id INTEGER, device TEXT, site TEXT, check_name TEXT, verdict TEXT, value TEXT,
+                recorded_at REAL)""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS latest (
+                device TEXT, check_name TEXT, run_id INTEGER, site TEXT, verdict TEXT, value TEXT,
+                recorded_at REAL, PRIMARY KEY (device, check_name))""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS facts_device ON facts (device, check_name, recorded_at)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS facts_check ON facts (check_name, verdict, recorded_at)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS facts_time ON facts (recorded_at)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS latest_check ON latest (check_name, verdict, site)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.connection.close()
+
+
+    def start_run(self, tool):
+        """
+        This function starts a run of a tool and returns its id.
+        """
+        with self.lock, self.connection:
+            return self.connection.execute("INSERT INTO runs (tool, started_at, devices) VALUES (?, ?, 0)",
+                                           (tool, time())).lastrowid
+
+    def finish_run(self, run_id):
+        """
+        This function inserts the buffered rows and records the end of a run.
+        """
+        with self.lock:
+            self._flush()
+            with self.connection:
+                self.connection.execute("""UPDATE runs SET finished_at = ?, devices = (
+                    SELECT COUNT(DISTINCT device) FROM facts WHERE run_id = ?) WHERE run_id = ?""",
+                                        (time(), run_id, run_id))
+
+
+    def record(self, run_id, device, facts):
+        """
+        This function records the facts of a device, they are inserted with
+        the next batch.
+
+        Parameters
+        ----------
+        run_id : int
+            Id returned by start_run.
+        device : str
+            IP address or name of the device.
+        facts : dict
+            {check: {"verdict": one of VERDICTS, "value": JSON serializable facts}}
+        """
+        recorded_at = time()
+        site = self.site_of(device)
+        rows = [(run_id, device, site, check, fact["verdict"], json.dumps(fact.get("value"), default=str), recorded_at)
+                for check, fact in facts.items()]
+        with self.lock:
+            self.buffer.extend(rows)
+            if len(self.buffer) >= self.batch_size or monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            #{device: (time of its last record, True if its checks could not be completed)}
+            last_records = {}
+            for _, device, _, check, _, _, recorded_at in self.buffer:
+                if recorded_at >= last_records.get(device, (0, False))[0]:
+                    last_records[device] = (recorded_at, check == "error")
+            with self.connection:
+                self.connection.executemany("INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?, ?)", self.buffer)
+                self.connection.executemany(
+                    """INSERT OR REPLACE INTO latest (run_id, device, site, check_name, verdict, value, recorded_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""", self.buffer)
+                #an error replaces every older fact of the device, and new facts replace an older error
+                self.connection.executemany(
+                    "DELETE FROM latest WHERE device = ? AND recorded_at < ? AND (? OR check_name = 'error')",
+                    [(device, recorded_at, failed) for device, (recorded_at, failed) in last_records.items()])
+            self.buffer = []
+        self.last_flush = monotonic()
+
+
+    def query(self, sql, parameters=()):
+        """
+        This function runs a query and returns its rows as dictionaries,
+        with the JSON facts decoded.
+        """
+        with self.lock:
+            rows = self.connection.execute(sql, parameters).fetchall()
+        rows = [dict(row) for row in rows]
+        for row in rows:
+            if isinstance(row.get("value"), str):
+                row["value"] = json.loads(row["value"])
+        return rows
+
+    @staticmethod
+    def _filters(conditions):
+        """
+        This function returns the WHERE clause and the parameters of the
+        conditions that have a value, {column condition: value}.
+        """
+        conditions = {condition: value for condition, value in conditions.items() if value is not None}
+        clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return clause, tuple(conditions.values())
+
+
+    def latest(self, check=None, verdict=None, device=None, site=None, max_age=None):
+        """
+        This function returns the latest facts of every device and check,
+        only the error of a device whose last checks could not be completed.
+
+        Parameters
+        ----------
+        check : str
+        verdict : str
+        device : str
+        site : str
+            If given, only the facts with these values are returned.
+        max_age : float
+            If given, only the facts recorded in the last max_age seconds are returned.
+
+        Returns
+        -------
+        facts : List
+            List of dictionaries (device, check_name, site, verdict, value,
+            run_id, recorded_at).
+        """
+        clause, parameters = self._filters({"check_name = ?": check, "verdict = ?": verdict, "device = ?": device,
+                                            "site = ?": site,
+                                            "recorded_at >= ?": time() - max_age if max_age is not None else None})
+        return self.query(f"SELECT * FROM latest{clause} ORDER BY device, check_name", parameters)
+
+
+    def missing(self, check, item, field="missing", max_age=None):
+        """
+        This function returns the latest facts of a check that list an item
+        in one of their fields, e.g. the routers whose ise_results list an
+        ISE server as missing.
+
+        Parameters
+        ----------
+        check : str
+        item : str
+            Value searched in the list.
+        field : str
+            Field of the facts that contains the list.
+        max_age : float
+            If given, only the facts recorded in the last max_age seconds are returned.
+
+        Returns
+        -------
+        facts : List
+            Same as latest.
+        """
+        clause, parameters = self._filters({"latest.check_name = ?": check, "items.value = ?": item,
+                                            "latest.recorded_at >= ?": time() - max_age if max_age is not None else None})
+        return self.query(f"""SELECT DISTINCT latest.* FROM latest, json_each(latest.value, ?) AS items{clause}
+                          ORDER BY latest.device""", (f"$.{field}", *parameters))
+
+
+    def sites(self, check, verdict="fail", max_age=None):
+        """
+        This function returns the sites that have devices with a verdict for a check.
+
+        Returns
+        -------
+        sites : List
+            List of dictionaries (site, devices, device_list), the sites with
+            the most devices first.
+        """
+        clause, parameters = self._filters({"check_name = ?": check, "verdict = ?": verdict,
+                                            "recorded_at >= ?": time() - max_age if max_age is not None else None})
+        return self.query(f"""SELECT site, COUNT(*) AS devices, GROUP_CONCAT(device, ' ') AS device_list
+                          FROM latest{clause} GROUP BY site ORDER BY devices DESC, site""", parameters)
+
+
+    def history(self, device, check=None, since=None):
+        """
+        This function returns every fact recorded for a device, the oldest first.
+
+        Parameters
+        ----------
+        device : str
+        check : str
+            If given, only the facts of this check are returned.
+        since : float
+            If given, only the facts recorded after this time are returned.
+        """
+        clause, parameters = self._filters({"facts.device = ?": device, "facts.check_name = ?": check,
+                                            "facts.recorded_at >= ?": since})
+        return self.query(f"""SELECT facts.*, runs.tool FROM facts LEFT JOIN runs ON runs.run_id = facts.run_id{clause}
+                          ORDER BY facts.recorded_at, facts.check_name""", parameters)
+
+
+    def checks(self):
+        """
+        This function returns the number of devices of every check and verdict in the latest facts.
+        """
+        return self.query("""SELECT check_name, verdict, COUNT(*) AS devices FROM latest
+                          GROUP BY check_name, verdict ORDER BY check_name, verdict""")
+
+
+    def runs(self, limit=20):
+        """
+        This function returns the last runs, the newest first.
+        """
+        return self.query("SELECT * FROM runs ORDER BY run_id DESC LIMIT ?", (limit,))
+
+
+class FactRun:
+    """
+    Run of a tool that records its facts in a store, it opens the store and
+    closes it when the run is closed.
+
+        with FactRun("router_checks") as fact_run:
+            fact_run.record("10.1.1.1", router.fact_dict)
+    """
+
+    def __init__(self, tool, file_name=DEFAULT_STORE, **options):
+        self.store = FactStore(file_name, **options)
+        self.run_id = self.store.start_run(tool)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, device, facts):
+        self.store.record(self.run_id, device, facts)
+
+    def close(self):
+        self.store.finish_run(self.run_id)
+        self.store.close()
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp else ""
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Answers questions about the fleet from the recorded facts, "
+                                        "without contacting the devices")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="location of the fact store")
+    parser.add_argument("--json", action="store_true", help="print the rows as JSON Lines")
+    queries = parser.add_subparsers(dest="query", required=True)
+    latest_parser = queries.add_parser("latest", help="latest facts of every device and check")
+    latest_parser.add_argument("--check", help="only this check (e.g. bfd_results)")
+    latest_parser.add_argument("--verdict", choices=VERDICTS)
+    latest_parser.add_argument("--device")
+    latest_parser.add_argument("--site", help="only the devices of this site (e.g. 10.1.1.0/24)")
+    missing_parser = queries.add_parser("missing", help="devices whose latest facts of a check list an item as missing")
+    missing_parser.add_argument("check", help="e.g. ise_results, snmp_results")
+    missing_parser.add_argument("item", help="e.g. the IP address of an ISE server")
+    missing_parser.add_argument("--field", default="missing", help="field of the facts that lists the items "
+                                                                   "(default: missing)")
+    sites_parser = queries.add_parser("sites", help="sites with devices that have a verdict for a check")
+    sites_parser.add_argument("--check", required=True)
+    sites_parser.add_argument("--verdict", choices=VERDICTS, default="fail")
+    history_parser = queries.add_parser("history", help="every fact recorded for a device")
+    history_parser.add_argument("device")
+    history_parser.add_argument("--check")
+    history_parser.add_argument("--days", type=float, help="only the facts of the last DAYS days")
+    queries.add_parser("checks", help="devices per check and verdict in the latest facts")
+    runs_parser = queries.add_parser("runs", help="last runs recorded")
+    runs_parser.add_argument("--limit", type=int, default=20)
+    for query_parser in (latest_parser, missing_parser, sites_parser):
+        query_parser.add_argument("--max-age", type=float, help="only the facts recorded in the last MAX_AGE hours")
+    args = parser.parse_args()
+
+    started = perf_counter()
+    with FactStore(args.store) as store:
+        max_age = args.max_age * 3600 if getattr(args, "max_age", None) is not None else None
+        if args.query == "latest":
+            rows = store.latest(args.check, args.verdict, args.device, args.site, max_age)
+        elif args.query == "missing":
+            rows = store.missing(args.check, args.item, args.field, max_age)
+        elif args.query == "sites":
+            rows = store.sites(args.check, args.verdict, max_age)
+        elif args.query == "history":
+            rows = store.history(args.device, args.check, time() - args.days * 86400 if args.days else None)
+        elif args.query == "checks":
+            rows = store.checks()
+        else:
+            rows = store.runs(args.limit)
+    elapsed = (perf_counter() - started) * 1000
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+        elif args.query == "sites":
+            print(f"{row['site']:<20} {row['devices']:>5} {row['device_list']}")
+        elif args.query == "checks":
+            print(f"{row['check_name']:<30} {row['verdict']:<6} {row['devices']:>6}")
+        elif args.query == "runs":
+            print(f"{row['run_id']:>6} {row['tool']:<16} {format_time(row['started_at']):<17} "
+                  f"{format_time(row['finished_at']):<17} {row['devices'] or 0:>6} devices")
+        else:
+            print(f"{format_time(row['recorded_at']):<17} {row['device']:<16} {row['check_name']:<24} "
+                  f"{row['verdict']:<6} {json.dumps(row['value'])}")
+    if not args.json:
+        print(f"{len(rows)} rows in {elapsed:.1f} ms")
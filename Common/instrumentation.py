@@ -0,0 +1,198 @@
+"""
+Per-phase timing instrumentation shared by the network tools.
+
+Every timed block is recorded as a span with the device, the phase (connect,
+command, parse, config, validate, report) and a name (the command or the
+function). When the tracer is enabled, the spans can be streamed to a JSON
+Lines trace, exported to a Prometheus textfile, and summarized at the end of
+the run with the slowest devices and commands. When it is disabled (the
+default) the spans cost a function call and nothing is recorded.
+
+    from instrumentation import tracer
+    tracer.enable("run.jsonl")
+    with tracer.device("10.1.1.1"), tracer.span("command", "show ver"):
+        ...
+    tracer.close()
+"""
+import json
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, local
+from time import perf_counter, time
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.lock = Lock()
+        self.context = local()
+        self.trace_file = None
+        self.metrics_file = None
+
+    def enable(self, trace_file=None, metrics_file=None):
+        """
+        This function starts recording spans.
+
+        Parameters
+        ----------
+        trace_file : str
+            If given, every span is appended to this JSON Lines file.
+        metrics_file : str
+            If given, the Prometheus textfile is written here by close().
+        """
+        self.enabled = True
+        self.metrics_file = metrics_file
+        if trace_file:
+            self.trace_file = open(trace_file, "a", encoding="UTF-8")
+
+    def close(self):
+        """
+        This function writes the Prometheus textfile and closes the trace.
+        """
+        if self.metrics_file:
+            self.write_prometheus(self.metrics_file)
+        with self.lock:
+            if self.trace_file:
+                self.trace_file.close()
+                self.trace_file = None
+
+
+    @contextmanager
+    def device(self, name):
+        """
+        This function sets the device the spans of the current thread belong to.
+        """
+        previous = getattr(self.context, "device", None)
+        self.context.device = name
+        try:
+            yield
+        finally:
+            self.context.device = previous
+
+    @contextmanager
+    def span(self, phase, name=None, device=None):
+        """
+        This function times the block it wraps.
+
+        Parameters
+        ----------
+        phase : str
+            connect, command, parse, config, validate or report.
+        name : str
+            Command or function being timed.
+        device : str
+            Device the span belongs to, the current device of the thread by default.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, name, device or getattr(self.context, "device", None), perf_counter() - start)
+
+    def record(self, phase, name, device, seconds):
+        span = {"time": round(time(), 3), "device": device, "phase": phase, "name": name,
+                "seconds": round(seconds, 6)}
+        with self.lock:
+            self.spans.append(span)
+            if self.trace_file:
+                self.trace_file.write(json.dumps(span) + "\n")
+
+
+    def traced(self, phase):
+        """
+        This function returns a decorator that times every call of a function.
+        For methods, the device is taken from the ip_address of the instance.
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                device = getattr(args[0], "ip_address", None) if args else None
+                with self.span(phase, function.__name__, device):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def instrument_methods(self, cls, phase, prefixes=(), suffixes=()):
+        """
+        This function times the methods defined in a class whose name starts
+        with one of the prefixes or ends with one of the suffixes.
+        """
+        for name, attribute in list(vars(cls).items()):
+            if callable(attribute) and (name.startswith(tuple(prefixes)) or name.endswith(tuple(suffixes))):
+                setattr(cls, name, self.traced(phase)(attribute))
+
+
+    def phase_totals(self):
+        """
+        This function returns {phase: [count, seconds]}.
+        """
+        totals = defaultdict(lambda: [0, 0.0])
+        with self.lock:
+            for span in self.spans:
+                totals[span["phase"]][0] += 1
+                totals[span["phase"]][1] += span["seconds"]
+        return dict(totals)
+
+    def write_prometheus(self, file_name):
+        """
+        This function writes the totals per phase and per command in the
+        Prometheus textfile format. The file is replaced atomically so the
+        node exporter never reads half of it.
+        """
+        commands = defaultdict(lambda: [0, 0.0])
+        with self.lock:
+            for span in self.spans:
+                if span["phase"] in ("command", "parse"):
+                    key = (span["phase"], span["name"])
+                    commands[key][0] += 1
+                    commands[key][1] += span["seconds"]
+        lines = ["# HELP network_tools_phase_seconds Time spent in each phase of the run.",
+                 "# TYPE network_tools_phase_seconds summary"]
+        for phase, (count, seconds) in sorted(self.phase_totals().items()):
+            lines.append(f'network_tools_phase_seconds_sum{{phase="{phase}"}} {seconds:.6f}')
+            lines.append(f'network_tools_phase_seconds_count{{phase="{phase}"}} {count}')
+        lines += ["# HELP network_tools_command_seconds Time spent running and parsing each command.",
+                  "# TYPE network_tools_command_seconds summary"]
+        for (phase, name), (count, seconds) in sorted(commands.items()):
+            label = str(name).replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'network_tools_command_seconds_sum{{phase="{phase}",command="{label}"}} {seconds:.6f}')
+            lines.append(f'network_tools_command_seconds_count{{phase="{phase}",command="{label}"}} {count}')
+        temporary_file = f"{file_name}.tmp"
+        with open(temporary_file, "w", encoding="UTF-8") as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+        os.replace(temporary_file, file_name)
+
+    def summary(self, top=5):
+        """
+        This function returns a text summary of the run: the time per phase,
+        the slowest devices and the slowest commands on average.
+        """
+        devices = defaultdict(float)
+        commands = defaultdict(lambda: [0, 0.0])
+        with self.lock:
+            for span in self.spans:
+                devices[span["device"]] += span["seconds"]
+                if span["phase"] == "command":
+                    commands[span["name"]][0] += 1
+                    commands[span["name"]][1] += span["seconds"]
+        lines = ["Time per phase:"]
+        lines += [f"\t{phase}: {seconds:.2f}s in {count} spans"
+                  for phase, (count, seconds) in sorted(self.phase_totals().items(), key=lambda item: -item[1][1])]
+        lines.append("Slowest devices:")
+        lines += [f"\t{device}: {seconds:.2f}s"
+                  for device, seconds in sorted(devices.items(), key=lambda item: -item[1])[:top]]
+        lines.append("Slowest commands (average):")
+        lines += [f"\t{command}: {seconds / count:.3f}s over {count} runs"
+                  for command, (count, seconds) in sorted(commands.items(), key=lambda item: -item[1][1] / item[1][0])[:top]]
+        return "\n".join(lines)
+
+
+#process wide tracer used by every tool
+tracer = Tracer()
@@ -0,0 +1,129 @@
+"""
+Incremental reader of the device log.
+
+Instead of filtering and tailing the whole log buffer on every poll, the
+cursor remembers the last entry it read (its sequence number when the device
+runs with "service sequence-numbers", its timestamp otherwise) and asks the
+device for the log starting at that entry with "show logging | begin". Only
+the entries written since the previous poll are sent and parsed. The BGP and
+line protocol events are kept in a bounded in-memory store, so everything
+that happened between two checks can be reported, not only the last ten lines.
+
+    cursor = LogCursor()
+    cursor.read(net_connect)
+    mark = cursor.received
+    ...
+    cursor.read(net_connect)
+    new_events = cursor.since(mark)
+"""
+from collections import deque, namedtuple
+from re import match, search
+
+#same events the internet checks used to grep for
+EVENT_PATTERN = r"(?i)BGP|%LINEPROTO-5-UPDOWN"
+LOG_PATTERN = (r"^(?:(?P<sequence>\d+): )?[*.]?(?P<timestamp>[A-Z][a-z]{2} +\d+(?: \d{4})? \d\d:\d\d:\d\d(?:\.\d+)?)"
+               r"(?: [A-Z]{3,4})?: (?P<message>%(?P<facility>[A-Z0-9_]+)-(?P<severity>\d)-(?P<mnemonic>[A-Z0-9_]+): .*)$")
+
+LogEvent = namedtuple("LogEvent", ["sequence", "timestamp", "facility", "severity", "mnemonic", "message", "line"])
+
+def parse_log(output):
+    """
+    This function returns the entries of a "show logging" output, the lines
+    that are not log entries (the header of the command) are skipped.
+
+    Parameters
+    ----------
+    output : str
+        Raw output of "show logging".
+
+    Returns
+    -------
+    entries : list
+        LogEvent of every entry, in the order of the log.
+    """
+    entries = []
+    for line in output.splitlines():
+        entry = match(LOG_PATTERN, line.strip())
+        if entry:
+            entries.append(LogEvent(entry["sequence"], entry["timestamp"], entry["facility"],
+                                    int(entry["severity"]), entry["mnemonic"], entry["message"], line.strip()))
+    return entries
+
+
+class LogCursor:
+    def __init__(self, pattern=EVENT_PATTERN, max_events=500):
+        """
+        Parameters
+        ----------
+        pattern : str
+            Regular expression of the entries that are kept.
+        max_events : int
+            Size of the store, the oldest events are dropped when it is full.
+        """
+        self.pattern = pattern
+        self.events = deque(maxlen=max_events)
+        #number of events stored since the cursor was created, used as a mark by since()
+        self.received = 0
+        self.last_entry = None
+        self.lines_at_cursor = set()
+
+    def command(self):
+        """
+        This function returns the command that reads the log from the last
+        entry read.
+        """
+        if self.last_entry is None:
+            return "show logging"
+        if self.last_entry.sequence is not None:
+            return f"show logging | begin ^{self.last_entry.sequence}:"
+        return f"show logging | begin {self.last_entry.timestamp.replace('.', '[.]')}"
+
+
+    def read(self, net_connect):
+        """
+        This function reads the entries written since the previous read and
+        stores the events that match the pattern. When the last entry read
+        is no longer in the log buffer (it wrapped or it was cleared), the
+        whole buffer is read again.
+
+        Parameters
+        ----------
+        net_connect : DeviceSession
+            Open session to the device.
+
+        Returns
+        -------
+        new_events : list
+            LogEvent of the new events.
+        """
+        entries = parse_log(net_connect.send_command(self.command()))
+        if self.last_entry is not None and not entries:
+            entries = parse_log(net_connect.send_command("show logging"))
+            self.lines_at_cursor = set()
+        new_entries = [entry for entry in entries if self._is_new(entry)]
+        if entries:
+            last_entry = entries[-1]
+            if self.last_entry is None or last_entry.timestamp != self.last_entry.timestamp:
+                self.lines_at_cursor = set()
+            self.lines_at_cursor.update(entry.line for entry in entries if entry.timestamp == last_entry.timestamp)
+            self.last_entry = last_entry
+        new_events = [entry for entry in new_entries if search(self.pattern, entry.message)]
+        self.events.extend(new_events)
+        self.received += len(new_events)
+        return new_events
+
+    def _is_new(self, entry):
+        if self.last_entry is None:
+            return True
+        if entry.sequence is not None and self.last_entry.sequence is not None:
+            return int(entry.sequence) > int(self.last_entry.sequence)
+        return entry.line not in self.lines_at_cursor
+
+
+    def since(self, mark):
+        """
+        This function returns the events stored after mark (a previous value
+        of received), as far as the store goes back.
+        """
+        count = min(self.received - mark, len(self.events))
+        return list(self.events)[len(self.events) - count:] if count > 0 else []
@@ -0,0 +1,214 @@
+"""
+Process-wide registry of compiled TTP and TextFSM parsers.
+
+netmiko builds the parser again for every command it parses: a TTP object from
+the template string, and a CliTable that reads the ntc-templates index and
+compiles the TextFSM template of the command. In a fleet run that setup is
+repeated for every device. Here every TTP template and every TextFSM template
+is compiled the first time it is used and kept for the life of the process,
+the results are the same as netmiko's get_structured_data_ttp and
+get_structured_data (a raw output that can't be parsed is returned as is).
+
+parse_many parses the outputs of many devices for the same command in one call,
+split across worker processes, for the runs where the parsing is CPU bound.
+
+    outputs = [session.send_command("show version") for session in sessions]
+    parsed = parse_many(outputs, "cisco_ios", "show version", use_textfsm=True)
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from threading import Lock
+
+class CompiledParser:
+    """
+    A compiled parser, the parsers keep state while they parse so they are
+    used by one thread at a time.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.lock = Lock()
+
+
+class ParserRegistry:
+    def __init__(self):
+        self.lock = Lock()
+        #{template string: CompiledParser of a ttp object}
+        self.ttp_parsers = {}
+        #{(platform, command): CompiledParser of a TextFSM object or of a CliTable, or None if there is no template}
+        self.textfsm_parsers = {}
+        self.cli_table = None
+
+    def parse(self, output, device_type, command, use_textfsm=False, use_ttp=False, ttp_template=None):
+        """
+        This function parses the raw output of a command with TTP or TextFSM,
+        it receives the same arguments as device_session.parse_output.
+        """
+        if use_ttp and ttp_template:
+            return self.parse_ttp(output, ttp_template)
+        if use_textfsm:
+            return self.parse_textfsm(output, device_type, command)
+        return output
+
+
+    def parse_ttp(self, output, template):
+        """
+        This function parses an output with a TTP template.
+
+        Parameters
+        ----------
+        output : str
+            Raw output of the command.
+        template : str
+            TTP template.
+
+        Returns
+        -------
+        parsed_output : List, str
+            Result of the template, or the raw output if TTP is not installed
+            or the output can't be parsed.
+        """
+        try:
+            compiled = self._ttp_parser(template)
+        except ImportError:
+            return output
+        with compiled.lock:
+            parser = compiled.parser
+            try:
+                parser.add_input(output)
+                parser.parse(one=True)
+                #clear_result empties the lists of every template in place, they are copied before it
+                return [list(results) for results in parser.result(format="raw")]
+            except Exception:
+                return output
+            finally:
+                parser.clear_input()
+                parser.clear_result()
+
+    def _ttp_parser(self, template):
+        with self.lock:
+            if template not in self.ttp_parsers:
+                #imported here, TTP is optional as it is in netmiko
+                from ttp import ttp
+                self.ttp_parsers[template] = CompiledParser(ttp(template=template))
+            return self.ttp_parsers[template]
+
+
+    def parse_textfsm(self, output, platform, command):
+        """
+        This function parses an output with the ntc-templates TextFSM template
+        of the command.
+
+        Parameters
+        ----------
+        output : str
+            Raw output of the command.
+        platform : str
+            Netmiko device type.
+        command : str
+            Command that produced the output.
+
+        Returns
+        -------
+        parsed_output : List, str
+            One dictionary per row with the lowercase headers as keys, or the
+            raw output if the command has no template or no row was parsed.
+        """
+        compiled = self._textfsm_parser(platform, command)
+        if compiled is None:
+            return output
+        from textfsm import TextFSM
+        with compiled.lock:
+            parser = compiled.parser
+            if isinstance(parser, TextFSM):
+                parser.Reset()
+                rows = [list(row) for row in parser.ParseText(output)]
+            else:
+                #commands with several templates are merged by CliTable
+                parser.ParseCmd(output, {"Command": command, "Platform": platform})
+                rows = [list(row) for row in parser]
+            header = [column.lower() for column in parser.header]
+        #netmiko returns the raw output when the template matches nothing
+        if not rows:
+            return output
+        return [dict(zip(header, row)) for row in rows]
+
+    def _textfsm_parser(self, platform, command):
+        with self.lock:
+            if (platform, command) not in self.textfsm_parsers:
+                self.textfsm_parsers[platform, command] = self._compile_textfsm(platform, command)
+            return self.textfsm_parsers[platform, command]
+
+    def _compile_textfsm(self, platform, command):
+        """
+        This function finds the template of a command in the ntc-templates
+        index, the same way netmiko does, and compiles it. It is called with
+        the lock held.
+        """
+        from netmiko.utilities import get_template_dir
+        from textfsm import TextFSM, clitable
+        template_dir = get_template_dir()
+        if self.cli_table is None:
+            self.cli_table = clitable.CliTable("index", template_dir)
+        row = self.cli_table.index.GetRowMatch({"Command": command, "Platform": platform})
+        if not row and platform == "cisco_xe":
+            #netmiko retries the IOS-XE commands with the IOS templates
+            return self._compile_textfsm("cisco_ios", command)
+        if not row:
+            return None
+        templates = self.cli_table.index.index[row]["Template"].split(":")
+        if len(templates) > 1:
+            return CompiledParser(clitable.CliTable("index", template_dir))
+        try:
+            with open(os.path.join(template_dir, templates[0])) as template_file:
+                return CompiledParser(TextFSM(template_file))
+        except FileNotFoundError:
+            return None
+
+
+#registry of the process, shared by every session
+registry = ParserRegistry()
+
+def _parse_chunk(outputs, device_type, command, use_textfsm=False, use_ttp=False, ttp_template=None):
+    """
+    This function parses a chunk of parse_many in a worker process, with the registry of that process.
+    """
+    return [registry.parse(output, device_type, command, use_textfsm, use_ttp, ttp_template) for output in outputs]
+
+
+def parse_many(outputs, device_type, command, use_textfsm=False, use_ttp=False, ttp_template=None,
+               processes=None, chunk_size=50):
+    """
+    This function parses the outputs of the same command of many devices.
+
+    Parameters
+    ----------
+    outputs : list
+        Raw outputs of the command.
+    device_type : str
+        Netmiko device type.
+    command : str
+    use_textfsm : bool
+    use_ttp : bool
+    ttp_template : str
+    processes : int
+        Worker processes, the number of CPUs by default. With 1, or with a
+        single chunk, the outputs are parsed in this process.
+    chunk_size : int
+        Outputs sent to a worker at a time.
+
+    Returns
+    -------
+    parsed_outputs : list
+        Parsed output of every device, in the same order.
+    """
+    outputs = list(outputs)
+    chunks = [outputs[position:position + chunk_size] for position in range(0, len(outputs), chunk_size)]
+    processes = min(processes or os.cpu_count() or 1, len(chunks))
+    if processes <= 1:
+        return _parse_chunk(outputs, device_type, command, use_textfsm, use_ttp, ttp_template)
+    parse_chunk = partial(_parse_chunk, device_type=device_type, command=command, use_textfsm=use_textfsm,
+                          use_ttp=use_ttp, ttp_template=ttp_template)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return [parsed_output for parsed_chunk in pool.map(parse_chunk, chunks) for parsed_output in parsed_chunk]
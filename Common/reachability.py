@@ -0,0 +1,191 @@
+"""
+Bulk TCP/22 reachability probe, run before any SSH work.
+
+An unreachable device costs the whole netmiko connect timeout, and a dead site
+costs it once per device behind it. The probe opens a TCP connection to port 22
+of every target at the same time with a short timeout (asyncio), so the dead
+hosts of a run are known in a few seconds and are skipped instead of timing out.
+
+The hosts are grouped per subnet (/24 by default), every subnet has a circuit
+breaker: after failure_threshold consecutive failures it opens, and while it is
+open the hosts of the subnet are reported unreachable without being probed
+(e.g. the neighbors found later in a crawl). The failed hosts are retried with
+exponential backoff, an open subnet is retried with a single host first
+(half-open), the rest of it is only probed again if that host answers.
+
+    probe = ReachabilityProbe()
+    reachable, unreachable = probe.probe(["10.1.1.1", "10.1.1.2", "10.2.1.1"])
+"""
+import asyncio
+from collections import defaultdict
+from threading import Lock
+from time import monotonic
+from scheduler import subnet_site
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a subnet.
+    """
+
+    def __init__(self, failure_threshold=3, backoff=0.5, max_backoff=30.0):
+        """
+        Parameters
+        ----------
+        failure_threshold : int
+            Consecutive failures that open the breaker.
+        backoff : float
+            Seconds before the first retry, doubled every time the breaker opens again.
+        max_backoff : float
+        """
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0
+        self.lock = Lock()
+
+    @property
+    def is_open(self):
+        return self.trips > 0
+
+    def delay(self, attempt=1):
+        """
+        This function returns the seconds to wait before a retry, based on the
+        times the breaker opened, or on the attempt if it is closed.
+        """
+        return min(self.max_backoff, self.backoff * 2 ** (max(self.trips, attempt) - 1))
+
+    def allows_trial(self):
+        """
+        This function returns False while the breaker is open and its backoff has not passed.
+        """
+        return not self.is_open or monotonic() >= self.retry_at
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.trips = 0
+
+    def failure(self):
+        with self.lock:
+            if self.is_open:
+                #the failures of the hosts probed with the one that opened it are the same outage,
+                #only a failed half-open trial opens it again, with a longer backoff
+                if monotonic() < self.retry_at:
+                    return
+            else:
+                self.failures += 1
+            if self.is_open or self.failures >= self.failure_threshold:
+                self.trips += 1
+                self.failures = 0
+                self.retry_at = monotonic() + self.delay()
+
+
+class ReachabilityProbe:
+    def __init__(self, port=22, timeout=2.0, retries=2, backoff=0.5, failure_threshold=3,
+                 site_of=subnet_site, limit=500):
+        """
+        Parameters
+        ----------
+        port : int
+            TCP port probed, the SSH port by default.
+        timeout : float
+            Seconds a connection attempt waits.
+        retries : int
+            Times a host that did not answer is probed again.
+        backoff : float
+            Seconds before the first retry, doubled on every retry.
+        failure_threshold : int
+            Consecutive failures that open the circuit breaker of a subnet.
+        site_of : function
+            Returns the subnet of a host.
+        limit : int
+            Connection attempts at the same time.
+        """
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.site_of = site_of
+        self.limit = limit
+        self.breakers = defaultdict(lambda: CircuitBreaker(failure_threshold, backoff))
+        self.lock = Lock()
+
+    def breaker(self, host):
+        with self.lock:
+            return self.breakers[self.site_of(host)]
+
+
+    def probe(self, hosts):
+        """
+        This function probes every host at the same time, it can be called
+        from any thread.
+
+        Parameters
+        ----------
+        hosts : list
+            IP addresses to probe.
+
+        Returns
+        -------
+        reachable : list
+            Hosts that accepted the connection, in the order received.
+        unreachable : list
+            Hosts that did not answer after the retries, or whose subnet stayed open.
+        """
+        hosts = list(dict.fromkeys(host for host in hosts if host))
+        if not hosts:
+            return [], []
+        dead = asyncio.run(self._probe_all(hosts))
+        return [host for host in hosts if host not in dead], [host for host in hosts if host in dead]
+
+    async def _probe_all(self, hosts):
+        semaphore = asyncio.Semaphore(self.limit)
+        subnets = defaultdict(list)
+        for host in hosts:
+            subnets[self.site_of(host)].append(host)
+        results = await asyncio.gather(*(self._probe_subnet(subnet_hosts, semaphore) for subnet_hosts in subnets.values()))
+        return {host for dead in results for host in dead}
+
+    async def _probe_subnet(self, hosts, semaphore):
+        """
+        This function probes the hosts of a subnet, retrying the failed ones,
+        and returns the ones that never answered.
+        """
+        breaker = self.breaker(hosts[0])
+        if not breaker.allows_trial():
+            return hosts
+        pending = hosts
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(breaker.delay(attempt))
+            if breaker.is_open:
+                #half-open, a single host decides if the rest of the subnet is probed
+                if not await self._connect(pending[0], semaphore):
+                    breaker.failure()
+                    continue
+                breaker.success()
+                pending = pending[1:]
+            answers = await asyncio.gather(*(self._connect(host, semaphore) for host in pending))
+            for answered in answers:
+                if answered:
+                    breaker.success()
+                else:
+                    breaker.failure()
+            pending = [host for host, answered in zip(pending, answers) if not answered]
+            if not pending:
+                break
+        return pending
+
+    async def _connect(self, host, semaphore):
+        async with semaphore:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(host, self.port), self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                return False
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return True
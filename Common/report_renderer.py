@@ -0,0 +1,145 @@
+"""
+Streaming report renderer shared by the checks.
+
+The result of every device is written to each selected format as soon as the
+device is done, and flushed, so a fleet run only keeps in memory the report of
+the devices still being checked. The formats are:
+
+    txt     the text report of the tool, written as the tool formats it
+    jsonl   one JSON object per device with its sections
+    csv     one row per device and section
+    html    a single HTML summary, one table row per device
+
+New formats are added by registering a class with the same methods as
+TextRenderer in RENDERERS.
+
+    with ReportRenderer("C:\\Reports", "router_fleet_review", ("txt", "html")) as renderer:
+        renderer.write("10.1.1.1", router.output_dict, router.report_text())
+"""
+import csv
+import json
+from datetime import datetime
+from html import escape
+from pathlib import Path
+from threading import Lock
+
+class TextRenderer:
+    extension = "txt"
+
+    def __init__(self, file_name, title):
+        #same open arguments as the original writers, so the text is byte for byte the same
+        self.file = open(file_name, "w", encoding="UTF-8")
+
+    def write(self, device, sections, text, status):
+        self.file.write(text)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesRenderer:
+    extension = "jsonl"
+
+    def __init__(self, file_name, title):
+        self.file = open(file_name, "w", encoding="UTF-8")
+
+    def write(self, device, sections, text, status):
+        self.file.write(json.dumps({"device": device, "status": status, "sections": sections}) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CsvRenderer:
+    extension = "csv"
+    HEADER = ["Device", "Status", "Section", "Result"]
+
+    def __init__(self, file_name, title):
+        self.file = open(file_name, "w", newline="", encoding="UTF-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.HEADER)
+
+    def write(self, device, sections, text, status):
+        self.writer.writerows([device, status, section, result.strip()] for section, result in sections.items())
+
+    def close(self):
+        self.file.close()
+
+
+class HtmlRenderer:
+    extension = "html"
+
+    def __init__(self, file_name, title):
+        self.file = open(file_name, "w", encoding="UTF-8")
+        self.counts = {}
+        self.file.write(f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>{escape(title)}</title>\n"
+                        "<style>body{font-family:sans-serif} td{vertical-align:top;border-bottom:1px solid #ccc;padding:4px}"
+                        " pre{margin:0} .error{color:#b00}</style>\n</head>\n<body>\n"
+                        f"<h1>{escape(title)}</h1>\n<p>Generated {datetime.now():%Y-%m-%d %H:%M}</p>\n"
+                        "<table>\n<tr><th>Device</th><th>Status</th><th>Results</th></tr>\n")
+
+    def write(self, device, sections, text, status):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        results = "".join(f"<details><summary>{escape(section)}</summary><pre>{escape(result.strip())}</pre></details>"
+                          for section, result in sections.items())
+        self.file.write(f"<tr class=\"{escape(status)}\"><td>{escape(device)}</td><td>{escape(status)}</td>"
+                        f"<td>{results}</td></tr>\n")
+
+    def close(self):
+        totals = ", ".join(f"{count} {status}" for status, count in self.counts.items())
+        self.file.write(f"</table>\n<p>{sum(self.counts.values())} devices: {totals}</p>\n</body>\n</html>\n")
+        self.file.close()
+
+
+RENDERERS = {"txt": TextRenderer, "jsonl": JsonLinesRenderer, "csv": CsvRenderer, "html": HtmlRenderer}
+
+class ReportRenderer:
+    def __init__(self, output_dir, name, formats=("txt",), title=None):
+        """
+        Parameters
+        ----------
+        output_dir : str
+            Folder the reports are written to, it is created if needed.
+        name : str
+            Name of the report files, without the extension.
+        formats : tuple
+            Keys of RENDERERS.
+        title : str
+            Title of the HTML summary, the name by default.
+        """
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+        self.renderers = [RENDERERS[report_format](Path(output_dir) / f"{name}.{RENDERERS[report_format].extension}",
+                                                   title or name)
+                          for report_format in formats]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, device, sections, text, status="ok"):
+        """
+        This function writes the result of a device to every format.
+
+        Parameters
+        ----------
+        device : str
+            Name or IP address of the device.
+        sections : dict
+            {section name: result text}, used by the structured formats.
+        text : str
+            Result of the device in the text report of the tool.
+        status : str
+            "ok", or "error" when the checks could not be completed.
+        """
+        with self.lock:
+            for renderer in self.renderers:
+                renderer.write(device, sections, text, status)
+                renderer.file.flush()
+
+    def close(self):
+        with self.lock:
+            for renderer in self.renderers:
+                renderer.close()
@@ -0,0 +1,247 @@
+"""
+Adaptive concurrency scheduler for the fleet runs.
+
+The devices are queued per site (their /24 by default) and dispatched round
+robin across the sites, so a slow site only holds its own slots and never
+starves the others. Three limits are enforced at the same time:
+
+    global      devices worked on at the same time by the process
+    per site    devices of the same site, e.g. 1 for a low-bandwidth cellular site
+    per AAA     devices logged in through the same TACACS/ISE server, every
+                command is authorized and accounted by it
+
+The global and AAA limits are adjusted with AIMD from the result of every
+login (reported by DeviceSession): they grow by one slot per window of
+successful logins and are halved on connect timeouts, authentication failures
+or logins slower than target_latency, so the run settles on the highest rate
+the network and the AAA servers take without manual tuning.
+
+    with AdaptiveScheduler(max_workers=64) as scheduler:
+        futures = [scheduler.submit(ip, audit, ip) for ip in inventory]
+"""
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from ipaddress import ip_network
+from threading import Condition, Thread
+from time import monotonic
+from netmiko.exceptions import NetMikoAuthenticationException, NetmikoTimeoutException
+import device_session
+
+def subnet_site(ip, prefix_length=24):
+    """
+    This function returns the site of a device, its /24 by default.
+    """
+    try:
+        return str(ip_network(f"{ip}/{prefix_length}", strict=False))
+    except ValueError:
+        return ip
+
+
+class AimdLimit:
+    """
+    Concurrency limit with additive increase and multiplicative decrease.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=64, decrease=0.5, cooldown=5.0):
+        """
+        Parameters
+        ----------
+        initial : int
+            Starting limit.
+        minimum : int
+        maximum : int
+        decrease : float
+            Factor applied to the limit on congestion.
+        cooldown : float
+            Seconds after a decrease when the next congestion signals are
+            ignored, they are usually the same congestion event.
+        """
+        self.value = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.decreased_at = None
+
+    @property
+    def limit(self):
+        return max(self.minimum, int(self.value))
+
+    def success(self):
+        #one more slot after a full window of successes
+        self.value = min(self.maximum, self.value + 1 / self.value)
+
+    def congestion(self):
+        now = monotonic()
+        if self.decreased_at is None or now - self.decreased_at >= self.cooldown:
+            self.value = max(self.minimum, self.value * self.decrease)
+            self.decreased_at = now
+
+
+class AdaptiveScheduler:
+    def __init__(self, max_workers=64, initial_workers=8, site_of=subnet_site, site_limits=None,
+                 default_site_limit=8, aaa_of=None, aaa_limit=16, target_latency=5.0):
+        """
+        Parameters
+        ----------
+        max_workers : int
+            Highest global limit, and size of the thread pool.
+        initial_workers : int
+            Global limit at the start of the run.
+        site_of : function
+            Returns the site of a device.
+        site_limits : dict
+            {site: limit} for the sites that don't use default_site_limit.
+        default_site_limit : int
+        aaa_of : function
+            Returns the AAA server a device authenticates with, every device
+            uses the same one by default.
+        aaa_limit : int
+            Highest limit of every AAA server.
+        target_latency : float
+            Seconds above which a login is a congestion signal.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.global_limit = AimdLimit(initial_workers, maximum=max_workers)
+        self.aaa_limits = defaultdict(lambda: AimdLimit(min(initial_workers, aaa_limit), maximum=aaa_limit))
+        self.site_of = site_of
+        self.site_limits = site_limits or {}
+        self.default_site_limit = default_site_limit
+        self.aaa_of = aaa_of or (lambda device: "default")
+        self.target_latency = target_latency
+        #{site: deque of queued tasks}, the order is the round robin order of the sites
+        self.queues = OrderedDict()
+        self.running = 0
+        self.running_per_site = defaultdict(int)
+        self.running_per_aaa = defaultdict(int)
+        self.condition = Condition()
+        self.closed = False
+        device_session.connect_observers.append(self.record_connect)
+        self.dispatcher = Thread(target=self._dispatch, name="scheduler", daemon=True)
+        self.dispatcher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        """
+        This function waits for the queued devices to be done and stops the scheduler.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.dispatcher.join()
+        self.executor.shutdown()
+        if self.record_connect in device_session.connect_observers:
+            device_session.connect_observers.remove(self.record_connect)
+
+
+    def submit(self, device, function, *args, site=None, site_limit=None):
+        """
+        This function queues the work on a device.
+
+        Parameters
+        ----------
+        device : str
+            IP address of the device.
+        function : function
+            Called with args when the device is dispatched.
+        site : str
+            Site of the device, site_of(device) by default.
+        site_limit : int
+            Limit of the site, if it is not the one of site_limits.
+
+        Returns
+        -------
+        future : Future
+            Result of the function.
+        """
+        future = Future()
+        site = site or self.site_of(device)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("cannot schedule new work after shutdown")
+            if site_limit is not None:
+                self.site_limits.setdefault(site, site_limit)
+            self.queues.setdefault(site, deque()).append((device, site, self.aaa_of(device), future, function, args))
+            self.condition.notify_all()
+        return future
+
+
+    def _next_task(self):
+        """
+        This function returns the next task that fits in the limits, taking
+        the sites in round robin order. It is called with the condition held.
+        """
+        if self.running >= self.global_limit.limit:
+            return None
+        for site in list(self.queues):
+            queue = self.queues[site]
+            if not queue:
+                del self.queues[site]
+                continue
+            aaa = queue[0][2]
+            if (self.running_per_site[site] < self.site_limits.get(site, self.default_site_limit)
+                    and self.running_per_aaa[aaa] < self.aaa_limits[aaa].limit):
+                self.queues.move_to_end(site)
+                return queue.popleft()
+        return None
+
+    def _dispatch(self):
+        with self.condition:
+            while True:
+                task = self._next_task()
+                if task is None:
+                    if self.closed and not self.queues and not self.running:
+                        return
+                    self.condition.wait()
+                    continue
+                _, site, aaa, _, _, _ = task
+                self.running += 1
+                self.running_per_site[site] += 1
+                self.running_per_aaa[aaa] += 1
+                self.executor.submit(self._run, task)
+
+    def _run(self, task):
+        _, site, aaa, future, function, args = task
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.running_per_site[site] -= 1
+                self.running_per_aaa[aaa] -= 1
+                self.condition.notify_all()
+
+
+    def record_connect(self, host, seconds, error=None):
+        """
+        This function adjusts the limits with the result of a login, it is
+        called by DeviceSession after every connection attempt.
+        """
+        with self.condition:
+            aaa_limit = self.aaa_limits[self.aaa_of(host)]
+            if isinstance(error, NetmikoTimeoutException):
+                self.global_limit.congestion()
+            elif isinstance(error, NetMikoAuthenticationException) or (error is None and seconds > self.target_latency):
+                aaa_limit.congestion()
+                self.global_limit.congestion()
+            elif error is None:
+                aaa_limit.success()
+                self.global_limit.success()
+            self.condition.notify_all()
+
+    def limits(self):
+        """
+        This function returns the current global and AAA limits.
+        """
+        with self.condition:
+            return {"global": self.global_limit.limit,
+                    "aaa": {aaa: limit.limit for aaa, limit in self.aaa_limits.items()}}
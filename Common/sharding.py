@@ -0,0 +1,256 @@
+"""
+Sharded execution of a fleet run across processes and hosts.
+
+The threads of one process share the GIL, so the parsing and the reports of a
+large run are limited to one core. A coordinator splits the devices in shards
+and hands them to workers that run a task on every shard, each worker with
+its own thread pool, and merges the results as the shards are completed.
+
+The workers are either processes of a local pool, or worker nodes that share
+a spool directory with the coordinator (e.g. a network share mounted on every
+jump host):
+
+    spool/jobs/<job>.json       shards waiting for a worker
+    spool/claimed/<job>.json    shards being run, claimed by an atomic rename and
+                                touched by the worker while it runs them
+    spool/results/<job>.json    results written by the workers
+    spool/stop                  written by the coordinator when the run is over
+
+A task is a module level function task(items, context) that returns a list of
+JSON serializable results. Nothing secret is written to the spool, the workers
+of a spool ask for their own credentials.
+
+    runner = ShardRunner(audit_shard, context, processes=4)
+    runner.submit(inventory)
+    for shard, results, error in runner.as_completed():
+        ...
+"""
+import json
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from threading import Event, Thread
+from time import sleep, time
+from uuid import uuid4
+
+def make_shards(items, shard_size):
+    """
+    This function splits a list of items in shards of shard_size items.
+    """
+    items = list(items)
+    return [items[position:position + shard_size] for position in range(0, len(items), shard_size)]
+
+
+class ShardRunner:
+    def __init__(self, task, context=None, processes=None, spool=None, shard_size=50,
+                 poll_interval=1.0, claim_timeout=3600):
+        """
+        Parameters
+        ----------
+        task : function
+            Module level function called as task(items, context) for every shard.
+        context : dict
+            Arguments of the task shared by every shard, only passed to the
+            local processes, the spool workers build their own.
+        processes : int
+            Size of the local process pool, the number of CPUs by default.
+        spool : str
+            If given, the shards are handed to the workers of this spool
+            directory instead of a local pool.
+        shard_size : int
+            Items per shard.
+        poll_interval : float
+            Seconds between two checks of the spool results.
+        claim_timeout : float
+            Seconds after which a shard whose claim was not refreshed by its
+            worker (a worker that stopped) is queued again.
+        """
+        self.task = task
+        self.context = context or {}
+        self.shard_size = shard_size
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.spool = Path(spool) if spool else None
+        self.pool = None
+        #{future or job name: shard}
+        self.pending = {}
+        self.run_id = uuid4().hex[:8]
+        self.count = 0
+        if self.spool:
+            for folder in ("jobs", "claimed", "results"):
+                (self.spool / folder).mkdir(parents=True, exist_ok=True)
+            (self.spool / "stop").unlink(missing_ok=True)
+        else:
+            self.pool = ProcessPoolExecutor(max_workers=processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+        else:
+            (self.spool / "stop").touch()
+            #results of shards that were run twice, the first one was merged
+            for result_file in (self.spool / "results").glob(f"{self.run_id}-*.json"):
+                result_file.unlink(missing_ok=True)
+
+
+    def submit(self, items):
+        """
+        This function splits the items in shards and hands them to the workers.
+        """
+        for shard in make_shards(items, self.shard_size):
+            self.count += 1
+            if self.pool:
+                self.pending[self.pool.submit(self.task, shard, self.context)] = shard
+            else:
+                job = f"{self.run_id}-{self.count:05}.json"
+                write_json(self.spool / "jobs" / job, {"job": job, "items": shard})
+                self.pending[job] = shard
+
+    def as_completed(self):
+        """
+        This function yields the results of every shard as it is completed,
+        until no shard is pending. Shards can be submitted while iterating.
+        A shard that failed is yielded too, the caller reports its items.
+
+        Yields
+        ------
+        shard : list
+            Items of the shard.
+        results : list
+            Results returned by the task for the shard, None if it failed.
+        error : str
+            Why the shard failed, None if it was completed.
+        """
+        while self.pending:
+            if self.pool:
+                completed, _ = wait(list(self.pending), return_when=FIRST_COMPLETED)
+                for future in completed:
+                    shard = self.pending.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        yield shard, None, f"The shard failed: {e}"
+                        continue
+                    yield shard, results, None
+            else:
+                completed = [job for job in list(self.pending) if (self.spool / "results" / job).exists()]
+                if not completed:
+                    self._requeue_stale_claims()
+                    sleep(self.poll_interval)
+                    continue
+                for job in completed:
+                    shard = self.pending.pop(job)
+                    #a copy queued again after a stale claim is not run once the shard has its results
+                    (self.spool / "jobs" / job).unlink(missing_ok=True)
+                    (self.spool / "claimed" / job).unlink(missing_ok=True)
+                    result_file = self.spool / "results" / job
+                    record = json.loads(result_file.read_text(encoding="UTF-8"))
+                    result_file.unlink()
+                    if "error" in record:
+                        yield shard, None, f"The shard failed on {record['worker']}: {record['error']}"
+                        continue
+                    yield shard, record["results"], None
+
+    def _requeue_stale_claims(self):
+        """
+        This function queues again the shards of this run claimed by a
+        worker that stopped without returning their results.
+        """
+        for claimed in (self.spool / "claimed").glob(f"{self.run_id}-*.json"):
+            try:
+                if time() - claimed.stat().st_mtime > self.claim_timeout:
+                    os.replace(claimed, self.spool / "jobs" / claimed.name)
+            except FileNotFoundError:
+                continue
+
+
+def write_json(file_name, record):
+    """
+    This function writes a JSON file atomically, the readers never see it half written.
+    """
+    temporary = Path(f"{file_name}.{os.getpid()}.tmp")
+    temporary.write_text(json.dumps(record), encoding="UTF-8")
+    os.replace(temporary, file_name)
+
+
+def keep_claim(claimed, finished, heartbeat):
+    """
+    This function touches the claim of a shard every heartbeat seconds
+    until the shard is finished, so the coordinator doesn't queue it again
+    while it is running.
+    """
+    while not finished.wait(heartbeat):
+        try:
+            os.utime(claimed)
+        except FileNotFoundError:
+            #the claim was queued again or dropped by the coordinator
+            return
+
+
+def serve_shards(spool, task, context, poll_interval=1.0, heartbeat=60.0):
+    """
+    This function runs a worker node: it claims the shards of the spool
+    directory one at a time, runs the task on them and writes the results,
+    until the coordinator writes the stop file.
+
+    Parameters
+    ----------
+    spool : str
+        Spool directory shared with the coordinator.
+    task : function
+        Same task the coordinator would run in its local processes.
+    context : dict
+        Arguments of the task, with the credentials of this worker.
+    poll_interval : float
+        Seconds between two checks of the spool when it is empty.
+    heartbeat : float
+        Seconds between two refreshes of the claim of the shard being run,
+        shorter than the claim_timeout of the coordinator.
+
+    Returns
+    -------
+    shards : int
+        Number of shards run by the worker.
+    """
+    spool = Path(spool)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    for folder in ("jobs", "claimed", "results"):
+        (spool / folder).mkdir(parents=True, exist_ok=True)
+    shards = 0
+    while True:
+        #no shard is claimed once the run is over, even one queued again
+        if (spool / "stop").exists():
+            return shards
+        claimed = None
+        for job in sorted((spool / "jobs").glob("*.json")):
+            try:
+                #the rename is atomic, only one worker claims a shard
+                os.replace(job, spool / "claimed" / job.name)
+            except FileNotFoundError:
+                continue
+            claimed = spool / "claimed" / job.name
+            #the claim time is the one the coordinator checks for stale claims
+            claimed.touch()
+            break
+        if claimed is None:
+            sleep(poll_interval)
+            continue
+        record = json.loads(claimed.read_text(encoding="UTF-8"))
+        finished = Event()
+        Thread(target=keep_claim, args=(claimed, finished, heartbeat), daemon=True).start()
+        try:
+            result = {"job": record["job"], "worker": worker, "results": task(record["items"], context)}
+        except Exception as e:
+            result = {"job": record["job"], "worker": worker, "error": str(e)}
+        finally:
+            finished.set()
+        write_json(spool / "results" / claimed.name, result)
+        claimed.unlink(missing_ok=True)
+        shards += 1
@@ -0,0 +1,217 @@
+"""
+Local syslog receiver for the state changes pushed by the devices.
+
+The devices send their log messages to this host (logging host x.x.x.x
+transport udp/tcp port N), the receiver parses them and hands them to a
+callback. EventState turns the BGP neighbor and interface state changes into
+an in-memory state model that is laid over the output of the last poll, so
+the checks see a state change within seconds of the message and the devices
+only have to be polled occasionally to reconcile the rest of the state.
+
+Messages over UDP (one message per datagram) and TCP (newline or octet
+counting framing, RFC 6587) are accepted.
+"""
+from collections import namedtuple
+from re import match, search
+from socketserver import BaseRequestHandler, StreamRequestHandler, ThreadingTCPServer, ThreadingUDPServer
+from threading import Lock, Thread
+from time import time
+
+SYSLOG_PATTERN = (r"^(?:<(?P<priority>\d+)>)?.*?(?P<message>%(?P<facility>[A-Z0-9_]+)-(?P<severity>\d)-"
+                  r"(?P<mnemonic>[A-Z0-9_]+): (?P<text>.*))$")
+
+SyslogMessage = namedtuple("SyslogMessage", ["source", "received_at", "facility", "severity", "mnemonic", "text", "line"])
+
+def parse_syslog(data, source, received_at=None):
+    """
+    This function parses an IOS syslog message.
+
+    Parameters
+    ----------
+    data : bytes
+        Message as received.
+    source : str
+        IP address of the device that sent it.
+    received_at : float
+        Time it was received, the current time by default.
+
+    Returns
+    -------
+    message : SyslogMessage
+        The parsed message, None if it is not an IOS message (%FACILITY-SEVERITY-MNEMONIC).
+    """
+    line = data.decode("UTF-8", errors="replace").strip()
+    parsed = match(SYSLOG_PATTERN, line)
+    if not parsed:
+        return None
+    return SyslogMessage(source, received_at or time(), parsed["facility"], int(parsed["severity"]),
+                         parsed["mnemonic"], parsed["text"], parsed["message"])
+
+
+class SyslogReceiver:
+    def __init__(self, on_message, port=514, host="", allowed_sources=None):
+        """
+        Parameters
+        ----------
+        on_message : function
+            Called with every SyslogMessage, from the receiver threads.
+        port : int
+            UDP and TCP port to listen on.
+        host : str
+            Address to listen on, every address by default.
+        allowed_sources : set
+            If given, the messages of any other IP address are dropped.
+        """
+        self.on_message = on_message
+        self.allowed_sources = allowed_sources
+        receiver = self
+
+        class UdpHandler(BaseRequestHandler):
+            def handle(self):
+                receiver.receive(self.request[0], self.client_address[0])
+
+        class TcpHandler(StreamRequestHandler):
+            def handle(self):
+                while True:
+                    first_byte = self.rfile.read(1)
+                    if not first_byte:
+                        return
+                    if first_byte.isdigit():
+                        #octet counting: "<length> <message>"
+                        length = first_byte
+                        while True:
+                            byte = self.rfile.read(1)
+                            if byte in (b" ", b""):
+                                break
+                            length += byte
+                        data = self.rfile.read(int(length))
+                    else:
+                        data = first_byte + self.rfile.readline()
+                    receiver.receive(data, self.client_address[0])
+
+        ThreadingUDPServer.allow_reuse_address = ThreadingTCPServer.allow_reuse_address = True
+        self.servers = [ThreadingUDPServer((host, port), UdpHandler), ThreadingTCPServer((host, port), TcpHandler)]
+        for server in self.servers:
+            server.daemon_threads = True
+
+    def start(self):
+        for server in self.servers:
+            Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+
+    def receive(self, data, source):
+        if self.allowed_sources is not None and source not in self.allowed_sources:
+            return
+        message = parse_syslog(data, source)
+        if message:
+            self.on_message(message)
+
+
+def format_elapsed(seconds):
+    """
+    This function formats a duration the way IOS shows the BGP Up/Down time.
+    """
+    seconds = int(seconds)
+    if seconds < 86400:
+        return f"{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+    if seconds < 604800:
+        return f"{seconds // 86400}d{seconds // 3600 % 24:02}h"
+    return f"{seconds // 604800}w{seconds // 86400 % 7}d"
+
+
+class EventState:
+    """
+    State of the interfaces and BGP neighbors of one device built from the
+    syslog messages received since its last poll.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        #{interface: {"link_status" or "protocol_status": (status, received_at)}}
+        self.interfaces = {}
+        #{neighbor ip: (state, received_at)}
+        self.bgp_neighbors = {}
+
+    def apply(self, message):
+        """
+        This function updates the state with a message.
+
+        Returns
+        -------
+        changed : bool
+            True if the message is a state change the checks use.
+        """
+        if message.mnemonic == "ADJCHANGE":
+            neighbor = search(r"neighbor (\S+)(?: .*?)? (Up|Down)\b", message.text)
+            if neighbor:
+                with self.lock:
+                    self.bgp_neighbors[neighbor.group(1)] = (neighbor.group(2), message.received_at)
+                return True
+        elif message.mnemonic in ("UPDOWN", "CHANGED"):
+            interface = search(r"Interface (\S+), changed state to (.+)$", message.text)
+            if interface:
+                field = "protocol_status" if message.facility == "LINEPROTO" else "link_status"
+                with self.lock:
+                    self.interfaces.setdefault(interface.group(1), {})[field] = (interface.group(2).strip(), message.received_at)
+                return True
+        return False
+
+
+    def reconcile(self, polled_at):
+        """
+        This function forgets the changes received before a poll started,
+        the output of the poll already has them.
+        """
+        with self.lock:
+            self.bgp_neighbors = {neighbor: change for neighbor, change in self.bgp_neighbors.items()
+                                  if change[1] >= polled_at}
+            for changes in self.interfaces.values():
+                for field in [field for field, change in changes.items() if change[1] < polled_at]:
+                    del changes[field]
+
+
+    def interfaces_view(self, show_interfaces):
+        """
+        This function returns a copy of the parsed "show interface" output
+        with the interface states received since the poll.
+        """
+        with self.lock:
+            interfaces = {name: dict(changes) for name, changes in self.interfaces.items() if changes}
+        if not interfaces:
+            return show_interfaces
+        view = []
+        for interface in show_interfaces:
+            changes = interfaces.get(interface["interface"])
+            if changes:
+                interface = dict(interface, **{field: status for field, (status, _) in changes.items()})
+            view.append(interface)
+        return view
+
+    def bgp_view(self, bgp_summary, now=None):
+        """
+        This function returns a copy of the parsed "show ip bgp summary"
+        output with the neighbor states received since the poll. A neighbor
+        that went down is shown as Idle, one that came up with 0 prefixes
+        until the next poll, both with the time since the change.
+        """
+        with self.lock:
+            neighbors = dict(self.bgp_neighbors)
+        if not neighbors:
+            return bgp_summary
+        now = now or time()
+        view = []
+        for neighbor in bgp_summary:
+            change = neighbors.get(neighbor["bgp_neigh"])
+            if change:
+                state, received_at = change
+                was_down = not neighbor["state_pfxrcd"].isdigit()
+                neighbor = dict(neighbor, up_down=format_elapsed(now - received_at),
+                                state_pfxrcd="Idle" if state == "Down" else ("0" if was_down else neighbor["state_pfxrcd"]))
+            view.append(neighbor)
+        return view
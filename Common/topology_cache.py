@@ -0,0 +1,174 @@
+"""
+Persistent cache of the CDP topology discovered by the ACL rollout.
+
+Every crawled device is stored with the time it was crawled, and every CDP
+neighbor it reports is stored as a node (hostname, platform, capabilities and
+management IP) and as an adjacency. Later runs can target the cached devices
+directly, and only devices whose entry is older than the allowed age, or whose
+neighbor reported a different set of neighbors than last time, have to run
+"show cdp neighbors detail" again.
+
+The cache is a SQLite database so it can be queried by other tools, it can
+also be listed from the command line:
+
+    python topology_cache.py --capability Router
+"""
+import sqlite3
+from argparse import ArgumentParser
+from hashlib import sha1
+from pathlib import Path
+from threading import Lock
+from time import time
+
+DEFAULT_CACHE = Path(__file__).resolve().parent / "cdp_topology.db"
+CRAWLED_CAPABILITIES = ("Switch", "Router")
+
+class TopologyCache:
+    def __init__(self, file_name=DEFAULT_CACHE):
+        """
+        Parameters
+        ----------
+        file_name : str
+            Location of the SQLite database, it is created if needed.
+        """
+        self.lock = Lock()
+        self.connection = sqlite3.connect(str(file_name), check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS nodes (
+                ip TEXT PRIMARY KEY, hostname TEXT, platform TEXT, capabilities TEXT,
+                crawled_at REAL, neighbors_digest TEXT)""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS links (
+                local_ip TEXT, local_port TEXT, remote_ip TEXT, remote_port TEXT,
+                PRIMARY KEY (local_ip, local_port, remote_ip))""")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def update(self, ip, cdp_neighbors):
+        """
+        This function stores the CDP neighbors reported by a device that
+        was just crawled.
+
+        Parameters
+        ----------
+        ip : str
+            IP address of the crawled device.
+        cdp_neighbors : List
+            Output of "show cdp neighbors detail" parsed by TextFSM.
+
+        Returns
+        -------
+        changed : bool
+            True if the neighbors are different from the ones of the previous
+            crawl of the device, False on its first crawl.
+        """
+        neighbors = [neighbor for neighbor in cdp_neighbors or []
+                     if isinstance(neighbor, dict) and neighbor.get("management_ip")]
+        digest = sha1("\n".join(sorted(
+            f"{neighbor.get('local_port')} {neighbor['management_ip']} {neighbor.get('remote_port')}"
+            for neighbor in neighbors)).encode()).hexdigest()
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT neighbors_digest FROM nodes WHERE ip = ?", (ip,)).fetchone()
+            crawled_before = row is not None and row["neighbors_digest"] is not None
+            changed = not crawled_before or row["neighbors_digest"] != digest
+            self.connection.execute(
+                """INSERT INTO nodes (ip, crawled_at, neighbors_digest) VALUES (?, ?, ?)
+                ON CONFLICT(ip) DO UPDATE SET crawled_at = excluded.crawled_at,
+                neighbors_digest = excluded.neighbors_digest""", (ip, time(), digest))
+            #neighbors that have not been crawled yet are cached with their CDP information
+            self.connection.executemany(
+                """INSERT INTO nodes (ip, hostname, platform, capabilities) VALUES (?, ?, ?, ?)
+                ON CONFLICT(ip) DO UPDATE SET hostname = excluded.hostname,
+                platform = excluded.platform, capabilities = excluded.capabilities""",
+                [(neighbor["management_ip"], neighbor.get("neighbor_name") or neighbor.get("destination_host"),
+                  neighbor.get("platform"), neighbor.get("capabilities")) for neighbor in neighbors])
+            if changed:
+                self.connection.execute("DELETE FROM links WHERE local_ip = ?", (ip,))
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?)",
+                    [(ip, neighbor.get("local_port"), neighbor["management_ip"], neighbor.get("remote_port"))
+                     for neighbor in neighbors])
+        return crawled_before and changed
+
+
+    def expire(self, ips):
+        """
+        This function marks devices as not crawled, their cached neighbors
+        are not trusted until they are crawled again.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE nodes SET crawled_at = NULL WHERE ip = ?", [(ip,) for ip in ips])
+
+
+    def is_fresh(self, ip, max_age):
+        """
+        This function checks if a device was crawled less than
+        max_age seconds ago.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT crawled_at FROM nodes WHERE ip = ?", (ip,)).fetchone()
+        return bool(row and row["crawled_at"] and time() - row["crawled_at"] < max_age)
+
+
+    def neighbor_ips(self, ip, capabilities=CRAWLED_CAPABILITIES):
+        """
+        This function returns the cached neighbors of a device that have
+        one of the given capabilities.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                """SELECT nodes.ip, nodes.capabilities FROM links JOIN nodes ON nodes.ip = links.remote_ip
+                WHERE links.local_ip = ?""", (ip,)).fetchall()
+        return [row["ip"] for row in rows
+                if set((row["capabilities"] or "").split()) & set(capabilities)]
+
+
+    def devices(self, capability=None, max_age=None):
+        """
+        This function returns the cached devices.
+
+        Parameters
+        ----------
+        capability : str
+            If given, only the devices that have this CDP capability are returned.
+        max_age : int
+            If given, only the devices crawled in the last max_age seconds are returned.
+
+        Returns
+        -------
+        devices : List
+            List of dictionaries with the cached information of every device.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM nodes ORDER BY ip").fetchall()
+        devices = [dict(row) for row in rows]
+        if capability:
+            devices = [device for device in devices if capability in (device["capabilities"] or "").split()]
+        if max_age is not None:
+            devices = [device for device in devices
+                       if device["crawled_at"] and time() - device["crawled_at"] < max_age]
+        return devices
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Lists the devices of the cached CDP topology")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="location of the cache")
+    parser.add_argument("--capability", help="only list devices with this CDP capability (e.g. Router)")
+    parser.add_argument("--max-age", type=float, help="only list devices crawled in the last MAX_AGE hours")
+    args = parser.parse_args()
+    with TopologyCache(args.cache) as cache:
+        max_age = args.max_age * 3600 if args.max_age is not None else None
+        for device in cache.devices(args.capability, max_age):
+            print(f"{device['ip']:<16} {device['hostname'] or '':<30} {device['platform'] or '':<20} "
+                  f"{device['capabilities'] or ''}")
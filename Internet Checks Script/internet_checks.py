@@ -7,11 +7,29 @@ file will be saved to the desktop.
 This script requires the libraries below to be installed in the Python environment where 
 it will be executed.
 """
+import json
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from itertools import islice
-from netmiko import ConnectHandler
+from pathlib import Path
+from threading import Event, Thread
+from time import monotonic, time
 from netmiko.exceptions import NetMikoAuthenticationException, NetmikoTimeoutException
+#modules shared by the different network projects
+sys.path.append(str(Path(__file__).resolve().parents[1] / "Common"))
+from command_cache import CommandCache, CACHE_MODES
+from counter_series import CounterSeries, interface_counters
+from device_session import DeviceSession, TRANSPORTS, parse_output, use_transport
+from fact_store import DEFAULT_STORE, FactRun, error_facts
+from log_cursor import LogCursor
+from reachability import ReachabilityProbe
+from report_renderer import RENDERERS, ReportRenderer
+from syslog_receiver import EventState, SyslogReceiver
+from instrumentation import tracer
 
 #The script contains generic variables that will have to be modified in order to be used.
 
@@ -35,13 +53,23 @@ REQUIRED_INTERFACES_DICT = {
 SP_LIST = ["ISP1", "ISP2"]
 TO_MEGABITS = 1000000
 BGP_DOWN_STATES = ["Idle", "Connect", "Active"]
+WATCH_LOGS_TITLE = "Logs since the last check"
+#names of the results of check_device in the structured report formats
+SECTION_NAMES = ["HSRP status", "Interfaces", "BGP", "Tunnels", "Utilization", "Logs"]
 
-def send_commands():
+def send_commands(device, device_handler, command_cache=None, targeted_interfaces=False):
     """Creates the SSH handler, and executes the required commands
 
     Parameters
     ----------
-    No parameters are received by this function
+    device : str
+        Name of the device in REQUIRED_INTERFACES_DICT, used in the error messages.
+    device_handler : dict
+        Netmiko connection parameters of the device.
+    command_cache : CommandCache
+        Record/replay cache of the command output, if None the commands are sent live.
+    targeted_interfaces : bool
+        If True, only the interfaces listed in REQUIRED_INTERFACES_DICT are requested.
 
     Returns
     -------
@@ -51,20 +79,10 @@ def send_commands():
 
     command_results = {}
 
-    device_handler = {
-        "device_type": "cisco_ios",
-        "host": device_ip,
-        "username": username,
-        "password": password}
-    
     try:
-        with ConnectHandler(**device_handler) as net_connect:
-            command_results["show_interfaces"] = net_connect.send_command("show interface", use_textfsm=True)
-            command_results["bgp_summary"] = net_connect.send_command("show ip bgp summary", use_textfsm=True)
-            command_results["hostname"] = (net_connect.send_command("show version", use_textfsm=True))[0]["hostname"]
-            command_results["hsrp_status"] = (net_connect.send_command("show standby", use_textfsm=True))[0]["state"]
-            net_connect.send_command("terminal shell")
-            command_results["logs"] = net_connect.send_command("show log | grep -E -i 'BGP|%LINEPROTO-5-UPDOWN' | tail 10")
+        session = command_cache.session(device_handler) if command_cache else DeviceSession(device_handler)
+        with session as net_connect:
+            command_results = run_commands(net_connect, interfaces=required_interfaces(device) if targeted_interfaces else None)
     except NetMikoAuthenticationException:
         print(f"There has been a problem authenticating to {device}. Please try again")
     except NetmikoTimeoutException:
@@ -75,42 +93,343 @@ def send_commands():
     return command_results
 
 
-def utilization(show_interfaces):
-    """This function retrieves and formats the utilization of the WAN and
-    tunnel interfaces specified in REQUIRED_INTERFACES_LIST
+def run_commands(net_connect, log_cursor=None, interfaces=None):
+    """Executes the required commands on an open session
+
+    Parameters
+    ----------
+    net_connect : DeviceSession
+        Open session to the device.
+    log_cursor : LogCursor
+        If given, only the log entries written since the previous poll are read
+        and stored in the cursor, instead of the last 10 BGP and line protocol logs.
+    interfaces : list
+        If given, only these interfaces are requested and parsed, see interfaces_command.
+
+    Returns
+    -------
+    command_results (dict) = A dictionary with the results of the commands that were
+    executed
+    """
+    command_results = {}
+    #the raw output is kept to read the byte counters, which the TextFSM template does not return
+    show_interface = net_connect.send_command(interfaces_command(interfaces))
+    command_results["sampled_at"] = time()
+    command_results["interface_counters"] = interface_counters(show_interface)
+    command_results["show_interfaces"] = parse_output(show_interface, net_connect.handler["device_type"],
+                                                      "show interface", use_textfsm=True)
+    command_results["bgp_summary"] = net_connect.send_command("show ip bgp summary", use_textfsm=True)
+    command_results["hostname"] = (net_connect.send_command("show version", use_textfsm=True))[0]["hostname"]
+    command_results["hsrp_status"] = (net_connect.send_command("show standby", use_textfsm=True))[0]["state"]
+    if log_cursor is None:
+        net_connect.send_command("terminal shell")
+        command_results["logs"] = net_connect.send_command("show log | grep -E -i 'BGP|%LINEPROTO-5-UPDOWN' | tail 10")
+    else:
+        log_cursor.read(net_connect)
+    return command_results
+
+
+def required_interfaces(device):
+    """Returns the interfaces of a device listed in REQUIRED_INTERFACES_DICT
+
+    Parameters
+    ----------
+    device : str
+        Name of the device in REQUIRED_INTERFACES_DICT.
+
+    Returns
+    -------
+    interfaces : list
+        Interface names without duplicates, in the order of the dictionary.
+    """
+    return list(dict.fromkeys(name.strip() for name in islice(REQUIRED_INTERFACES_DICT[device], 1, None)))
+
+
+def interfaces_command(interfaces=None):
+    """Returns the command that shows the interfaces
+
+    Parameters
+    ----------
+    interfaces : list
+        Interfaces to show. The device filters its output with "| section" so
+        only their blocks are sent and parsed, every interface is shown if it
+        is not given.
+
+    Returns
+    -------
+    command : str
+    """
+    if not interfaces:
+        return "show interface"
+    #" is" keeps Tunnel1 from matching Tunnel10
+    return f"show interface | section ^({'|'.join(name.replace('.', '[.]') for name in interfaces)}) is"
+
+
+def interface_index(show_interfaces):
+    """Indexes the parsed "show interface" output by interface name in one pass
 
     Parameters
     ----------
     show_interfaces : list
         List that contains the output of the "Show interfaces" command
 
+    Returns
+    -------
+    interfaces : dict
+        {interface name: parsed interface}
+    """
+    return {interface["interface"]: interface for interface in show_interfaces}
+
+
+def check_device(output, rates=None, since=None):
+    """Runs the checks on the output of the commands of one device
+
+    Parameters
+    ----------
+    output : dict
+        Results of send_commands or run_commands.
+    rates : CounterSeries
+        Rates measured from the byte counters of the previous polls, see utilization.
+    since : float
+        Time of the last check, see utilization.
+
+    Returns
+    -------
+    writing_list : list
+        HSRP state, interfaces status, BGP, tunnels, utilization and logs, in the
+        order of the report.
+    """
+    hostname = output["hostname"]
+    interfaces = interface_index(output["show_interfaces"])
+    interfaces_status = status_and_errors(interfaces, hostname)
+    bgp = bgp_information(output["bgp_summary"], hostname)
+    tunnels_result = tunnel_status(interfaces)
+    utilization_result = utilization(interfaces, hostname, rates, since)
+    return [output["hsrp_status"], interfaces_status, bgp,
+            tunnels_result, utilization_result, output["logs"]]
+
+
+def device_facts(hostname, output):
+    """Returns the verdict and facts of the checks of one device, for the fact store
+
+    Parameters
+    ----------
+    hostname : str
+        Name of the device, a key of REQUIRED_INTERFACES_DICT
+    output : dict
+        Results of send_commands or run_commands, empty if the commands could not be run.
+
+    Returns
+    -------
+    facts : dict
+        {check: {"verdict": "pass", "fail" or "info", "value": facts}}, see Common/fact_store.py.
+    """
+    if not output:
+        return error_facts(f"A connection to {hostname} could not be established")
+    required_interfaces = REQUIRED_INTERFACES_DICT[hostname]
+    interfaces = interface_index(output["show_interfaces"])
+    links = {}
+    for interface_name in islice(required_interfaces.keys(), 1, 3):
+        interface = interfaces.get(interface_name)
+        if interface:
+            links[interface_name] = {"link_status": interface["link_status"],
+                                     "errors": int(interface["input_errors"]) + int(interface["output_errors"])}
+    neighbors_index = {}
+    for neighbor in output["bgp_summary"]:
+        neighbors_index.setdefault(neighbor["bgp_neigh"], []).append(neighbor)
+    bgp_neighbors = [{"interface": key.strip(), "neighbor": neighbor["bgp_neigh"], "state": neighbor["state_pfxrcd"],
+                      "up_down": neighbor["up_down"], "up": neighbor["state_pfxrcd"] not in BGP_DOWN_STATES}
+                     for key, value in required_interfaces.items() for neighbor in neighbors_index.get(value, [])]
+    tunnels = {interface_name: {"ip_address": interfaces[interface_name]["ip_address"],
+                                "link_status": interfaces[interface_name]["link_status"]}
+               for interface_name in ("Tunnel21", "Tunnel22") if interface_name in interfaces}
+    utilization_mbps = {interface_name: {"input": int(interfaces[interface_name]["input_rate"]) / TO_MEGABITS,
+                                         "output": int(interfaces[interface_name]["output_rate"]) / TO_MEGABITS}
+                        for interface_name in islice(required_interfaces.keys(), 2, None) if interface_name in interfaces}
+    return {"hsrp": {"verdict": "info", "value": {"state": output["hsrp_status"]}},
+            "interfaces": {"verdict": "pass" if all(link["link_status"] == "up" for link in links.values()) else "fail",
+                           "value": links},
+            "bgp": {"verdict": "pass" if all(neighbor["up"] for neighbor in bgp_neighbors) else "fail",
+                    "value": {"neighbors": bgp_neighbors,
+                              "down": [neighbor["neighbor"] for neighbor in bgp_neighbors if not neighbor["up"]]}},
+            "tunnels": {"verdict": "pass" if all(tunnel["link_status"] == "up" for tunnel in tunnels.values()) else "fail",
+                        "value": tunnels},
+            "utilization": {"verdict": "info", "value": utilization_mbps}}
+
+
+class EdgeRouter:
+    """
+    Per device state of the watch mode: the connection parameters, the
+    session kept open between polls, the interface rates measured from the
+    byte counters, the log events read incrementally, the state changes
+    received over syslog since the last poll and the results of the checks.
+    """
+
+    def __init__(self, device, username, password, history=720, command_cache=None, targeted_interfaces=False):
+        """
+        Parameters
+        ----------
+        device : str
+            Name of the device in REQUIRED_INTERFACES_DICT.
+        username : str
+        password : str
+        history : int
+            Rates kept per interface (one per poll).
+        command_cache : CommandCache
+            Record/replay cache of the command output, if None the commands are sent live.
+        targeted_interfaces : bool
+            If True, only the interfaces listed in REQUIRED_INTERFACES_DICT are requested.
+        """
+        self.device = device
+        self.ip_address = REQUIRED_INTERFACES_DICT[device]["mgmt_interface"]
+        self.device_handler = {
+            "device_type": "cisco_ios",
+            "host": self.ip_address,
+            "username": username,
+            "password": password}
+        self.command_cache = command_cache
+        self.targeted_interfaces = targeted_interfaces
+        self.session = None
+        self.net_connect = None
+        self.rates = CounterSeries(history)
+        self.log_cursor = LogCursor()
+        self.events = EventState()
+        self.output = None
+        self.results = None
+        self.facts = None
+        self.polled_at = None
+        self.checked_at = None
+        self.log_mark = 0
+
+    def close(self):
+        if self.session is not None:
+            self.session.__exit__(None, None, None)
+        self.session = self.net_connect = None
+
+    def mark_checked(self):
+        """This function starts a new check, the peak utilization and the logs
+        of the next reports are the ones since now.
+        """
+        self.checked_at = time()
+        self.log_mark = self.log_cursor.received
+
+
+    def poll(self):
+        """This function runs the commands and the checks on the device, the
+        session is opened on the first poll and reused by the next ones. If
+        the poll fails the session is dropped, it is opened again next time,
+        and the results of the last successful poll are kept.
+
+        Returns
+        -------
+        changed : bool
+            True if the results are different from the previous poll.
+        """
+        started = time()
+        with tracer.device(self.ip_address):
+            try:
+                if self.session is None:
+                    self.session = (self.command_cache.session(self.device_handler) if self.command_cache
+                                    else DeviceSession(self.device_handler))
+                    self.net_connect = self.session.__enter__()
+                self.output = run_commands(self.net_connect, self.log_cursor,
+                                           required_interfaces(self.device) if self.targeted_interfaces else None)
+                self.rates.update(self.output["interface_counters"], self.output["sampled_at"])
+                self.events.reconcile(started)
+                self.polled_at = datetime.now()
+                return self.refresh()
+            except NetMikoAuthenticationException:
+                print(f"There has been a problem authenticating to {self.device}. Please try again")
+                self.close()
+                return False
+            except NetmikoTimeoutException:
+                print(f"A connection to {self.device} could not be established. It appears to be down")
+                self.close()
+                return False
+            except Exception as e:
+                print(f"An unexpected error has occurred on {self.device}:{e}. Retrying on the next poll")
+                self.close()
+                return False
+
+
+    def refresh(self):
+        """This function runs the checks again on the output of the last poll
+        with the state changes received over syslog since then laid over it,
+        no command is sent to the device.
+
+        Returns
+        -------
+        changed : bool
+            True if the results are different from the previous ones.
+        """
+        if self.output is None:
+            return False
+        output = dict(self.output,
+                      show_interfaces=self.events.interfaces_view(self.output["show_interfaces"]),
+                      bgp_summary=self.events.bgp_view(self.output["bgp_summary"]),
+                      logs="\n".join(event.line for event in self.log_cursor.since(self.log_mark)))
+        results = check_device(output, self.rates, self.checked_at)
+        changed = results != self.results
+        self.results = results
+        self.facts = device_facts(self.device, output)
+        return changed
+
+
+@tracer.traced("validate")
+def utilization(interfaces_index, hostname, rates=None, since=None):
+    """This function retrieves and formats the utilization of the WAN and
+    tunnel interfaces specified in REQUIRED_INTERFACES_LIST. When rates are
+    given, the exact rate since the previous poll is used instead of the 5
+    minute average of the device, and the peak since the last check is added.
+
+    Parameters
+    ----------
+    interfaces_index : dict
+        Output of the "Show interfaces" command indexed by interface_index
+    hostname : str
+        Name of the device, a key of REQUIRED_INTERFACES_DICT
+    rates : CounterSeries
+        Rates measured from the byte counters of the previous polls.
+    since : float
+        Time of the last check, the peak is only shown if it is given.
+
     Returns
     -------
     utilization_result : str
         String that contains the utilization information in the template format.
     """
-    utilization_result = ''
+    utilization_result = []
     #makes a list with the 2nd to the last interface contained on REQUIRED_INTERFACES_DICT
     interfaces =  list(islice(REQUIRED_INTERFACES_DICT[hostname].keys(), 2, None))
-    for interface in show_interfaces:
-        if interface["interface"] in interfaces:
+    for interface_name in interfaces:
+        interface = interfaces_index.get(interface_name)
+        if interface:
             input_rate = int(interface['input_rate']) / TO_MEGABITS
             output_rate = int(interface['output_rate']) / TO_MEGABITS
+            series = rates.get(interface["interface"]) if rates else None
+            if series and series.latest():
+                input_rate, output_rate = (round(rate / TO_MEGABITS, 2) for rate in series.latest())
             if interface["interface"] == interfaces[0]:
-                utilization_result += f"""WAN Interface Inbound utilization = {input_rate}Mbps, Outbound utilization = {output_rate}Mbps. \n"""
+                utilization_result.append(f"""WAN Interface Inbound utilization = {input_rate}Mbps, Outbound utilization = {output_rate}Mbps. \n""")
             else:
-                utilization_result +=f" {interface['interface']} Inbound utilization = {input_rate}Mbps, Outbound utilization = {output_rate}Mbps. \n"
-    return utilization_result
+                utilization_result.append(f" {interface['interface']} Inbound utilization = {input_rate}Mbps, Outbound utilization = {output_rate}Mbps. \n")
+            peak = series.peak(since) if series and since else None
+            if peak:
+                utilization_result.append(f"  Peak since the last check: Inbound {round(peak[0] / TO_MEGABITS, 2)}Mbps, Outbound {round(peak[1] / TO_MEGABITS, 2)}Mbps. \n")
+    return "".join(utilization_result)
 
 
-def status_and_errors(show_interfaces):
+@tracer.traced("validate")
+def status_and_errors(interfaces_index, hostname):
     """This function retrieves and formats the status and error count of the 
     WAN interface and the interface that connects to the core firewalls.
 
     Parameters
     ----------
-    show_interfaces : list
-        List that contains the output of the "Show interfaces" command
+    interfaces_index : dict
+        Output of the "Show interfaces" command indexed by interface_index
+    hostname : str
+        Name of the device, a key of REQUIRED_INTERFACES_DICT
 
     Returns
     -------
@@ -119,105 +438,384 @@ def status_and_errors(show_interfaces):
     """
 
     interfaces =  list(islice(REQUIRED_INTERFACES_DICT[hostname].keys(),1,3))
-    status_result = ''
-    for interface in show_interfaces:
-        interface_name = interface['interface']
+    status_result = []
+    for interface_name in interfaces:
+        interface = interfaces_index.get(interface_name)
+        if not interface:
+            continue
         interface_link_status = interface['link_status']
-        if interface["interface"] == interfaces[0]:
-            status_result += f"{interface_name} to {'FWL1' if hostname == list(REQUIRED_INTERFACES_DICT.keys())[0] else 'FWL2'} - {interface_link_status} and {int(interface['input_errors'])+int(interface['output_errors'])} Errors. \n"
-        elif interface["interface"] == interfaces[1]:
-            status_result += f"{interface_name} WAN interface - {interface_link_status} and {int(interface['input_errors'])+int(interface['output_errors'])} Errors. \n"
-    return status_result
+        if interface_name == interfaces[0]:
+            status_result.append(f"{interface_name} to {'FWL1' if hostname == list(REQUIRED_INTERFACES_DICT.keys())[0] else 'FWL2'} - {interface_link_status} and {int(interface['input_errors'])+int(interface['output_errors'])} Errors. \n")
+        else:
+            status_result.append(f"{interface_name} WAN interface - {interface_link_status} and {int(interface['input_errors'])+int(interface['output_errors'])} Errors. \n")
+    return "".join(status_result)
 
 
-def bgp_information(bgp_summary):
+@tracer.traced("validate")
+def bgp_information(bgp_summary, hostname):
     """This function checks and formats the status and uptime of the BGP sessions.
 
     Parameters
     ----------
     bgp_summary : list
         List that contains the ouput of the "Show ip bgp summary" command.
+    hostname : str
+        Name of the device, a key of REQUIRED_INTERFACES_DICT
 
     Returns
     -------
     bgp_result : str
         String that contains the BGP status in the template format.
     """
-    bgp_result = ''
+    bgp_result = []
+    neighbors_index = {}
+    for neighbor in bgp_summary:
+        neighbors_index.setdefault(neighbor["bgp_neigh"], []).append(neighbor)
     required_interfaces = REQUIRED_INTERFACES_DICT[hostname]
     for key,value in required_interfaces.items():
-        for neighbor in bgp_summary:
+        for neighbor in neighbors_index.get(value, []):
             neighbor_ip = neighbor["bgp_neigh"]
             bgp_state = neighbor['state_pfxrcd']
             bgp_uptime = neighbor['up_down']
-            if neighbor_ip == value:
-                bgp_result += f"{'WAN interface' if key == 'TenGigabitEthernet0/2/0' else key} {neighbor_ip} - {'up' if bgp_state not in BGP_DOWN_STATES else 'down'} for over {bgp_uptime}. \n"
-    return bgp_result
+            bgp_result.append(f"{'WAN interface' if key == 'TenGigabitEthernet0/2/0' else key} {neighbor_ip} - {'up' if bgp_state not in BGP_DOWN_STATES else 'down'} for over {bgp_uptime}. \n")
+    return "".join(bgp_result)
 
 
-def tunnel_status(show_interfaces):
+@tracer.traced("validate")
+def tunnel_status(interfaces_index):
     """This function checks and formats the status of the tunnel interfaces.
 
     Parameters
     ----------
-    show_interfaces : list
-        List that contains the output of the "Show interfaces" command
+    interfaces_index : dict
+        Output of the "Show interfaces" command indexed by interface_index
 
     Returns
     -------
     tunnel_result : str
         String that contains the tunnel interface status in the template format.
     """
-    tunnel_result = ''
-    for interface in show_interfaces:
-        interface_name = interface["interface"]
-        if interface_name in ("Tunnel21", "Tunnel22"):
+    tunnel_result = []
+    for interface_name in ("Tunnel21", "Tunnel22"):
+        interface = interfaces_index.get(interface_name)
+        if interface:
             interface_ip = interface['ip_address']
             interface_link_status = interface['link_status']
-            tunnel_result += f"{interface_name} \n {interface_ip} {interface_link_status} \n"
-    return tunnel_result
+            tunnel_result.append(f"{interface_name} \n {interface_ip} {interface_link_status} \n")
+    return "".join(tunnel_result)
+
+
+def device_report(index, writing_list, current_time, logs_title="Last 10 logs"):
+    """
+    This function returns the part of the report of one device.
+
+    Parameters:
+    index : int
+        Position of the device in REQUIRED_INTERFACES_DICT.
+    writing_list : list
+        Results of check_device for the device.
+    current_time : datetime
+        Time shown in the header of the device.
+    logs_title : str
+        Title of the logs section.
+
+    Returns:
+        report (str)
+    """
+    device_name = list(REQUIRED_INTERFACES_DICT.keys())[index]
+    return "".join([f"{device_name} - {SP_LIST[index]} as of {current_time.strftime('%H:%M')} EST: {device_name} is {writing_list[0]}.\n",
+                    f"{writing_list[1]}\n", 
+                    f"BGP Status:\n{writing_list[2]}\n", 
+                    f"{writing_list[3]}\n", 
+                    f"Utilization:\n{writing_list[4]}\n", 
+                    f"{logs_title}:\n{writing_list[5]}\n", 
+                    f'{"/"*80}\n'])
+
+
+def error_report(index, error, current_time):
+    """
+    This function returns the part of the report of a device that could not be checked.
+
+    Parameters:
+    index : int
+        Position of the device in REQUIRED_INTERFACES_DICT.
+    error : str
+        Why the checks could not be completed.
+    current_time : datetime
+        Time shown in the header of the device.
+
+    Returns:
+        report (str)
+    """
+    device_name = list(REQUIRED_INTERFACES_DICT.keys())[index]
+    return "".join([f"{device_name} - {SP_LIST[index]} as of {current_time.strftime('%H:%M')} EST: {error}.\n",
+                    f'{"/"*80}\n'])
+
+
+def report_text(result_list, current_time, logs_title="Last 10 logs"):
+    """
+    This function returns the report of the data contained in result_list.
+
+    Parameters:
+    result_list : list
+        List that contains the results of the functions previously executed.
+    current_time : datetime
+        Time shown in the header of every device.
+    logs_title : str
+        Title of the logs section.
+
+    Returns:
+        report (str)
+    """
+    return "".join(device_report(i, [section[i] for section in result_list], current_time, logs_title)
+                   for i in range(2))
 
 
-def txt_writer(result_list):
+@tracer.traced("report")
+def txt_writer(result_list, username, current_time=None, logs_title="Last 10 logs", output_dir=None, formats=("txt",)):
     """
-    This function creates a .txt file and copies the data contained in result_list.
+    This function creates a .txt file and copies the data contained in result_list,
+    and writes the other report formats that are requested.
 
     Parameters:
     result_list : list
         List that contains the results of the functions previously executed.
+    username : str
+        User whose desktop the file is saved to.
+    current_time : datetime
+        Time shown in the report, now by default.
+    logs_title : str
+        Title of the logs section.
+    output_dir : str
+        Folder of the reports, the user's desktop by default.
+    formats : tuple
+        Report formats, see report_renderer.RENDERERS.
 
     Returns:
         None
     """
-    current_time = datetime.now()
-    with open(f"C:\\Users\\{username}\\Desktop\\Internet_checks.txt", "w", encoding="UTF-8") as file:
+    current_time = current_time or datetime.now()
+    with open_renderer(username, output_dir, formats) as renderer:
         for i in range(2):
-            device_name = list(REQUIRED_INTERFACES_DICT.keys())[i]
-            lines_to_write = [f"{device_name} - {SP_LIST[i]} as of {current_time.strftime('%H:%M')} EST: {device_name} is {result_list[0][i]}.\n",
-                              f"{result_list[1][i]}\n", 
-                              f"BGP Status:\n{result_list[2][i]}\n", 
-                              f"{result_list[3][i]}\n", 
-                              f"Utilization:\n{result_list[4][i]}\n", 
-                              f"Last 10 logs:\n{result_list[5][i]}\n", 
-                              f'{"/"*80}\n']
-            for line in lines_to_write:
-                file.write(line)
+            writing_list = [section[i] for section in result_list]
+            renderer.write(list(REQUIRED_INTERFACES_DICT.keys())[i], dict(zip(SECTION_NAMES, writing_list)),
+                           device_report(i, writing_list, current_time, logs_title))
+
+
+def open_renderer(username, output_dir=None, formats=("txt",)):
+    """
+    This function opens the report files of the internet checks.
+
+    Parameters:
+    username : str
+        User whose desktop the files are saved to.
+    output_dir : str
+        Folder of the reports, the user's desktop by default.
+    formats : tuple
+        Report formats, see report_renderer.RENDERERS.
+
+    Returns:
+        renderer (ReportRenderer)
+    """
+    return ReportRenderer(output_dir or f"C:\\Users\\{username}\\Desktop", "Internet_checks", formats, "Internet checks")
+
+
+def serve_report(port, pages):
+    """
+    This function serves the latest report over HTTP in a background thread.
+
+    Parameters:
+    port : int
+        Port to listen on.
+    pages : dict
+        {path: (content type, function returning the current text of the page)}
+
+    Returns:
+        server (ThreadingHTTPServer)
+    """
+    class ReportHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in pages:
+                self.send_error(404)
+                return
+            content_type, get_page = pages[self.path]
+            body = get_page().encode("UTF-8")
+            self.send_response(200)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), ReportHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def watch(routers, username, interval, port=None, syslog_port=None, reconcile=300, output_dir=None, formats=("txt",),
+          fact_run=None):
+    """
+    This function polls the edge routers concurrently every interval seconds
+    over sessions that stay open, and rewrites the report (and the served
+    copy) only when the results of a router changed.
+
+    With syslog_port, the BGP and interface state changes sent by the routers
+    are received as they happen and the report is updated within seconds
+    without an SSH round trip, the routers are only polled every reconcile
+    seconds to read the rest of the state. Every report starts a
+    new check: the logs and the peak utilization shown are the ones since the
+    previous report. The utilization rollups of every interface are served as
+    JSON on /utilization.
+
+    Parameters:
+    routers : list
+        EdgeRouter of every device in REQUIRED_INTERFACES_DICT.
+    username : str
+        User whose desktop the file is saved to.
+    interval : float
+        Seconds between the start of two polls.
+    port : int
+        If given, the report is also served over HTTP on this port.
+    syslog_port : int
+        If given, the syslog messages of the routers are received on this port (UDP and TCP).
+    reconcile : float
+        Seconds between two polls of a router when syslog is received.
+    output_dir : str
+        Folder of the reports, the user's desktop by default.
+    formats : tuple
+        Report formats, see report_renderer.RENDERERS.
+    fact_run : FactRun
+        If given, the verdicts and facts of the routers are recorded in the
+        fact store every time the report is updated.
+
+    Returns:
+        None
+    """
+    routers_by_ip = {router.ip_address: router for router in routers}
+    state_changed = Event()
+
+    def on_message(message):
+        if routers_by_ip[message.source].events.apply(message):
+            state_changed.set()
+
+    receiver = SyslogReceiver(on_message, syslog_port, allowed_sources=set(routers_by_ip)).start() if syslog_port else None
+    report = "The first poll has not finished yet.\n"
+    pages = {"/": ("text/plain", lambda: report),
+             "/utilization": ("application/json",
+                              lambda: json.dumps({router.device: router.rates.rollups() for router in routers}, indent=2))}
+    server = serve_report(port, pages) if port else None
+    try:
+        with ThreadPoolExecutor(max_workers=len(routers)) as executor:
+            while True:
+                started = monotonic()
+                state_changed.clear()
+                due = [router for router in routers if not receiver or router.polled_at is None
+                       or (datetime.now() - router.polled_at).total_seconds() >= reconcile]
+                changes = list(executor.map(EdgeRouter.poll, due))
+                changes += [router.refresh() for router in routers if router not in due]
+                if any(changes) and all(router.results for router in routers):
+                    result_list = [list(section) for section in zip(*(router.results for router in routers))]
+                    current_time = datetime.now()
+                    report = report_text(result_list, current_time, WATCH_LOGS_TITLE)
+                    txt_writer(result_list, username, current_time, WATCH_LOGS_TITLE, output_dir, formats)
+                    for router in routers:
+                        router.mark_checked()
+                        if fact_run:
+                            fact_run.record(router.device, router.facts)
+                    print(f"{current_time.strftime('%H:%M:%S')} report updated")
+                state_changed.wait(max(0, interval - (monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.shutdown()
+        if receiver:
+            receiver.close()
+        for router in routers:
+            router.close()
 
 
 if __name__ == '__main__':
-    result_list = [[],[],[],[],[],[]]
+    parser = ArgumentParser(description="Creates the internet checks report of the edge routers")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="live",
+                        help="record the command output, replay it offline, or use recent captures (auto)")
+    parser.add_argument("--cache-ttl", type=int, default=900,
+                        help="seconds a capture is reused in auto mode (default: 900)")
+    parser.add_argument("--trace", help="write the timing spans to this JSON Lines file, "
+                                        "and the Prometheus metrics next to it (.prom)")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="keep the sessions open and poll the routers every SECONDS, "
+                             "the report is rewritten when something changes")
+    parser.add_argument("--serve", type=int, metavar="PORT",
+                        help="in watch mode, also serve the latest report over HTTP on this port")
+    parser.add_argument("--syslog-port", type=int, metavar="PORT",
+                        help="in watch mode, receive the BGP and interface state changes of the routers "
+                             "over syslog (UDP and TCP) on this port")
+    parser.add_argument("--reconcile", type=float, default=300, metavar="SECONDS",
+                        help="with --syslog-port, seconds between two polls of a router (default: 300)")
+    parser.add_argument("--targeted-interfaces", action="store_true",
+                        help="only request and parse the interfaces listed in REQUIRED_INTERFACES_DICT")
+    parser.add_argument("--output-dir", help="folder of the reports, the desktop by default")
+    parser.add_argument("--formats", nargs="+", choices=list(RENDERERS), default=["txt"],
+                        help="report formats written as each router is checked (default: txt)")
+    parser.add_argument("--no-probe", action="store_true",
+                        help="log in to the routers without probing TCP/22 first")
+    parser.add_argument("--probe-timeout", type=float, default=2,
+                        help="seconds the TCP/22 probe of a router waits (default: 2)")
+    parser.add_argument("--facts", nargs="?", const=DEFAULT_STORE, metavar="DATABASE",
+                        help="record the verdict and facts of every check in a SQLite fact store "
+                             "(Common/facts.db by default), queried with Common/fact_store.py")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="netmiko",
+                        help="SSH transport, asyncssh drives many more sessions per process (default: netmiko)")
+    args = parser.parse_args()
+    use_transport(args.transport)
+    if args.trace:
+        tracer.enable(args.trace, str(Path(args.trace).with_suffix(".prom")))
+    command_cache = CommandCache(mode=args.cache_mode, ttl=args.cache_ttl) if args.cache_mode != "live" else None
     username = input("Enter your username: ")
     password = getpass()
-    for device in REQUIRED_INTERFACES_DICT:
-        device_ip = REQUIRED_INTERFACES_DICT[device]["mgmt_interface"]
-        output = send_commands()
-        hostname = output["hostname"]
-        interfaces_status = status_and_errors(output["show_interfaces"])
-        bgp = bgp_information(output["bgp_summary"])
-        tunnels_result= tunnel_status(output["show_interfaces"])
-        utilization_result = utilization(output["show_interfaces"])
-        writing_list = [output["hsrp_status"], interfaces_status, bgp, 
-                       tunnels_result, utilization_result, output["logs"]]
-        for formated_line in writing_list:
-            result_list[writing_list.index(formated_line)].append(formated_line)
-    txt_writer(result_list)
\ No newline at end of file
+    fact_run = FactRun("internet_checks", args.facts) if args.facts else None
+    if args.watch:
+        #an hour of rates per interface
+        history = max(1, int(3600 / args.watch) + 1)
+        watch([EdgeRouter(device, username, password, history, command_cache, args.targeted_interfaces)
+               for device in REQUIRED_INTERFACES_DICT],
+              username, args.watch, args.serve, args.syslog_port, args.reconcile, args.output_dir, args.formats,
+              fact_run)
+    else:
+        #the result of every router is written as soon as it is checked
+        current_time = datetime.now()
+        routers = [EdgeRouter(device, username, password, command_cache=command_cache,
+                              targeted_interfaces=args.targeted_interfaces) for device in REQUIRED_INTERFACES_DICT]
+        unreachable = []
+        #a router that is down is known in seconds instead of after the SSH timeout, replayed runs don't connect
+        if not args.no_probe and args.cache_mode != "replay":
+            _, unreachable = ReachabilityProbe(timeout=args.probe_timeout).probe([router.ip_address for router in routers])
+        with open_renderer(username, args.output_dir, args.formats) as renderer:
+            for index, router in enumerate(routers):
+                device = router.device
+                with tracer.device(router.ip_address):
+                    if router.ip_address in unreachable:
+                        print(f"A connection to {device} could not be established. It appears to be down")
+                        output = {}
+                        error = "SSH (TCP/22) did not answer, the checks could not be completed"
+                    else:
+                        output = send_commands(device, router.device_handler, router.command_cache,
+                                               router.targeted_interfaces)
+                        error = "The commands could not be run, the checks could not be completed"
+                    #a router that could not be checked is reported as such and the next one is still checked
+                    if output:
+                        writing_list = check_device(output)
+                        renderer.write(device, dict(zip(SECTION_NAMES, writing_list)),
+                                       device_report(index, writing_list, current_time))
+                    else:
+                        renderer.write(device, {"error": error}, error_report(index, error, current_time), "error")
+                if fact_run:
+                    fact_run.record(device, device_facts(device, output) if output else error_facts(f"{device}: {error}"))
+    if fact_run:
+        fact_run.close()
+    if args.trace:
+        tracer.close()
+        print(tracer.summary())
\ No newline at end of file
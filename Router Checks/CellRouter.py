@@ -1,18 +1,21 @@
 from Router import Router
-from netmiko import ConnectHandler
 from templates import radio_template
+from instrumentation import tracer
 
 class CellRouter(Router):
-    def __init__(self, ip_address, credentials):
-        super().__init__(ip_address, credentials)
+    def __init__(self, ip_address, credentials, **options):
+        super().__init__(ip_address, credentials, **options)
 
 
-    def execute_commands(self):
-        results = super().execute_commands()
-        with ConnectHandler(**self.handler) as net_connect:
-            radio_output = net_connect.send_command("Show cellular 0/1/0 radio", use_ttp=True, ttp_template=radio_template)
-            results["cell_levels"] = radio_output
-        return results
+    def collect_commands(self, net_connect, results):
+        super().collect_commands(net_connect, results)
+        radio_output = net_connect.send_command("Show cellular 0/1/0 radio", use_ttp=True, ttp_template=radio_template)
+        results["cell_levels"] = radio_output
+
+
+    def collect_operational_commands(self, net_connect, results):
+        super().collect_operational_commands(net_connect, results)
+        results["cell_levels"] = net_connect.send_command("Show cellular 0/1/0 radio", use_ttp=True, ttp_template=radio_template)
 
 
     def cell_levels(self, levels):
@@ -36,4 +39,9 @@ class CellRouter(Router):
             f"\tRSRQ: {levels.get('RSRQ')}\n"
             f"\tChannel: {levels.get('rx_channel')}\n"
             f"\tRAT: {levels.get('RAT_selected')}\n")
-        Router.output_dict["cell_levels"] = signal_parameters
+        self.output_dict["cell_levels"] = signal_parameters
+        self.add_fact("cell_levels", "info", rssi=levels.get('RSSI'), rsrp=levels.get('RSRP'), rsrq=levels.get('RSRQ'),
+                      channel=levels.get('rx_channel'), rat=levels.get('RAT_selected'))
+
+
+tracer.instrument_methods(CellRouter, "validate", prefixes=("cell_levels",))
@@ -1,23 +1,29 @@
 from re import match
 from Router import Router
-from netmiko import ConnectHandler
 from templates import bfd_template
+from instrumentation import tracer
 
 class FieldRouter(Router):
     BGP_DOWN_STATES = ("Idle", "Connect", "Active")
     ISE_SERVERS = ['10.81.89.123', '10.72.31.189', '10.78.1.115', '10.78.12.16']
+    config_results = Router.config_results + ("lan_interface_results", "wan_interface_results", "pm_results",
+                                              "default_route_results", "ise_results")
     
-    def __init__(self, ip_address, credentials):
-        super().__init__(ip_address, credentials)
+    def __init__(self, ip_address, credentials, **options):
+        super().__init__(ip_address, credentials, **options)
 
 
-    def execute_commands(self):
-        results = super().execute_commands()
-        with ConnectHandler(**self.handler) as net_connect:
-            results["bfd_status"] = net_connect.send_command("show bfd neighbor", use_ttp=True, ttp_template=bfd_template)
-            for variable,command in Router.command_dict[1].items():
-                results[variable] = net_connect.send_command(command, use_textfsm=True)
-        return results
+    def collect_commands(self, net_connect, results):
+        super().collect_commands(net_connect, results)
+        results["bfd_status"] = net_connect.send_command("show bfd neighbor", use_ttp=True, ttp_template=bfd_template)
+        for variable,command in Router.command_dict[1].items():
+            results[variable] = self.run_command(net_connect, command, use_textfsm=True)
+
+
+    def collect_operational_commands(self, net_connect, results):
+        super().collect_operational_commands(net_connect, results)
+        results["bfd_status"] = net_connect.send_command("show bfd neighbor", use_ttp=True, ttp_template=bfd_template)
+        results["bgp_info"] = net_connect.send_command(Router.command_dict[1]["bgp_info"], use_textfsm=True)
 
 
     def speed_duplex_validator(self, interface_config, if_type):
@@ -43,9 +49,11 @@ class FieldRouter(Router):
         is_duplex_full = "duplex full" in interface_config or "no negotiation auto" in interface_config
         is_speed_set = "speed 100" in interface_config or "speed 1000" in interface_config
         speed = 1000 if "speed 1000" in interface_config else 100 if "speed 100" in interface_config else None
-        Router.output_dict[f"{if_type.lower()}_interface_results"] = (
+        self.output_dict[f"{if_type.lower()}_interface_results"] = (
             f"The {if_type} interface speed is {'hardcoded to ' + str(speed) if is_speed_set else 'set to auto'} "
             f"and the duplex is {'hardcoded to Full' if is_duplex_full else 'set to auto'}.\n")
+        self.add_fact(f"{if_type.lower()}_interface_results", "pass" if is_speed_set and is_duplex_full else "fail",
+                      speed=speed, duplex_full=is_duplex_full)
 
 
     def bgp_status(self, bgp_info):
@@ -65,7 +73,9 @@ class FieldRouter(Router):
         """
         bgp_uptime, bgp_state = bgp_info["up_down"], bgp_info["state_pfxrcd"]
         status = "up" if bgp_state not in FieldRouter.BGP_DOWN_STATES else "down"
-        Router.output_dict["bgp_results"] = f"BGP has been {status} for over {bgp_uptime}.\n"
+        self.output_dict["bgp_results"] = f"BGP has been {status} for over {bgp_uptime}.\n"
+        self.add_fact("bgp_results", "pass" if status == "up" else "fail", state=bgp_state, status=status,
+                      uptime=bgp_uptime)
 
 
     def bfd_status(self, bfd_info):
@@ -88,9 +98,12 @@ class FieldRouter(Router):
             bfd_info = bfd_info[0][0][0]
             neighbor_address = bfd_info['neighbor_address']
             status = "UP" if bfd_info["state"] == "Up" else "DOWN"
-            Router.output_dict["bfd_results"] = f"BFD neighborship with {neighbor_address} is {status}.\n"
+            self.output_dict["bfd_results"] = f"BFD neighborship with {neighbor_address} is {status}.\n"
+            self.add_fact("bfd_results", "pass" if status == "UP" else "fail", configured=True,
+                          neighbor=neighbor_address, status=status)
         except:
-            Router.output_dict["bfd_results"] = "BFD is not configured.\n"
+            self.output_dict["bfd_results"] = "BFD is not configured.\n"
+            self.add_fact("bfd_results", "fail", configured=False, neighbor=None, status=None)
 
 
     def policy_map_checker(self, pm_info, pm_interface):
@@ -114,20 +127,25 @@ class FieldRouter(Router):
             #if pm_info is an empty string, it's because the command did not return anything
             #we can assume that the policy map is not configured.
             if not pm_info:
-                Router.output_dict["pm_results"] = "The policy map is not configured.\n"
+                self.output_dict["pm_results"] = "The policy map is not configured.\n"
+                self.add_fact("pm_results", "fail", configured=False, applied=None)
 
             elif not pm_interface:
-                Router.output_dict["pm_results"] = "The policy map is configured but has not been applied to an interface.\n"
+                self.output_dict["pm_results"] = "The policy map is configured but has not been applied to an interface.\n"
+                self.add_fact("pm_results", "fail", configured=True, applied=None)
             #pm_interface contains more than just the interface, so we split the content in a
             #list and search for matches with the WAN interface ID.
             elif self.wan_interface not in pm_interface.split():
-                Router.output_dict["pm_results"] = (
+                self.output_dict["pm_results"] = (
                     f"The policy map is configured but is applied to the wrong interface ({pm_interface}). "
                     f"It should be configured on {self.wan_interface}.\n")
+                self.add_fact("pm_results", "fail", configured=True, applied=pm_interface, expected=self.wan_interface)
             else:
-                Router.output_dict["pm_results"] = f"The policy map is configured and applied to {self.wan_interface}.\n"
+                self.output_dict["pm_results"] = f"The policy map is configured and applied to {self.wan_interface}.\n"
+                self.add_fact("pm_results", "pass", configured=True, applied=self.wan_interface)
         except Exception as e:
-            Router.output_dict["pm_results"] = f"An error occurred while checking the policy map: {e}\n"
+            self.output_dict["pm_results"] = f"An error occurred while checking the policy map: {e}\n"
+            self.add_fact("pm_results", "error", message=str(e))
 
 
     def default_route_validator(self, default_route_info):
@@ -151,7 +169,8 @@ class FieldRouter(Router):
         if match_pattern
         else "The default weighted route is not configured.\n"
         )
-        Router.output_dict["default_route_results"] = result_message
+        self.output_dict["default_route_results"] = result_message
+        self.add_fact("default_route_results", "pass" if match_pattern else "fail", route=default_route_info or None)
 
 
     def ise_servers_validator(self, server_config):
@@ -175,4 +194,8 @@ class FieldRouter(Router):
             if not_configured_servers
             else f"All the ISE servers {','.join(FieldRouter.ISE_SERVERS)} have been configured.\n"
         )
-        Router.output_dict["ise_results"] = result_message
+        self.output_dict["ise_results"] = result_message
+        self.add_fact("ise_results", "fail" if not_configured_servers else "pass", missing=not_configured_servers)
+
+
+tracer.instrument_methods(FieldRouter, "validate", suffixes=("_validator", "_status", "_checker"))
@@ -1,16 +1,30 @@
+import sys
+from hashlib import sha1
+from inspect import getfile
+from pathlib import Path
 from socket import gethostbyaddr
 from ipaddress import ip_address as ip_module
-from napalm import get_network_driver
-from netmiko import ConnectHandler
 #imports the templates needed to parse with ttp the commands
 #that cannot be parsed with textfsm
 from templates import *
+from running_config import RunningConfig
+#modules shared by the different network projects
+sys.path.append(str(Path(__file__).resolve().parents[1] / "Common"))
+from acl_policy import AclPolicy
+from compliance_cache import config_digest
+from device_session import DeviceSession
+from instrumentation import tracer
+from report_renderer import ReportRenderer
 
 class Router:
-    output_dict = {}
-    
     SNMP_COMMUNITIES = ['snmp-server community community1 RO SNMP_RO',
                         'snmp-server community community2 RW SNMP_RW']
+    #Required ACLs, compiled once and shared by every router that is checked
+    ACL_POLICY = AclPolicy({
+        "SNMP_RO": ['10.83.34.107', '10.15.78.56', '10.15.79.51', '10.102.78.54', '10.8.96.53',
+                    '10.85.51.52', '10.96.42.51', '10.17.78.60', '10.102.35.67', '10.89.72.48', '10.92.202.4'],
+        "SNMP_RW": ['10.85.51.52', '10.96.42.51', '10.17.78.60', '10.102.35.67', '10.89.72.48',
+                    '10.97.71.50', '10.84.20.31', '10.41.23.58', '10.75.89.63']})
     command_dict = [{
         "interface_information": "show ip int brief | e unass",
         "general_information": "show ver",
@@ -22,10 +36,35 @@ class Router:
         "policy_map_interface": "show policy-map interface brief",
         "default_route": "show run | i ip route 0.0.0.0",
         "tacacs_information": "show run | i tacacs server"}]
-
-
-    def __init__(self, ip_address, credentials) -> None:
+    #commands whose output changes without a configuration change, they are sent even if
+    #the compliance results are reused (see execute_commands)
+    operational_commands = ("general_information", "vrrp_information")
+    #results of the validators that only depend on the configuration
+    config_results = ("flow_exporter_results", "snmp_results", "acl_results")
+    #identifies the configuration without generating all of it, used when there is no snapshot
+    digest_command = "show running-config | include Last configuration change"
+    #{router class: fingerprint of its validators}
+    fingerprints = {}
+
+
+    def __init__(self, ip_address, credentials, config_snapshot=False, command_cache=None,
+                 compliance_cache=None) -> None:
         self.ip_address= ip_address
+        #if given, the commands go through the record/replay cache (see open_session)
+        self.command_cache = command_cache
+        #if given, the config validators' results are reused while the configuration
+        #does not change (see execute_commands and record_compliance)
+        self.compliance_cache = compliance_cache
+        self.config_digest = None
+        self.compliance_results = None
+        #if True, the running config is fetched once and the "show run" commands
+        #are answered from the local snapshot (see run_command)
+        self.config_snapshot = config_snapshot
+        self.running_config = None
+        #results are kept per instance so several routers can be checked at the same time
+        self.output_dict = {}
+        #verdict and facts of every check, by the same names as output_dict (see add_fact)
+        self.fact_dict = {}
         self.username = credentials["username"]
         self.password = credentials["password"]
         self.handler = {"device_type": "cisco_ios", 
@@ -63,7 +102,8 @@ class Router:
     def execute_commands(self):
         """
         This function executes the commands needed to perform the configuration 
-        validations.
+        validations. A single SSH session is opened for the device, it is used
+        for the NAPALM environment facts and for the commands of every router type.
 
         Args:
         None
@@ -73,21 +113,169 @@ class Router:
             Dictionary that contains the results of the executed commands.
         """
         command_results = {}
-        #get device environment facts with NAPALM
-        driver_ios = get_network_driver("ios")
-        device = driver_ios(hostname=self.ip_address, username=self.username, password=self.password)
-        device.open()
-        command_results["environment_information"] = device.get_environment()
-        with ConnectHandler(**self.handler) as net_connect:
-            for variable,command in Router.command_dict[0].items():
-                command_results[variable] = net_connect.send_command(command, use_textfsm=True)
-            Router.get_interface_role(self, command_results["interface_information"])
-            command_results["lan_config"] = net_connect.send_command(f"show run interface {self.lan_interface}")
-            command_results["wan_config"] = net_connect.send_command(f"show run interface {self.wan_interface}")
-            command_results["flow_exporter_information"] = net_connect.send_command("show flow exporter", use_ttp=True, ttp_template=flow_template_4331)
+        with self.open_session() as session:
+            command_results["environment_information"] = session.get_environment()
+            if self.compliance_cache is not None:
+                self.config_digest = self.fetch_config_digest(session)
+                self.compliance_results = self.compliance_cache.load(self.ip_address, self.config_digest,
+                                                                     self.validator_fingerprint())
+            if self.compliance_results is not None:
+                self.collect_operational_commands(session, command_results)
+            else:
+                self.collect_commands(session, command_results)
         return command_results
 
 
+    def fetch_config_digest(self, net_connect):
+        """
+        This function returns the digest of the router's configuration. With
+        the config snapshot it is the digest of the whole running config, which
+        is kept for the "show run" commands, otherwise of its last change line.
+
+        Args:
+        net_connect : DeviceSession
+            Open session to the router.
+
+        Returns:
+        digest : str
+            Digest of the configuration, None if it can't be identified.
+        """
+        if self.config_snapshot:
+            self.running_config = RunningConfig(net_connect.send_command("show running-config"))
+            return config_digest("\n".join(self.running_config.lines))
+        return config_digest(net_connect.send_command(self.digest_command))
+
+
+    @classmethod
+    def validator_fingerprint(cls):
+        """
+        This function returns a digest of the code of the router class and
+        of the modules its validators use, the results stored by another
+        version of the validators are not reused.
+
+        Args:
+        None
+
+        Returns:
+        fingerprint : str
+            SHA-1 of the source files.
+        """
+        if cls not in Router.fingerprints:
+            files = sorted({getfile(klass) for klass in cls.__mro__[:-1]} | {getfile(AclPolicy), getfile(RunningConfig)})
+            Router.fingerprints[cls] = sha1(b"".join(Path(file_name).read_bytes() for file_name in files)).hexdigest()
+        return Router.fingerprints[cls]
+
+
+    def collect_operational_commands(self, net_connect, command_results):
+        """
+        This function runs only the commands of the operational checks, it
+        is used instead of collect_commands when the compliance results are
+        reused. The subclasses extend it with their own operational commands.
+
+        Args:
+        net_connect : DeviceSession
+            Open session to the router.
+        command_results : dict
+            Dictionary where the results of the commands are added.
+
+        Returns:
+        None
+        """
+        for variable in Router.operational_commands:
+            command_results[variable] = net_connect.send_command(Router.command_dict[0][variable], use_textfsm=True)
+
+
+    def record_compliance(self):
+        """
+        This function completes the compliance part of the results. The
+        reused results are merged with the operational ones in the order of
+        a full audit, or the results of a full audit are stored for the next ones.
+
+        Args:
+        None
+
+        Returns:
+        None
+        """
+        if self.compliance_results is not None:
+            results = {**self.compliance_results["results"], **self.output_dict}
+            sections = self.compliance_results["sections"] + [section for section in self.output_dict
+                                                              if section not in self.compliance_results["sections"]]
+            self.output_dict = {section: results[section] for section in sections if section in results}
+            self.fact_dict = {**self.compliance_results["facts"], **self.fact_dict}
+        elif self.compliance_cache is not None and self.config_digest:
+            self.compliance_cache.store(self.ip_address, self.config_digest, self.validator_fingerprint(),
+                                        {section: self.output_dict[section] for section in self.config_results
+                                         if section in self.output_dict}, list(self.output_dict),
+                                        {section: self.fact_dict[section] for section in self.config_results
+                                         if section in self.fact_dict})
+
+
+    def open_session(self):
+        """
+        This function returns the session used to execute the commands,
+        a cached session if a command cache was given, otherwise an SSH session.
+
+        Args:
+        None
+
+        Returns:
+        session : DeviceSession, CachedSession
+            Session to the router, not opened yet.
+        """
+        if self.command_cache is not None:
+            return self.command_cache.session(self.handler)
+        return DeviceSession(self.handler)
+
+
+    def collect_commands(self, net_connect, command_results):
+        """
+        This function runs the commands shared by every router type. The
+        subclasses extend it to add their own commands to the same session.
+
+        Args:
+        net_connect : DeviceSession
+            Open session to the router.
+        command_results : dict
+            Dictionary where the results of the commands are added.
+
+        Returns:
+        None
+        """
+        #the snapshot may have been fetched already for the config digest
+        if self.config_snapshot and self.running_config is None:
+            self.running_config = RunningConfig(net_connect.send_command("show running-config"))
+        for variable,command in Router.command_dict[0].items():
+            command_results[variable] = self.run_command(net_connect, command, use_textfsm=True)
+        Router.get_interface_role(self, command_results["interface_information"])
+        command_results["lan_config"] = self.run_command(net_connect, f"show run interface {self.lan_interface}")
+        command_results["wan_config"] = self.run_command(net_connect, f"show run interface {self.wan_interface}")
+        command_results["flow_exporter_information"] = net_connect.send_command("show flow exporter", use_ttp=True, ttp_template=flow_template_4331)
+
+
+    def run_command(self, net_connect, command, **kwargs):
+        """
+        This function executes a command on the router. When the running
+        config snapshot is enabled, the "show run" commands are answered
+        from it instead of being sent to the router.
+
+        Args:
+        net_connect : DeviceSession
+            Open session to the router.
+        command : str
+            Command to execute.
+        kwargs : dict
+            Arguments passed to send_command (use_textfsm, use_ttp, etc).
+
+        Returns:
+        output : str, List
+            Output of the command.
+        """
+        if self.running_config is not None and command.startswith("show run"):
+            return self.running_config.answer(command)
+        return net_connect.send_command(command, **kwargs)
+
+
     def format_general_info(self, general_facts):
         """
         This function formats the router's general information
@@ -101,8 +289,10 @@ class Router:
         Returns:
         None
         """
-        Router.output_dict["device_info_results"] = (
+        self.output_dict["device_info_results"] = (
         f"Cisco {general_facts['hardware'][0]}. Router {general_facts['hostname']}. Uptime {general_facts['uptime']}.\n")
+        self.add_fact("device_info_results", "info", model=general_facts['hardware'][0],
+                      hostname=general_facts['hostname'], uptime=general_facts['uptime'])
 
 
     def format_environment_info(self, show_environment):
@@ -121,11 +311,13 @@ class Router:
         power = show_environment["power"]["invalid"]["status"]
         temperature = show_environment["temperature"]["invalid"]["is_alert"]
         fans = show_environment["fans"]["invalid"]["status"]
-        Router.output_dict["environment_results"] = (
+        self.output_dict["environment_results"] = (
         f"Power is {'normal' if  power else 'in Alert'}, "
         f"the temperature is {'normal' if temperature is False else 'High'},"
         f"and fans are {'normal' if fans else 'in alert'}.\n"
         )
+        self.add_fact("environment_results", "pass" if power and temperature is False and fans else "fail",
+                      power=power, temperature_alert=temperature, fans=fans)
 
 
     def format_vrrp_status(self, vrrp_info):
@@ -141,7 +333,8 @@ class Router:
         None
         """
         if not vrrp_info:
-            Router.output_dict["vrrp_results"] = "VRRP is not configured on this router\n"
+            self.output_dict["vrrp_results"] = "VRRP is not configured on this router\n"
+            self.add_fact("vrrp_results", "fail", configured=False)
             return
 
         groups_status_review = [vrrp["group"] for vrrp in vrrp_info if vrrp["state"] != "Master"]
@@ -155,7 +348,9 @@ class Router:
         if not groups_priority_review
         else f"The priority is not properly configured for the following groups: {', '.join(groups_priority_review)}")
 
-        Router.output_dict["vrrp_results"] = f"{is_master} and {is_priority_right}.\n"
+        self.output_dict["vrrp_results"] = f"{is_master} and {is_priority_right}.\n"
+        self.add_fact("vrrp_results", "fail" if groups_status_review or groups_priority_review else "pass",
+                      configured=True, not_master=groups_status_review, wrong_priority=groups_priority_review)
     
 
     def flow_exporter_validator(self, wan_config, flow_exporter):
@@ -179,6 +374,8 @@ class Router:
             "10.79.126.84", "10.51.18.13",
             "10.45.35.184", "10.9.111.15")
         exporter_results = []
+        exporters = []
+        netflow_applied = 'ip flow monitor FIELD_SITES' in wan_config
         if len(flow_exporter[0][0]) < req_exporter_qty:
             exporter_results.append("A flow exporter is missing. Please check")
         else:
@@ -186,15 +383,22 @@ class Router:
                 src_int = exporter.get("source_interface")
                 dest_addr = exporter.get("destination_address")
                 dest_port = exporter.get("destination_port")
+                exporters.append({"name": exporter['name'], "source_interface": src_int,
+                                  "destination_address": dest_addr, "destination_port": dest_port,
+                                  "compliant": src_int in req_src_interface and dest_addr in req_dest_addr
+                                  and dest_port == req_dest_port})
                 exporter_results.append(f"Flow Exporter: {exporter['name']}")
                 exporter_results.append(f"{'NetFlow has been applied to the WAN interface.' if 'ip flow monitor FIELD_SITES' in wan_config else 'The interface config needs verification for proper NetFlow application.'}")
                 exporter_results.append(f"The source interface is {f'({src_int}) correctly configured.' if src_int in req_src_interface else 'misconfigured.'}")
                 exporter_results.append(f"The destination address is {f'({dest_addr}) correctly configured.' if dest_addr in req_dest_addr else 'misconfigured.'}")
                 exporter_results.append(f"The destination port is {f'({dest_port}) correctly configured.' if dest_port == req_dest_port else 'misconfigured.'}")
-        Router.output_dict["flow_exporter_results"] = "\n\n".join(exporter_results) + "\n\n"
+        self.output_dict["flow_exporter_results"] = "\n\n".join(exporter_results) + "\n\n"
+        passed = exporters and netflow_applied and all(exporter["compliant"] for exporter in exporters)
+        self.add_fact("flow_exporter_results", "pass" if passed else "fail", exporters=exporters,
+                      netflow_applied=netflow_applied)
 
 
-    def name_getter(ip):
+    def name_getter(self, ip):
         """
         This function checks if a DNS entry exists for the device that is being
         checked, then adds the information to output_dict.
@@ -208,9 +412,11 @@ class Router:
         """
         try:
             hostname = gethostbyaddr(ip)[0]
-            Router.output_dict[f"dns_results"] = f"This device is registered on the DNS server as: {hostname}.\n"
+            self.output_dict[f"dns_results"] = f"This device is registered on the DNS server as: {hostname}.\n"
+            self.add_fact("dns_results", "pass", hostname=hostname)
         except:
-            Router.output_dict[f"dns_results"] = "No DNS entry was found for this device.\n"
+            self.output_dict[f"dns_results"] = "No DNS entry was found for this device.\n"
+            self.add_fact("dns_results", "fail", hostname=None)
 
 
     def snmp_validator(self, configured_communities):
@@ -226,11 +432,14 @@ class Router:
         None
         """
         not_configured_communities = [community for community in Router.SNMP_COMMUNITIES if community not in configured_communities]
+        #the community strings are not stored, only the access and ACL of the missing ones (e.g. "RO SNMP_RO")
+        self.add_fact("snmp_results", "fail" if not_configured_communities else "pass",
+                      missing=[" ".join(community.split()[-2:]) for community in not_configured_communities])
         not_configured_communities = ','.join(not_configured_communities)
         community_result = (f"The following SNMP community strings are not configured: {not_configured_communities}\n" 
                             if not_configured_communities 
                             else "All the SNMP community strings have been configured.\n")
-        Router.output_dict[f"snmp_results"] = f"{community_result}"
+        self.output_dict[f"snmp_results"] = f"{community_result}"
 
 
     def acl_validator(self, current_aces):
@@ -245,39 +454,74 @@ class Router:
         Returns:
         None
         """
-        #Required ACLs
-        snmp_ro = ['10.83.34.107', '10.15.78.56', '10.15.79.51', '10.102.78.54', '10.8.96.53', 
-                   '10.85.51.52', '10.96.42.51', '10.17.78.60', '10.102.35.67', '10.89.72.48', '10.92.202.4']
-        snmp_rw = ['10.85.51.52', '10.96.42.51', '10.17.78.60', '10.102.35.67', '10.89.72.48', 
-                   '10.97.71.50', '10.84.20.31', '10.41.23.58', '10.75.89.63']
-        #Checks if the current ACEs are in the required list, if so, those IPs will be removed from
-        #the corresponding list. At the end, it assumes that if the lists are empty, it's because
-        #the required IPs are in the ACLs.
-        for acl in current_aces:
-            if acl["acl_name"] == 'SNMP_RO' and acl['src_host'] in snmp_ro:
-                snmp_ro.remove(acl['src_host'])
-            elif acl["acl_name"] == 'SNMP_RW' and acl['src_host'] in snmp_rw:
-                snmp_rw.remove(acl['src_host'])
+        #Host, network and wildcard ACEs are evaluated against the compiled policy,
+        #the result contains the required IPs that none of the ACEs permit.
+        missing = Router.ACL_POLICY.missing_sources(current_aces)
+        snmp_ro, snmp_rw = missing["SNMP_RO"], missing["SNMP_RW"]
         ro_acl_result = (f"The SNMP RO ACL has been added to this device.\n\n" if len(snmp_ro) == 0 else "The SNMP "
                         f"RO ACL has not been added to this device. The following IPs {snmp_ro} are missing.\n\n")
         rw_acl_result = (f"The SNMP RW ACL has been added to this device.\n\n" if len(snmp_rw) == 0 else "The SNMP RW "
                         f"ACL has not been added to this device. The following IPs {snmp_rw} are missing.\n\n")
-        Router.output_dict["acl_results"] = f"{ro_acl_result}{rw_acl_result}"
+        self.output_dict["acl_results"] = f"{ro_acl_result}{rw_acl_result}"
+        self.add_fact("acl_results", "fail" if snmp_ro or snmp_rw else "pass", missing=[*snmp_ro, *snmp_rw],
+                      missing_ro=snmp_ro, missing_rw=snmp_rw)
+
+
+    def add_fact(self, section, verdict, **facts):
+        """
+        This function records the verdict of a check and the facts it was
+        based on, for the fact store (see Common/fact_store.py).
+
+        Args:
+        section : str
+            Name of the result in output_dict.
+        verdict : str
+            "pass", "fail", or "info" for the checks that only report information.
+        facts : dict
+            JSON serializable facts, e.g. missing=["10.81.89.123"].
+
+        Returns:
+        None
+        """
+        self.fact_dict[section] = {"verdict": verdict, "value": facts}
 
 
-    def file_writer(self, username):
+    def file_writer(self, username, output_dir=None, formats=("txt",)):
         """
         This function writes a .txt file that contains the
-        result of the configuration checks.
+        result of the configuration checks, and the other
+        report formats that are requested.
 
         Args:
         username : str
             Username of the person performing the checks.
+        output_dir : str
+            Folder of the reports, the user's desktop by default.
+        formats : tuple
+            Report formats, see report_renderer.RENDERERS.
 
         Returns:
         None
         """
-        with open(f"C:\\Users\\{username}\\Desktop\\router_site_review.txt", "w", encoding="UTF-8") as writer_element:
-            for result in Router.output_dict.values():
-                writer_element.write(f"{result}\n")
+        with ReportRenderer(output_dir or f"C:\\Users\\{username}\\Desktop", "router_site_review", formats) as renderer:
+            renderer.write(self.ip_address, self.output_dict, self.report_text())
+
+
+    def report_text(self):
+        """
+        This function returns the result of the configuration checks
+        in the same format used by file_writer.
+
+        Args:
+        None
+
+        Returns:
+        report : str
+            Text of the report.
+        """
+        return "".join(f"{result}\n" for result in self.output_dict.values())
+
 
+#times the formatters, validators and report writers when tracing is enabled
+tracer.instrument_methods(Router, "validate", prefixes=("format_",), suffixes=("_validator",))
+tracer.instrument_methods(Router, "report", prefixes=("file_writer", "report_text"))
@@ -3,47 +3,380 @@ This script verifies that the router's configuration is in compliance
 with the required network assurance parameters, and also checks the operational
 status of protocols like BGP, VRRP, and BFD.
 """
+import csv
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from getpass import getpass
+from pathlib import Path
 from FieldRouter import FieldRouter
 from CellRouter import CellRouter
+from command_cache import CommandCache, CACHE_MODES
+from compliance_cache import ComplianceCache
+from device_session import TRANSPORTS, use_transport
+from fact_store import DEFAULT_STORE, FactRun, error_facts
+from instrumentation import tracer
+from scheduler import AdaptiveScheduler
+from reachability import ReachabilityProbe
+from sharding import ShardRunner, serve_shards
+from report_renderer import RENDERERS, ReportRenderer
+
+ROUTER_TYPES = {"field": FieldRouter, "cell": CellRouter}
+#cellular sites are low-bandwidth, their routers are checked one at a time per site
+CELL_SITE_LIMIT = 1
 
 def execute_router_commands(device):
     router_facts = device.execute_commands()
+    #the config validators are skipped when their results are reused for an unchanged configuration
+    check_config = device.compliance_results is None
     device.format_general_info(router_facts["general_information"][0])
     device.format_environment_info(router_facts["environment_information"])
     device.format_vrrp_status(router_facts["vrrp_information"])
-    device.flow_exporter_validator(router_facts["wan_config"], router_facts["flow_exporter_information"])
-    device.snmp_validator(router_facts["snmp_servers_information"])
-    device.acl_validator(router_facts["acls_information"])
+    if check_config:
+        device.flow_exporter_validator(router_facts["wan_config"], router_facts["flow_exporter_information"])
+        device.snmp_validator(router_facts["snmp_servers_information"])
+        device.acl_validator(router_facts["acls_information"])
     if isinstance(device, FieldRouter):
         device.bgp_status(router_facts["bgp_info"][0])
         device.bfd_status(router_facts["bfd_status"])
-        device.policy_map_checker(router_facts["policy_map"], router_facts["policy_map_interface"])
-        device.default_route_validator(router_facts["default_route"])
-        device.ise_servers_validator(router_facts["tacacs_information"])
-        for if_type, interface_config in [("LAN", router_facts["lan_config"]), ("WAN", router_facts["wan_config"])]:
-            device.speed_duplex_validator(interface_config, if_type)
+        if check_config:
+            device.policy_map_checker(router_facts["policy_map"], router_facts["policy_map_interface"])
+            device.default_route_validator(router_facts["default_route"])
+            device.ise_servers_validator(router_facts["tacacs_information"])
+            for if_type, interface_config in [("LAN", router_facts["lan_config"]), ("WAN", router_facts["wan_config"])]:
+                device.speed_duplex_validator(interface_config, if_type)
     elif isinstance(device, CellRouter):
-        device.snmp_validator(router_facts["cell_levels"])
+        device.cell_levels(router_facts["cell_levels"])
+    device.record_compliance()
 
-if __name__ == "__main__":
-#Prompt the user for router information
-    while True:
-        router_type = input("""
-        Please choose the type of router to check:
-        1. Cellular Router
-        2. Field Router
-        Enter the number corresponding to your choice: """)
-        if router_type in ('1', '2'):
-            break
+def read_inventory(file_name):
+    """
+    This function reads the inventory used by the fleet mode. Every line
+    has the IP address of a router and, optionally, its type (field or cell),
+    field routers are assumed when the type is missing.
+
+    Args:
+    file_name : str
+        Location of the inventory file.
+
+    Returns:
+    inventory : List
+        List of tuples in the format (ip address, router class).
+
+    Raises:
+    ValueError
+        If a line has an unknown router type.
+    """
+    inventory = []
+    with open(file_name, newline="", encoding="UTF-8") as inventory_file:
+        for line_number, row in enumerate(csv.reader(inventory_file), start=1):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+            router_type = row[1].strip().lower() if len(row) > 1 and row[1].strip() else "field"
+            if router_type not in ROUTER_TYPES:
+                raise ValueError(f"{file_name}, line {line_number}: unknown router type '{row[1].strip()}', "
+                                 f"the valid types are {', '.join(ROUTER_TYPES)}")
+            inventory.append((row[0].strip(), ROUTER_TYPES[router_type]))
+    return inventory
+
+def audit_router(ip_address, router_class, credentials, options):
+    """
+    This function audits a single router and returns its results.
+
+    Args:
+    ip_address : str
+        IP address of the router.
+    router_class : type
+        FieldRouter or CellRouter.
+    credentials : dict
+        Dictionary with the username and password.
+    options : dict
+        Options passed to the router class (config_snapshot, command_cache).
+
+    Returns:
+    status : str
+        "ok", or "error" if the checks could not be completed.
+    sections : dict
+        Result of every check, the output_dict of the router.
+    report : str
+        Result of the checks, or the error that stopped them.
+    facts : dict
+        Verdict and facts of every check, the fact_dict of the router.
+    """
+    router = router_class(ip_address, credentials, **options)
+    try:
+        with tracer.device(ip_address):
+            execute_router_commands(router)
+    except Exception as e:
+        error = f"The checks could not be completed: {e}\n"
+        return "error", {"error": error}, error, error_facts(error)
+    return "ok", router.output_dict, router.report_text(), router.fact_dict
+
+def audit_fleet(inventory, credentials, renderer, workers=32, options=None, scheduler=None, probe=None,
+                fact_run=None):
+    """
+    This function audits every router of the inventory using a pool of
+    workers and writes a consolidated report. The result of every router
+    is written as soon as its checks are completed.
+
+    Args:
+    inventory : List
+        List returned by read_inventory.
+    credentials : dict
+        Dictionary with the username and password.
+    renderer : ReportRenderer
+        Consolidated report, in every format requested.
+    workers : int
+        Number of routers checked at the same time.
+    options : dict
+        Options passed to the router classes (config_snapshot, command_cache).
+    scheduler : AdaptiveScheduler
+        If given, it dispatches the routers instead of a pool of workers.
+    probe : ReachabilityProbe
+        If given, the routers that don't answer on TCP/22 are reported
+        without trying to log in.
+    fact_run : FactRun
+        If given, the verdicts and facts of every router are recorded in the fact store.
+
+    Returns:
+    None
+    """
+    inventory = skip_unreachable(inventory, renderer, probe, fact_run)
+    with nullcontext() if scheduler else ThreadPoolExecutor(max_workers=workers) as pool:
+        if scheduler:
+            audits = {scheduler.submit(ip_address, audit_router, ip_address, router_class, credentials, options or {},
+                                       site_limit=CELL_SITE_LIMIT if router_class is CellRouter else None): ip_address
+                      for ip_address, router_class in inventory}
         else:
-            print("Invalid input. Please enter '1' or '2'.")
-
-    device_ip = input("Please enter the IP address of the router to check: ")
-    username = input("Please enter your username: ")
-    password = getpass("Please enter your password: ")
-    router_class = FieldRouter if router_type == '2' else CellRouter
-    router = router_class(device_ip, {"username": username, "password": password})
-    
-    execute_router_commands(router)
-    router.file_writer(username)
+            audits = {pool.submit(audit_router, ip_address, router_class, credentials, options or {}): ip_address
+                      for ip_address, router_class in inventory}
+        for completed, audit in enumerate(as_completed(audits), start=1):
+            status, sections, report, facts = audit.result()
+            renderer.write(audits[audit], sections, f"{'/' * 80}\n{audits[audit]}\n\n{report}\n", status)
+            if fact_run:
+                fact_run.record(audits[audit], facts)
+            print(f"{completed}/{len(audits)} routers checked", end="\r")
+    print()
+
+def skip_unreachable(inventory, renderer, probe=None, fact_run=None):
+    """
+    This function reports the routers that don't answer the TCP/22 probe
+    and returns the rest of the inventory.
+
+    Args:
+    inventory : List
+        List returned by read_inventory.
+    renderer : ReportRenderer
+        Consolidated report.
+    probe : ReachabilityProbe
+        If None, the inventory is returned as is.
+    fact_run : FactRun
+        If given, the unreachable routers are recorded in the fact store.
+
+    Returns:
+    inventory : List
+        Routers that answered the probe.
+    """
+    if not probe:
+        return inventory
+    _, unreachable = probe.probe([ip_address for ip_address, _ in inventory])
+    for ip_address in unreachable:
+        error = "The checks could not be completed: SSH (TCP/22) did not answer\n"
+        renderer.write(ip_address, {"error": error}, f"{'/' * 80}\n{ip_address}\n\n{error}\n", "error")
+        if fact_run:
+            fact_run.record(ip_address, error_facts(error))
+    return [(ip_address, router_class) for ip_address, router_class in inventory if ip_address not in unreachable]
+
+def audit_shard(shard, context):
+    """
+    This function audits a shard of the inventory in a worker process, or
+    on a worker node, and returns the results to the coordinator.
+
+    Args:
+    shard : List
+        List of [ip address, router type] pairs, the type is a key of ROUTER_TYPES.
+    context : dict
+        Credentials and options of the run, see shard_context.
+
+    Returns:
+    results : List
+        [ip address, status, sections, report, facts] of every router.
+    """
+    use_transport(context["transport"])
+    options = {"config_snapshot": context["config_snapshot"]}
+    if context["cache_mode"] != "live":
+        options["command_cache"] = CommandCache(mode=context["cache_mode"], ttl=context["cache_ttl"])
+    if context["reuse_compliance"]:
+        options["compliance_cache"] = ComplianceCache()
+    credentials = {"username": context["username"], "password": context["password"]}
+    with ThreadPoolExecutor(max_workers=context["workers"]) as pool:
+        audits = [pool.submit(audit_router, ip_address, ROUTER_TYPES[router_type], credentials, options)
+                  for ip_address, router_type in shard]
+        return [[ip_address, *audit.result()] for (ip_address, _), audit in zip(shard, audits)]
+
+def shard_context(args, username, password):
+    """
+    This function returns the context of audit_shard from the command line arguments.
+    """
+    return {"username": username, "password": password, "workers": args.workers, "transport": args.transport,
+            "config_snapshot": args.config_snapshot, "cache_mode": args.cache_mode, "cache_ttl": args.cache_ttl,
+            "reuse_compliance": args.reuse_compliance}
+
+def audit_sharded(inventory, renderer, runner, probe=None, fact_run=None):
+    """
+    This function audits the inventory in shards run by worker processes,
+    or by worker nodes, and merges their results in the consolidated report
+    as every shard is completed.
+
+    Args:
+    inventory : List
+        List returned by read_inventory.
+    renderer : ReportRenderer
+        Consolidated report, in every format requested.
+    runner : ShardRunner
+        Runner of audit_shard.
+    probe : ReachabilityProbe
+        If given, the routers that don't answer on TCP/22 are reported
+        without handing them to the workers.
+    fact_run : FactRun
+        If given, the verdicts and facts returned by the workers are
+        recorded in the fact store, by this process only.
+
+    The routers of a shard that failed are reported with an error, like a
+    router whose audit failed.
+
+    Returns:
+    None
+    """
+    router_types = {router_class: router_type for router_type, router_class in ROUTER_TYPES.items()}
+    inventory = skip_unreachable(inventory, renderer, probe, fact_run)
+    runner.submit([ip_address, router_types[router_class]] for ip_address, router_class in inventory)
+    completed = 0
+    for shard, results, error in runner.as_completed():
+        if error:
+            print(f"A shard of {len(shard)} routers failed: {error}")
+            error = f"The checks could not be completed: {error}\n"
+            results = [[ip_address, "error", {"error": error}, error, error_facts(error)] for ip_address, _ in shard]
+        for ip_address, status, sections, report, facts in results:
+            renderer.write(ip_address, sections, f"{'/' * 80}\n{ip_address}\n\n{report}\n", status)
+            if fact_run:
+                fact_run.record(ip_address, facts)
+        completed += len(results)
+        print(f"{completed}/{len(inventory)} routers checked", end="\r")
+    print()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Checks the configuration and status of field and cellular routers")
+    parser.add_argument("--inventory", help="file with one 'ip,type' line per router (type is field or cell), "
+                                            "all of them are checked and a consolidated report is written")
+    parser.add_argument("--workers", type=int, default=32, help="routers checked at the same time in fleet mode, "
+                                                                "the highest number with --adaptive")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="tune the number of routers checked at the same time from the login latency, "
+                             "timeouts and authentication failures, fairly across the sites (/24), "
+                             "not with sharded runs")
+    parser.add_argument("--site-limit", type=int, default=4,
+                        help="routers of the same site checked at the same time with --adaptive (default: 4)")
+    parser.add_argument("--aaa-limit", type=int, default=16,
+                        help="logins at the same time through the AAA server with --adaptive (default: 16)")
+    parser.add_argument("--shards", type=int, metavar="PROCESSES",
+                        help="in fleet mode, split the inventory in shards checked by this many processes, "
+                             "each one with --workers threads")
+    parser.add_argument("--spool", help="in fleet mode, hand the shards to the worker nodes of this shared folder "
+                                        "instead of local processes")
+    parser.add_argument("--worker", metavar="SPOOL",
+                        help="run as a worker node of the coordinator that uses this shared folder")
+    parser.add_argument("--shard-size", type=int, default=50, help="routers per shard (default: 50)")
+    parser.add_argument("--output", help="location of the consolidated .txt report of the fleet mode, "
+                                         "the other formats are written next to it")
+    parser.add_argument("--output-dir", help="folder of the reports, the desktop by default")
+    parser.add_argument("--formats", nargs="+", choices=list(RENDERERS), default=["txt"],
+                        help="report formats written as each router is checked (default: txt)")
+    parser.add_argument("--config-snapshot", action="store_true",
+                        help="fetch the running config once per router instead of one 'show run' per check")
+    parser.add_argument("--reuse-compliance", action="store_true",
+                        help="fetch the configuration digest first and reuse the stored config compliance results "
+                             "of the routers whose configuration did not change, the operational checks run live")
+    parser.add_argument("--facts", nargs="?", const=DEFAULT_STORE, metavar="DATABASE",
+                        help="record the verdict and facts of every check in a SQLite fact store "
+                             "(Common/facts.db by default), queried with Common/fact_store.py")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="live",
+                        help="record the command output, replay it offline, or use recent captures (auto)")
+    parser.add_argument("--cache-ttl", type=int, default=900,
+                        help="seconds a capture is reused in auto mode (default: 900)")
+    parser.add_argument("--no-probe", action="store_true",
+                        help="in fleet mode, log in to every router without probing TCP/22 first")
+    parser.add_argument("--probe-timeout", type=float, default=2,
+                        help="seconds the TCP/22 probe of a router waits (default: 2)")
+    parser.add_argument("--trace", help="write the timing spans to this JSON Lines file, "
+                                        "and the Prometheus metrics next to it (.prom)")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="netmiko",
+                        help="SSH transport, asyncssh drives many more sessions per process (default: netmiko)")
+    args = parser.parse_args()
+    #the site and AAA limits are kept by one process, the shards are checked by several
+    if args.adaptive and (args.shards or args.spool or args.worker):
+        parser.error("--adaptive can't be used with --shards, --spool or --worker")
+    use_transport(args.transport)
+    if args.trace:
+        tracer.enable(args.trace, str(Path(args.trace).with_suffix(".prom")))
+    options = {"config_snapshot": args.config_snapshot}
+    if args.cache_mode != "live":
+        options["command_cache"] = CommandCache(mode=args.cache_mode, ttl=args.cache_ttl)
+    if args.reuse_compliance:
+        options["compliance_cache"] = ComplianceCache()
+
+    if args.worker:
+        username = input("Please enter your username: ")
+        password = getpass("Please enter your password: ")
+        print(f"Waiting for shards in {args.worker}")
+        shards = serve_shards(args.worker, audit_shard, shard_context(args, username, password))
+        print(f"{shards} shards checked")
+    elif args.inventory:
+        inventory = read_inventory(args.inventory)
+        username = input("Please enter your username: ")
+        password = getpass("Please enter your password: ")
+        output = Path(args.output or Path(args.output_dir or f"C:\\Users\\{username}\\Desktop") / "router_fleet_review.txt")
+        scheduler_context = (AdaptiveScheduler(max_workers=args.workers, initial_workers=min(args.workers, 8),
+                                               default_site_limit=args.site_limit, aaa_limit=args.aaa_limit)
+                             if args.adaptive else nullcontext())
+        fact_context = FactRun("router_checks", args.facts) if args.facts else nullcontext()
+        with ReportRenderer(output.parent, output.stem, args.formats) as renderer, scheduler_context as scheduler, \
+             fact_context as fact_run:
+            #the replayed runs don't connect to the routers
+            probe = None if args.no_probe or args.cache_mode == "replay" else ReachabilityProbe(timeout=args.probe_timeout)
+            if args.shards or args.spool:
+                #the workers of a spool ask for their own credentials, they are not written to the shared folder
+                with ShardRunner(audit_shard, shard_context(args, username, password), processes=args.shards,
+                                 spool=args.spool, shard_size=args.shard_size) as runner:
+                    audit_sharded(inventory, renderer, runner, probe, fact_run)
+            else:
+                audit_fleet(inventory, {"username": username, "password": password}, renderer, args.workers,
+                            options, scheduler, probe, fact_run)
+    else:
+        #Prompt the user for router information
+        while True:
+            router_type = input("""
+            Please choose the type of router to check:
+            1. Cellular Router
+            2. Field Router
+            Enter the number corresponding to your choice: """)
+            if router_type in ('1', '2'):
+                break
+            else:
+                print("Invalid input. Please enter '1' or '2'.")
+
+        device_ip = input("Please enter the IP address of the router to check: ")
+        username = input("Please enter your username: ")
+        password = getpass("Please enter your password: ")
+        router_class = FieldRouter if router_type == '2' else CellRouter
+        router = router_class(device_ip, {"username": username, "password": password}, **options)
+
+        with tracer.device(device_ip):
+            execute_router_commands(router)
+            router.file_writer(username, args.output_dir, args.formats)
+        if args.facts:
+            with FactRun("router_checks", args.facts) as fact_run:
+                fact_run.record(device_ip, router.fact_dict)
+    if args.trace:
+        tracer.close()
+        print(tracer.summary())
@@ -0,0 +1,89 @@
+from re import search
+
+class RunningConfig:
+    """
+    Local index of a router's running configuration. The configuration is
+    fetched once with "show running-config", split into a section tree
+    (every top level line with its indented children), and the "show run"
+    commands used by the validators are answered from it, so the router
+    does not have to regenerate its whole configuration for each of them.
+    """
+
+    def __init__(self, config_text):
+        """
+        Parameters
+        ----------
+        config_text : str
+            Output of the "show running-config" command.
+        """
+        self.lines = []
+        self.sections = {}
+        current_section = None
+        for line in config_text.splitlines():
+            if not line.strip() or line.startswith("!"):
+                continue
+            self.lines.append(line)
+            if line[0] != " ":
+                current_section = [line]
+                self.sections[line.strip()] = current_section
+            elif current_section is not None:
+                current_section.append(line)
+
+
+    def include(self, pattern):
+        """
+        This function returns the lines that match a regular expression,
+        the same as "show running-config | include [pattern]".
+
+        Parameters
+        ----------
+        pattern : str
+            Regular expression the lines must match.
+
+        Returns
+        -------
+        matching_lines : str
+            Matching lines separated by new lines.
+        """
+        return "\n".join(line for line in self.lines if search(pattern, line))
+
+
+    def section(self, header):
+        """
+        This function returns a top level section, e.g. "interface Vlan1",
+        with all its children, as "show running-config [header]" does.
+
+        Parameters
+        ----------
+        header : str
+            First line of the section.
+
+        Returns
+        -------
+        section_text : str
+            Lines of the section, an empty string if the section does not exist.
+        """
+        return "\n".join(self.sections.get(header.strip(), []))
+
+
+    def answer(self, command):
+        """
+        This function returns the output of a "show run" command
+        computed from the snapshot.
+
+        Parameters
+        ----------
+        command : str
+            "show run | i [pattern]" or "show run [section header]".
+
+        Returns
+        -------
+        output : str
+            Output of the command.
+        """
+        command = command.strip()
+        if "|" in command:
+            _, modifier = command.split("|", 1)
+            _, pattern = modifier.strip().split(" ", 1)
+            return self.include(pattern.strip())
+        return self.section(command.split(" ", 2)[2])
@@ -0,0 +1,10 @@
+"""
+The tests import the shared modules the same way the scripts do.
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+#modules shared by the different network projects, the scripts under test and the simulated device farm
+for folder in ("Common", "ACL project", "Router Checks", "Benchmarks"):
+    sys.path.append(str(ROOT / folder))
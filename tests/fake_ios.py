@@ -0,0 +1,137 @@
+"""
+Local asyncssh server that emulates the prompts of an IOS device, used to test
+the asyncssh transport without a real device.
+
+    router1>                exec mode, if privileged is False
+    router1#                privileged exec mode
+    router1(config)#        after "configure terminal"
+    router1(config-if)#     after "interface ..." in configuration mode
+
+Every command received is recorded with the mode it was received in.
+"""
+import asyncio
+import asyncssh
+
+SHOW_VERSION = ("Cisco IOS XE Software, Version 16.09.04\n"
+                "router1 uptime is 1 week, 2 days, 3 hours, 4 minutes\n"
+                "cisco ISR4331/K9 (1RU) processor with 1795999K/6147K bytes of memory.")
+INVALID_INPUT = "% Invalid input detected at '^' marker."
+PROMPTS = {"exec": ">", "privileged": "#", "config": "(config)#", "config-if": "(config-if)#"}
+
+class FakeIos:
+    def __init__(self, hostname="router1", username="admin", password="secret", privileged=True, prompt=True):
+        """
+        Parameters
+        ----------
+        hostname : str
+            Name shown in the prompt.
+        username : str
+        password : str
+            Only credentials accepted.
+        privileged : bool
+            If False, the session starts in exec mode (router1>).
+        prompt : bool
+            If False, the device never shows a prompt after the login.
+        """
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.privileged = privileged
+        self.prompt = prompt
+        #[(command, mode it was received in)]
+        self.commands = []
+        self.open_connections = 0
+        self.server = None
+        self.host = None
+        self.port = None
+
+    async def start(self, host="127.0.0.1", host_key=None):
+        self.server = await asyncssh.create_server(
+            lambda: FakeIosServer(self), host, 0, server_host_keys=[host_key or generate_host_key()],
+            process_factory=self.session, line_editor=False)
+        self.host = host
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def handler(self, **options):
+        """
+        This function returns the netmiko connection parameters of the device.
+        """
+        return {"device_type": "cisco_ios", "host": self.host, "port": self.port, "username": self.username,
+                "password": self.password, **options}
+
+
+    async def session(self, process):
+        mode = "privileged" if self.privileged else "exec"
+        #the terminal of the session turns every \n into \r\n
+        process.stdout.write("\n\nUser Access Verification\n\n")
+        if self.prompt:
+            process.stdout.write(f"{self.hostname}{PROMPTS[mode]}")
+        try:
+            while True:
+                line = await process.stdin.readline()
+                if not line:
+                    break
+                command = line.strip()
+                self.commands.append((command, mode))
+                output, mode = await self.respond(command, mode)
+                output = f"{output}\n" if output else ""
+                process.stdout.write(f"{command}\n{output}{self.hostname}{PROMPTS[mode]}")
+        except (asyncssh.Error, ConnectionError):
+            pass
+        finally:
+            process.exit(0)
+
+    async def respond(self, command, mode):
+        """
+        This function returns the output of a command and the mode the device is left in.
+        """
+        if mode in ("config", "config-if"):
+            if command == "end":
+                return "", "privileged"
+            if command == "exit":
+                return "", "config" if mode == "config-if" else "privileged"
+            if command.startswith("interface "):
+                return "", "config-if"
+            return "", mode
+        if command.startswith("terminal "):
+            return "", mode
+        if command == "show version":
+            return SHOW_VERSION, mode
+        if command == "show slow":
+            #never answers within the timeouts of the tests
+            await asyncio.sleep(30)
+            return "", mode
+        if command == "configure terminal" and mode == "privileged":
+            return "Enter configuration commands, one per line.  End with CNTL/Z.", "config"
+        if command == "write mem" and mode == "privileged":
+            return "Building configuration...\n[OK]", mode
+        return INVALID_INPUT, mode
+
+
+class FakeIosServer(asyncssh.SSHServer):
+    def __init__(self, device):
+        self.device = device
+
+    def connection_made(self, connection):
+        self.device.open_connections += 1
+
+    def connection_lost(self, exc):
+        self.device.open_connections -= 1
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return username == self.device.username and password == self.device.password
+
+
+def generate_host_key():
+    return asyncssh.generate_private_key("ssh-ed25519")
@@ -0,0 +1,116 @@
+"""
+Tests of the ACL plans against parsed "show ip access-lists" output.
+"""
+import pytest
+
+pytest.importorskip("ntc_templates")
+from acl_planner import AclPlanner, format_plan
+from parser_registry import registry
+
+RW_FILE = """no ip access-list standard SNMP_RW
+IP access-list Standard SNMP_RW
+permit 10.85.23.25
+permit 10.93.1.56
+permit 10.95.1.3
+deny any
+wr mem
+"""
+MANY_HOSTS = [f"10.20.0.{number}" for number in range(1, 13)]
+
+def parse(output):
+    return registry.parse_textfsm(output, "cisco_ios", "show ip access-lists")
+
+
+@pytest.fixture
+def planner(tmp_path):
+    config_file = tmp_path / "rw.txt"
+    config_file.write_text(RW_FILE, encoding="UTF-8")
+    return AclPlanner(config_file)
+
+
+@pytest.fixture
+def many_hosts_planner(tmp_path):
+    config_file = tmp_path / "rw.txt"
+    config_file.write_text("IP access-list Standard SNMP_RW\n" + "".join(f"permit {host}\n" for host in MANY_HOSTS) +
+                           "deny any\nwrite mem\n", encoding="UTF-8")
+    return AclPlanner(config_file)
+
+
+def test_missing_host_is_inserted_before_the_deny(planner):
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit 10.85.23.25\n"
+                 "    20 permit 10.93.1.56\n"
+                 "    30 deny   any\n")
+    assert planner.plan(aces) == {"SNMP_RW": ["ip access-list standard SNMP_RW", "25 permit 10.95.1.3"]}
+
+
+def test_compliant_acl_has_no_plan(planner):
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit 10.80.0.0, wildcard bits 0.15.255.255\n"
+                 "    20 permit 10.95.1.3\n"
+                 "    30 deny   any\n")
+    assert planner.plan(aces) == {}
+    assert format_plan("10.1.1.1", {}) == "10.1.1.1: no changes needed"
+
+
+def test_absent_acl_is_created(planner):
+    aces = parse("Standard IP access list SNMP_RO\n"
+                 "    10 permit 10.85.23.25\n")
+    assert planner.plan(aces) == {"SNMP_RW": ["ip access-list standard SNMP_RW", "permit 10.85.23.25",
+                                              "permit 10.93.1.56", "permit 10.95.1.3", "deny any"]}
+
+
+def test_hosts_are_appended_to_an_acl_without_deny(planner):
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit 10.93.1.56\n"
+                 "    20 permit 10.1.1.1\n")
+    assert planner.plan(aces) == {"SNMP_RW": ["ip access-list standard SNMP_RW", "30 permit 10.85.23.25",
+                                              "40 permit 10.95.1.3"]}
+
+
+def test_hosts_share_the_gap_before_the_deny(many_hosts_planner):
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit 10.20.0.1\n"
+                 "    1000 deny   any\n")
+    lines = many_hosts_planner.plan(aces)["SNMP_RW"]
+    assert lines[0] == "ip access-list standard SNMP_RW"
+    assert lines[1:] == [f"{20 + 10 * position} permit {host}" for position, host in enumerate(MANY_HOSTS[1:])]
+
+
+def test_acl_without_room_is_resequenced(many_hosts_planner):
+    #the standard spacing of 10 has no room for 11 hosts
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit 10.20.0.1\n"
+                 "    20 deny   any\n"
+                 "    30 permit 10.30.0.1\n")
+    lines = many_hosts_planner.plan(aces)["SNMP_RW"]
+    #the entries become 120, 240 (deny) and 360
+    assert lines[:2] == ["ip access-list resequence SNMP_RW 120 120", "ip access-list standard SNMP_RW"]
+    sequences = [int(line.split()[0]) for line in lines[2:]]
+    assert [line.split()[-1] for line in lines[2:]] == MANY_HOSTS[1:]
+    assert sequences == sorted(sequences) and 120 < sequences[0] and sequences[-1] < 240
+
+
+def test_deny_first_is_resequenced(many_hosts_planner):
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    5 deny   any\n")
+    lines = many_hosts_planner.plan(aces)["SNMP_RW"]
+    #12 hosts before the deny, that becomes 130
+    assert lines[0] == "ip access-list resequence SNMP_RW 130 130"
+    assert lines[2] == "10 permit 10.20.0.1" and lines[-1] == "120 permit 10.20.0.12"
+
+
+def test_acl_without_line_numbers_replays_the_file(planner):
+    #other templates and platforms don't report the sequence numbers
+    aces = [{"acl_name": "SNMP_RW", "action": "permit", "src_host": "10.85.23.25"},
+            {"acl_name": "SNMP_RW", "action": "deny", "src_any": "any"}]
+    assert planner.plan(aces) == {"SNMP_RW": ["no ip access-list standard SNMP_RW", "IP access-list Standard SNMP_RW",
+                                              "permit 10.85.23.25", "permit 10.93.1.56", "permit 10.95.1.3",
+                                              "deny any"]}
+
+
+def test_write_lines_are_left_out_of_the_replay(many_hosts_planner):
+    aces = [{"acl_name": "SNMP_RW", "action": "deny", "src_any": "any", "line_num": ""}]
+    lines = many_hosts_planner.plan(aces)["SNMP_RW"]
+    assert lines[-1] == "deny any"
+    assert not [line for line in lines if line.split()[0].lower() in ("write", "wr")]
@@ -0,0 +1,70 @@
+"""
+Tests of the SNMP ACL policy against parsed "show ip access-lists" output.
+"""
+import pytest
+
+pytest.importorskip("ntc_templates")
+from acl_policy import AclPolicy
+from parser_registry import registry
+
+POLICY = {"SNMP_RW": ["10.85.23.25", "10.93.1.56", "10.95.1.3"], "SNMP_RO": ["10.85.23.25", "10.93.1.56"]}
+
+def parse(output):
+    return registry.parse_textfsm(output, "cisco_ios", "show ip access-lists")
+
+
+def test_missing_hosts_keep_the_order_of_the_policy():
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit 10.93.1.56\n"
+                 "    20 deny   any\n")
+    missing = AclPolicy(POLICY).missing_sources(aces)
+    assert missing["SNMP_RW"] == ["10.85.23.25", "10.95.1.3"]
+
+
+def test_prefix_wildcard_covers_the_hosts_of_the_network():
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit 10.84.0.0, wildcard bits 0.3.255.255\n"
+                 "    20 permit 10.95.1.3\n"
+                 "    30 deny   any\n")
+    assert AclPolicy(POLICY).missing_sources(aces)["SNMP_RW"] == ["10.93.1.56"]
+
+
+def test_non_contiguous_wildcard_covers_the_matching_hosts():
+    #10.x.1.56 for any x
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit 10.0.1.56, wildcard bits 0.255.0.0\n"
+                 "    20 deny   any\n")
+    assert AclPolicy(POLICY).missing_sources(aces)["SNMP_RW"] == ["10.85.23.25", "10.95.1.3"]
+
+
+def test_permit_any_covers_every_host():
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit any\n")
+    assert AclPolicy(POLICY).missing_sources(aces)["SNMP_RW"] == []
+
+
+def test_deny_entries_cover_nothing():
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 deny   10.85.23.25\n"
+                 "    20 permit 10.93.1.56\n"
+                 "    30 deny   any\n")
+    assert AclPolicy(POLICY).missing_sources(aces)["SNMP_RW"] == ["10.85.23.25", "10.95.1.3"]
+
+
+def test_absent_acl_misses_every_host():
+    aces = parse("Standard IP access list SNMP_RW\n"
+                 "    10 permit any\n")
+    assert AclPolicy(POLICY).missing_sources(aces)["SNMP_RO"] == POLICY["SNMP_RO"]
+
+
+def test_policy_from_config_files(tmp_path):
+    config_file = tmp_path / "rw.txt"
+    config_file.write_text("no ip access-list standard SNMP_RW\n"
+                           "IP access-list Standard SNMP_RW\n"
+                           "permit 10.85.23.25\n"
+                           "permit 10.93.1.56 \n"
+                           "permit 10.85.23.25\n"
+                           "deny any\n"
+                           "wr mem\n", encoding="UTF-8")
+    policy = AclPolicy.from_config_files(config_file)
+    assert policy.required_sources == {"SNMP_RW": ["10.85.23.25", "10.93.1.56"]}
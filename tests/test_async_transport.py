@@ -0,0 +1,122 @@
+"""
+Tests of the asyncssh transport against a local server with IOS prompts.
+"""
+import asyncio
+import socket
+import pytest
+
+pytest.importorskip("asyncssh")
+from netmiko.exceptions import NetMikoAuthenticationException, NetmikoTimeoutException
+from async_transport import AsyncSshConnection, IosShell, collect, run
+from fake_ios import SHOW_VERSION, FakeIos, generate_host_key
+
+@pytest.fixture
+def device():
+    device = run(FakeIos().start())
+    yield device
+    run(device.stop())
+
+
+def unused_port():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+
+@pytest.mark.parametrize("privileged", [True, False])
+def test_connect_detects_the_prompt_and_sets_the_terminal(privileged):
+    device = run(FakeIos(privileged=privileged).start())
+    try:
+        connection = AsyncSshConnection(device.handler())
+        assert connection.shell.base_prompt == "router1"
+        mode = "privileged" if privileged else "exec"
+        assert device.commands == [("terminal length 0", mode), ("terminal width 511", mode)]
+        connection.disconnect()
+    finally:
+        run(device.stop())
+
+
+def test_send_command_strips_the_echo_and_the_prompt(device):
+    connection = AsyncSshConnection(device.handler())
+    assert connection.send_command("show version") == SHOW_VERSION
+    assert connection.send_command("terminal length 0") == ""
+    connection.disconnect()
+
+
+def test_send_config_set_enters_and_leaves_configuration_mode(device):
+    connection = AsyncSshConnection(device.handler())
+    output = connection.send_config_set(["interface Tunnel1", "description to hub", "exit", "ip route 0.0.0.0 0.0.0.0 Null0"])
+    assert "Enter configuration commands" in output
+    assert device.commands[2:] == [
+        ("configure terminal", "privileged"),
+        ("interface Tunnel1", "config"),
+        ("description to hub", "config-if"),
+        ("exit", "config-if"),
+        ("ip route 0.0.0.0 0.0.0.0 Null0", "config"),
+        ("end", "config")]
+    #the session is back in privileged exec mode
+    assert connection.send_command("show version") == SHOW_VERSION
+    assert device.commands[-1] == ("show version", "privileged")
+    connection.disconnect()
+
+
+def test_save_config(device):
+    connection = AsyncSshConnection(device.handler())
+    assert connection.save_config() == "Building configuration...\n[OK]"
+    connection.disconnect()
+
+
+def test_read_timeout_raises_netmiko_timeout(device):
+    connection = AsyncSshConnection(device.handler(read_timeout_override=0.5))
+    with pytest.raises(NetmikoTimeoutException, match="Pattern not detected"):
+        connection.send_command("show slow")
+    connection.disconnect()
+
+
+def test_refused_connection_raises_netmiko_timeout():
+    handler = {"host": "127.0.0.1", "port": unused_port(), "username": "admin", "password": "secret"}
+    with pytest.raises(NetmikoTimeoutException, match="TCP connection to device failed"):
+        AsyncSshConnection(handler)
+
+
+def test_wrong_password_raises_netmiko_authentication(device):
+    with pytest.raises(NetMikoAuthenticationException):
+        AsyncSshConnection(device.handler(password="wrong"))
+
+
+def test_missing_prompt_raises_netmiko_timeout_and_closes_the_session():
+    device = run(FakeIos(prompt=False).start())
+    try:
+        with pytest.raises(NetmikoTimeoutException, match="No prompt|Pattern not detected"):
+            AsyncSshConnection(device.handler(read_timeout_override=0.5))
+        run(asyncio.sleep(0.2))
+        assert device.open_connections == 0
+    finally:
+        run(device.stop())
+
+
+def test_collect_runs_the_commands_on_many_devices():
+    host_key = generate_host_key()
+    devices = [run(FakeIos(hostname=f"router{number}").start(f"127.0.0.{number + 1}", host_key))
+               for number in range(1, 21)]
+    unreachable = {"host": "127.0.0.1", "port": unused_port(), "username": "admin", "password": "secret"}
+    try:
+        results = run(collect([device.handler() for device in devices] + [unreachable], ["show version"], limit=5))
+        assert len(results) == 21
+        for device in devices:
+            assert results[device.host] == {"show version": SHOW_VERSION}
+            assert device.open_connections == 0
+        assert isinstance(results["127.0.0.1"], NetmikoTimeoutException)
+    finally:
+        for device in devices:
+            run(device.stop())
+
+
+def test_shell_can_be_used_in_an_event_loop(device):
+    async def show_version():
+        shell = await IosShell(device.handler()).connect()
+        try:
+            return await shell.send_command("show version")
+        finally:
+            await shell.close()
+    assert run(show_version()) == SHOW_VERSION
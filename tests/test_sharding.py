@@ -0,0 +1,143 @@
+"""
+Tests of the sharded Router Checks audit, run by a local process pool and by
+a spool worker against the simulated device farm.
+"""
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+from pathlib import Path
+from time import sleep
+import pytest
+
+pytest.importorskip("napalm")
+import device_session
+from device_farm import DeviceFarm
+from report_renderer import ReportRenderer
+from sharding import ShardRunner, serve_shards
+
+ROOT = Path(__file__).resolve().parents[1]
+CONTEXT = {"username": "test", "password": "test", "workers": 4, "transport": "netmiko", "config_snapshot": False,
+           "cache_mode": "live", "cache_ttl": 0, "reuse_compliance": False}
+
+def load_checks_main():
+    #the ACL project also has a main.py, the module is registered under its own name for the worker processes
+    spec = importlib.util.spec_from_file_location("router_checks_main", ROOT / "Router Checks" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["router_checks_main"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+checks_main = load_checks_main()
+
+def failing_shard(shard, context):
+    raise RuntimeError("the worker ran out of memory")
+
+
+def slow_shard(shard, context):
+    #every run of the shard leaves a file, a shard run twice would be seen
+    with open(Path(context["runs"]) / f"{shard[0]}-{os.getpid()}", "w"):
+        pass
+    sleep(context["seconds"])
+    return shard
+
+
+@pytest.fixture
+def forked():
+    #the workers are forked so they use the same farm and the tasks of this module
+    if multiprocessing.get_start_method() != "fork":
+        pytest.skip("the worker processes are not forked")
+
+
+@pytest.fixture
+def farm(forked, monkeypatch):
+    farm = DeviceFarm(24, main_routers=0, latency=0, jitter=0, roles=("field", "cell"))
+    monkeypatch.setattr(device_session, "ConnectHandler", farm.connect)
+    return farm
+
+
+def audit(farm, folder, runner):
+    """
+    This function audits the farm with the runner and returns the entries of the consolidated report.
+    """
+    inventory = [(ip, checks_main.ROUTER_TYPES[device.role]) for ip, device in farm.devices.items()]
+    with ReportRenderer(folder, "report", ("jsonl",)) as renderer:
+        checks_main.audit_sharded(inventory, renderer, runner)
+    with open(Path(folder) / "report.jsonl", encoding="UTF-8") as report:
+        return {entry["device"]: entry for entry in map(json.loads, report)}
+
+
+def test_local_pool_reports_every_router(farm, tmp_path):
+    with ShardRunner(checks_main.audit_shard, CONTEXT, processes=3, shard_size=5) as runner:
+        report = audit(farm, tmp_path, runner)
+    assert set(report) == set(farm.devices)
+    assert {entry["status"] for entry in report.values()} == {"ok"}
+
+
+def test_spool_worker_reports_every_router(farm, tmp_path):
+    spool = tmp_path / "spool"
+    worker = multiprocessing.Process(target=serve_shards, args=(spool, checks_main.audit_shard, CONTEXT, 0.05))
+    worker.start()
+    try:
+        with ShardRunner(checks_main.audit_shard, spool=spool, shard_size=5, poll_interval=0.05) as runner:
+            report = audit(farm, tmp_path, runner)
+    finally:
+        worker.join(30)
+    assert worker.exitcode == 0
+    assert set(report) == set(farm.devices)
+    assert {entry["status"] for entry in report.values()} == {"ok"}
+
+
+def test_failed_shards_report_their_routers(farm, tmp_path):
+    spool = tmp_path / "spool"
+    worker = multiprocessing.Process(target=serve_shards, args=(spool, failing_shard, CONTEXT, 0.05))
+    worker.start()
+    try:
+        with ShardRunner(failing_shard, spool=spool, shard_size=5, poll_interval=0.05) as runner:
+            report = audit(farm, tmp_path, runner)
+    finally:
+        worker.join(30)
+    assert set(report) == set(farm.devices)
+    for entry in report.values():
+        assert entry["status"] == "error"
+        assert "the worker ran out of memory" in entry["sections"]["error"]
+
+
+def test_failed_pool_shards_report_their_routers(farm, tmp_path):
+    with ShardRunner(failing_shard, processes=2, shard_size=5) as runner:
+        report = audit(farm, tmp_path, runner)
+    assert set(report) == set(farm.devices)
+    assert {entry["status"] for entry in report.values()} == {"error"}
+
+
+def test_running_shards_keep_their_claim(forked, tmp_path):
+    spool = tmp_path / "spool"
+    runs = tmp_path / "runs"
+    runs.mkdir()
+    context = {"runs": str(runs), "seconds": 1.5}
+    workers = [multiprocessing.Process(target=serve_shards, args=(spool, slow_shard, context, 0.05, 0.1))
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    try:
+        #the claims are older than the timeout long before the shard is done, unless they are refreshed
+        with ShardRunner(slow_shard, spool=spool, shard_size=1, poll_interval=0.05, claim_timeout=0.5) as runner:
+            runner.submit(["shard"])
+            completed = list(runner.as_completed())
+    finally:
+        for worker in workers:
+            worker.join(30)
+    assert completed == [(["shard"], ["shard"], None)]
+    assert len(list(runs.iterdir())) == 1
+    assert not [job for folder in ("jobs", "claimed", "results") for job in (spool / folder).iterdir()]
+
+
+def test_workers_stop_before_claiming(tmp_path):
+    spool = tmp_path / "spool"
+    runner = ShardRunner(slow_shard, spool=spool)
+    runner.submit(["shard"])
+    runner.close()
+    assert serve_shards(spool, slow_shard, {"runs": str(tmp_path), "seconds": 0}) == 0
+    assert len(list((spool / "jobs").iterdir())) == 1